@@ -0,0 +1,280 @@
+"""
+Per-session stats aggregates maintained at insert time.
+
+Every insert path folds its detections into one `SessionAggregate` row per
+(session, capture type), so the report endpoints read a handful of rows
+instead of re-scanning `emotion_detections` on every dashboard poll.
+Attendance is the larger of the busiest-frame face count and the identity
+estimate from attendance.PersonCounter.
+"""
+from sqlalchemy import case, delete, func, update
+from sqlalchemy.exc import IntegrityError
+
+import models, cache_utils
+from attendance import ATTENDANCE_MIN_FRAMES
+
+ENTRY_TYPES = ('entry', 'video')
+EXIT_TYPES = ('exit',)
+
+COUNT_COLUMNS = {label: f"count_{label.lower()}" for label in models.EMOTION_LABELS}
+
+_IN_CHUNK = 500  # keep IN (...) lists under SQLite's bound-parameter limit
+
+
+def _ensure_row(db, session_id: str, capture_type: str) -> None:
+    """Create the aggregate row on first use."""
+    A = models.SessionAggregate
+    exists = db.query(A.id).filter(A.session_id == session_id, A.type == capture_type).first()
+    if exists:
+        return
+    # Two writers may race to create the row; the unique constraint decides.
+    try:
+        with db.begin_nested():
+            db.add(A(session_id=session_id, type=capture_type, total=0, max_faces=0, last_timestamp_faces=0, persons=0,
+                     **{col: 0 for col in COUNT_COLUMNS.values()}))
+    except IntegrityError:
+        pass
+
+
+def _segments(frames) -> list:
+    """Collapse (timestamp, results) frames into [(timestamp, faces)] runs."""
+    segments = []
+    for timestamp, results in frames:
+        faces = sum(1 for r in results if r.get('emotion'))
+        if not faces:
+            continue
+        if segments and segments[-1][0] == timestamp:
+            segments[-1][1] += faces
+        else:
+            segments.append([timestamp, faces])
+    return segments
+
+
+def record_frames(db, session_id: str, capture_type: str, frames, persons: int = None) -> None:
+    """Fold a batch of frames into the session aggregate.
+    `frames` is a list of (timestamp, results) in capture order; `persons` is
+    the stream's running PersonCounter estimate, if it has one. Issues one
+    atomic UPDATE so concurrent writers never lose increments. Does not commit,
+    so the aggregate lands in the same transaction as the raw rows.
+    """
+    segments = _segments(frames)
+    if not segments:
+        return
+
+    counts = {}
+    for _, results in frames:
+        for r in results:
+            if r.get('emotion') in COUNT_COLUMNS:
+                counts[r['emotion']] = counts.get(r['emotion'], 0) + 1
+
+    _ensure_row(db, session_id, capture_type)
+    A = models.SessionAggregate
+
+    # Attendance = busiest timestamp. Frames arrive in time order, so a running
+    # count for the latest timestamp is enough: the first run may continue the
+    # stored one, the others are complete on their own.
+    first_ts, first_faces = segments[0]
+    first_run = case((A.last_timestamp == first_ts, A.last_timestamp_faces + first_faces), else_=first_faces)
+    inner_max = max((faces for _, faces in segments[1:]), default=0)
+    last_ts, last_faces = segments[-1]
+    new_max = case(
+        (first_run >= A.max_faces, case((first_run >= inner_max, first_run), else_=inner_max)),
+        else_=case((A.max_faces >= inner_max, A.max_faces), else_=inner_max),
+    )
+
+    values = {
+        "total": A.total + sum(counts.values()),
+        "max_faces": new_max,
+        "last_timestamp": last_ts,
+        "last_timestamp_faces": first_run if len(segments) == 1 else last_faces,
+    }
+    if persons:
+        # Streams cannot be merged (track ids restart), so keep the best one
+        values["persons"] = case((A.persons >= persons, A.persons), else_=persons)
+    for label, n in counts.items():
+        column = getattr(A, COUNT_COLUMNS[label])
+        values[COUNT_COLUMNS[label]] = column + n
+
+    db.execute(
+        update(A).where(A.session_id == session_id, A.type == capture_type).values(**values),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def _row_counts(row) -> dict:
+    return {label: getattr(row, col) for label, col in COUNT_COLUMNS.items() if getattr(row, col)}
+
+
+def load(db, session_id: str) -> dict:
+    """Return {capture_type: (counts, attendance)} for one session."""
+    return load_many(db, [session_id]).get(session_id, {})
+
+
+def load_many(db, session_ids=None) -> dict:
+    """Return {session_id: {capture_type: (counts, attendance)}}, a few queries per 500 sessions.
+    `session_ids=None` loads every session. Sessions without aggregate rows
+    (not yet backfilled) are computed with grouped SQL over `emotion_detections`.
+    """
+    A = models.SessionAggregate
+    columns = [A.session_id, A.type, A.max_faces, A.persons] + [getattr(A, col) for col in COUNT_COLUMNS.values()]
+    if session_ids is None:
+        queries = [db.query(*columns)]
+    else:
+        chunks = [session_ids[i:i + _IN_CHUNK] for i in range(0, len(session_ids), _IN_CHUNK)]
+        queries = [db.query(*columns).filter(A.session_id.in_(chunk)) for chunk in chunks]
+
+    result = {}
+    for query in queries:
+        for row in query:
+            result.setdefault(row.session_id, {})[row.type] = (_row_counts(row), max(row.max_faces or 0, row.persons or 0))
+
+    if session_ids is not None:
+        missing = [sid for sid in session_ids if sid not in result]
+        for i in range(0, len(missing), _IN_CHUNK):
+            result.update(_grouped_from_raw(db, missing[i:i + _IN_CHUNK]))
+    return result
+
+
+def _tracked_persons(db, E, filters, *keys):
+    """(*keys, persons) rows: track ids seen in at least ATTENDANCE_MIN_FRAMES frames.
+    Rows do not record which stream a track came from, so ids from separate
+    streams of one type collapse together, which approximates their maximum.
+    """
+    per_person = (
+        db.query(*keys)
+        .filter(*filters, E.person_id >= 0)
+        .group_by(*keys, E.person_id)
+        .having(func.count() >= ATTENDANCE_MIN_FRAMES)
+        .subquery()
+    )
+    columns = [per_person.c[key.key] for key in keys]
+    return db.query(*columns, func.count()).group_by(*columns)
+
+
+def _grouped_from_raw(db, session_ids) -> dict:
+    """Grouped-SQL equivalent of the aggregates, straight from `emotion_detections`."""
+    E = models.EmotionData
+    filters = (E.session_id.in_(session_ids), E.emotion.isnot(None))
+    result = {}
+
+    per_emotion = db.query(E.session_id, E.type, E.emotion, func.count()).filter(*filters).group_by(E.session_id, E.type, E.emotion)
+    for sid, type_code, emotion_code, n in per_emotion:
+        counts, _ = result.setdefault(sid, {}).setdefault(models.CAPTURE_TYPES[type_code], ({}, 0))
+        counts[models.EMOTION_LABELS[emotion_code]] = n
+
+    per_ts = (
+        db.query(E.session_id, E.type, func.count().label("faces"))
+        .filter(*filters)
+        .group_by(E.session_id, E.type, E.timestamp_us)
+        .subquery()
+    )
+    busiest = db.query(per_ts.c.session_id, per_ts.c.type, func.max(per_ts.c.faces)).group_by(per_ts.c.session_id, per_ts.c.type)
+    for sid, type_code, max_faces in busiest:
+        capture_type = models.CAPTURE_TYPES[type_code]
+        counts, _ = result[sid][capture_type]
+        result[sid][capture_type] = (counts, max_faces or 0)
+
+    for sid, type_code, persons in _tracked_persons(db, E, filters, E.session_id, E.type):
+        capture_type = models.CAPTURE_TYPES[type_code]
+        counts, attendance = result[sid][capture_type]
+        result[sid][capture_type] = (counts, max(attendance, persons))
+    return result
+
+
+def combine(rows: dict, types) -> tuple:
+    """Merge aggregates of several capture types into (counts, attendance)."""
+    counts = {}
+    attendance = 0
+    for t in types:
+        if t not in rows:
+            continue
+        type_counts, type_attendance = rows[t]
+        for emotion, n in type_counts.items():
+            counts[emotion] = counts.get(emotion, 0) + n
+        attendance = max(attendance, type_attendance)
+    return counts, attendance
+
+
+def rebuild(db, session_id: str) -> None:
+    """Recompute a session's aggregates from its raw `emotion_detections` rows."""
+    A = models.SessionAggregate
+    E = models.EmotionData
+    has_emotion = (E.session_id == session_id, E.emotion.isnot(None))
+
+    cache_utils.mark_written(db, session_id)
+    db.query(A).filter(A.session_id == session_id).delete()
+
+    rows = {}
+
+    def _row(type_code):
+        capture_type = models.CAPTURE_TYPES[type_code]
+        if capture_type not in rows:
+            rows[capture_type] = A(session_id=session_id, type=capture_type, total=0, max_faces=0, last_timestamp_faces=0,
+                                   persons=0, **{col: 0 for col in COUNT_COLUMNS.values()})
+        return rows[capture_type]
+
+    per_emotion = db.query(E.type, E.emotion, func.count()).filter(*has_emotion).group_by(E.type, E.emotion)
+    for type_code, emotion_code, n in per_emotion:
+        row = _row(type_code)
+        row.total += n
+        setattr(row, COUNT_COLUMNS[models.EMOTION_LABELS[emotion_code]], n)
+
+    per_ts = db.query(E.type, E.timestamp_us, func.count()).filter(*has_emotion).group_by(E.type, E.timestamp_us)
+    latest = {}
+    for type_code, timestamp_us, n in per_ts:
+        row = _row(type_code)
+        row.max_faces = max(row.max_faces, n)
+        if timestamp_us > latest.get(type_code, -1):
+            latest[type_code] = timestamp_us
+            row.last_timestamp, row.last_timestamp_faces = models.us_to_timestamp(timestamp_us), n
+
+    for type_code, persons in _tracked_persons(db, E, has_emotion, E.type):
+        _row(type_code).persons = persons
+
+    db.add_all(rows.values())
+
+
+def discard_rows(db, session_id: str, *filters) -> None:
+    """Delete a session's `emotion_detections` rows matching `filters` and take
+    them back out of its aggregates, updating the rows in place. The aggregate
+    rows are locked first (FOR UPDATE), so a concurrent record_frames waits for
+    this transaction instead of losing its increment. Counts are subtracted.
+    The busiest frame, latest timestamp and persons are recomputed from the
+    remaining rows only where the discarded rows may have set them; otherwise
+    the live values stay. Does not commit.
+    """
+    A = models.SessionAggregate
+    E = models.EmotionData
+    rows = {row.type: row for row in db.query(A).filter(A.session_id == session_id).with_for_update()}
+    discarded = (E.session_id == session_id, E.emotion.isnot(None), *filters)
+
+    counts = {}
+    for type_code, emotion_code, n in db.query(E.type, E.emotion, func.count()).filter(*discarded).group_by(E.type, E.emotion):
+        counts.setdefault(type_code, {})[models.EMOTION_LABELS[emotion_code]] = n
+    per_ts = db.query(E.type, E.timestamp_us.label("ts"), func.count().label("faces")).filter(*discarded) \
+        .group_by(E.type, E.timestamp_us).subquery()
+    spans = {type_code: (busiest, first, last) for type_code, busiest, first, last in db.query(
+        per_ts.c.type, func.max(per_ts.c.faces), func.min(per_ts.c.ts), func.max(per_ts.c.ts)).group_by(per_ts.c.type)}
+    persons = dict(_tracked_persons(db, E, discarded, E.type))
+
+    db.execute(delete(E).where(E.session_id == session_id, *filters), execution_options={"synchronize_session": False})
+    cache_utils.mark_written(db, session_id)
+
+    for type_code, type_counts in counts.items():
+        row = rows.get(models.CAPTURE_TYPES[type_code])
+        if row is None:
+            continue
+        values = {"total": A.total - sum(type_counts.values())}
+        for label, n in type_counts.items():
+            values[COUNT_COLUMNS[label]] = getattr(A, COUNT_COLUMNS[label]) - n
+        remaining = (E.session_id == session_id, E.type == type_code, E.emotion.isnot(None))
+        busiest, first, last = spans[type_code]
+        if busiest >= (row.max_faces or 0) or (row.last_timestamp and first <= models.timestamp_to_us(row.last_timestamp) <= last):
+            left = db.query(E.timestamp_us, func.count()).filter(*remaining).group_by(E.timestamp_us).all()
+            values["max_faces"] = max((n for _, n in left), default=0)
+            latest = max(left, default=None)
+            values["last_timestamp"] = models.us_to_timestamp(latest[0]) if latest else None
+            values["last_timestamp_faces"] = latest[1] if latest else 0
+        if persons.get(type_code, 0) >= (row.persons or 0) > 0:
+            values["persons"] = dict(_tracked_persons(db, E, remaining, E.type)).get(type_code, 0)
+        db.execute(update(A).where(A.id == row.id).values(**values), execution_options={"synchronize_session": False})
@@ -1,29 +1,81 @@
+"""
+AI teaching coach.
+
+The prompt and chain are built once at import. Calls stream through the async
+client (`astream`), at most AI_MAX_CONCURRENCY at a time and each
+bounded by AI_TIMEOUT_SECONDS, so a slow LLM only slows the coach. Answers are
+cached by normalised question plus the stats context they were given, so a
+repeated question about unchanged data never reaches the LLM.
+
+AI_COACH_LLM=fake swaps Groq for a local fake model that streams a canned
+answer, for development and benchmarks without an API key.
+"""
 import os
+import re
+import asyncio
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from pydantic import BaseModel
 
+import cache_utils
+
 load_dotenv()
 
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+AI_TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "30"))  # whole answer, including the wait for a slot
+AI_FAKE_RESPONSE = os.getenv("AI_FAKE_RESPONSE", "Try a quick think-pair-share to re-engage the room.")
+AI_FAKE_DELAY = float(os.getenv("AI_FAKE_DELAY", "0.01"))  # seconds per streamed character
+
+_SEPARATOR = "\n\n"  # between a partly streamed answer and the error that cut it off
+UNAVAILABLE = "AI Service is currently unavailable. Please check your API Key configuration."
+
+class AssistantError(Exception):
+    """The coach could not (finish its) answer; the message is shown to the user."""
+
+def with_error(answer: str, error: Exception) -> str:
+    """A partly streamed answer (possibly empty) followed by the error that cut it off."""
+    return f"{answer}{_SEPARATOR if answer else ''}{error}"
+
 class ChatRequest(BaseModel):
     question: str
 
-api_key = os.getenv("GROQ_API_KEY")
+def _make_llm():
+    if os.getenv("AI_COACH_LLM", "groq").lower() == "fake":
+        from langchain_core.language_models import FakeListChatModel
+        return FakeListChatModel(responses=[AI_FAKE_RESPONSE], sleep=AI_FAKE_DELAY)
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        print("⚠ Warning: GROQ_API_KEY not found in .env file")
+        return None
+    from langchain_groq import ChatGroq
+    return ChatGroq(model="qwen/qwen3-32b", temperature=0.7, api_key=api_key, max_tokens=100, timeout=AI_TIMEOUT_SECONDS)
 
-if api_key:
-    llm = ChatGroq(model="qwen/qwen3-32b", temperature=0.7, api_key=api_key, max_tokens=100)
-else:
-    llm = None
-    print("⚠ Warning: GROQ_API_KEY not found in .env file")
+prompt = ChatPromptTemplate.from_messages([
+    (
+        "system",
+        "You are an expert AI Pedagogical Coach. "
+        "Analyze classroom emotion data and provide concise, practical, and encouraging teaching advice.\n\n"
+        "{context}"
+    ),
+    ("user", "{question}")
+])
 
-def ask_teaching_assistant(question, session_stats):
+llm = None
+chain = None
+_slots = asyncio.Semaphore(AI_MAX_CONCURRENCY)
 
-    if not llm:
-        return "AI Service is currently unavailable. Please check your API Key configuration."
+def set_llm(model) -> None:
+    """Use `model` (any LangChain chat model, or None to disable) for every later call."""
+    global llm, chain
+    llm = model
+    chain = prompt | llm | StrOutputParser() if llm is not None else None
+    cache_utils.ai_response_cache.clear()
 
-    context_text = f"""
+set_llm(_make_llm())
+
+def build_context(session_stats: dict) -> str:
+    return f"""
     CLASSROOM DATA CONTEXT:
     - Session Name: {session_stats.get('info', {}).get('class_name', 'Unknown')}
     - Total Students: {session_stats.get('entry_stats', {}).get('total_faces', 0)}
@@ -33,22 +85,59 @@ def ask_teaching_assistant(question, session_stats):
     - Estimated Attendance: {session_stats.get('entry_stats', {}).get('attendance_est', 0)}
     """
 
-    prompt = ChatPromptTemplate.from_messages([
-        (
-            "system",
-            "You are an expert AI Pedagogical Coach. "
-            "Analyze classroom emotion data and provide concise, practical, and encouraging teaching advice.\n\n"
-            "{context}"
-        ),
-        ("user", "{question}")
-    ])
+def normalize_question(question: str) -> str:
+    """Case, whitespace and trailing punctuation do not change the answer."""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ").lower()
+
+def _cache_key(question: str, context: str) -> tuple:
+    return (normalize_question(question), context)
+
+async def ask_teaching_assistant(question: str, session_stats: dict) -> str:
+    """The coach's full answer. Errors come back as the answer text and are not cached."""
+    parts = []
+    try:
+        async for part in stream_teaching_assistant(question, session_stats):
+            parts.append(part)
+    except AssistantError as e:
+        return with_error("".join(parts), e)
+    return "".join(parts)
 
-    chain = prompt | llm | StrOutputParser()
+async def stream_teaching_assistant(question: str, session_stats: dict):
+    """Yield the coach's answer in chunks as the LLM produces them.
+    A cached answer arrives as one chunk. Raises AssistantError if no slot frees
+    up, the answer times out or the LLM fails, possibly after some chunks.
+    """
+    if chain is None:
+        yield UNAVAILABLE
+        return
+    context = build_context(session_stats)
+    key = _cache_key(question, context)
+    cached = cache_utils.ai_response_cache.get(key)
+    if cached is not None:
+        yield cached
+        return
 
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + AI_TIMEOUT_SECONDS
+    try:
+        await asyncio.wait_for(_slots.acquire(), AI_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise AssistantError("AI Error: the assistant is busy, please try again shortly.")
+    parts = []
+    stream = chain.astream({"context": context, "question": question})
     try:
-        return chain.invoke({
-            "context": context_text,
-            "question": question
-        })
+        while True:
+            try:
+                part = await asyncio.wait_for(stream.__anext__(), max(0.0, deadline - loop.time()))
+            except StopAsyncIteration:
+                break
+            parts.append(part)
+            yield part
+    except asyncio.TimeoutError:
+        raise AssistantError("AI Error: the assistant took too long to answer.")
     except Exception as e:
-        return f"AI Error: {str(e)}"
+        raise AssistantError(f"AI Error: {str(e)}") from e
+    finally:
+        _slots.release()
+        await stream.aclose()
+    cache_utils.ai_response_cache.set(key, "".join(parts))
@@ -0,0 +1,42 @@
+"""
+Identity-based attendance estimation.
+
+A `PersonCounter` follows one detection stream (a video upload or a webcam
+viewing) and counts the distinct track ids (`person_id`) seen in at least
+ATTENDANCE_MIN_FRAMES analysed frames, so short-lived tracks from detector
+flicker do not inflate the head count. Ids are only unique within a stream, so
+streams are never merged: the session aggregate keeps the largest estimate
+any stream reached, next to the busiest-frame face count as a lower bound.
+"""
+import os
+
+ATTENDANCE_MIN_FRAMES = int(os.getenv("ATTENDANCE_MIN_FRAMES", "3"))
+
+
+class PersonCounter:
+    """Running unique-person estimate for one stream of (timestamp, results) frames."""
+
+    def __init__(self, min_frames: int = None):
+        self.min_frames = max(1, ATTENDANCE_MIN_FRAMES if min_frames is None else min_frames)
+        self._frames_seen = {}  # person_id -> analysed frames it appeared in
+        self.persons = 0
+
+    def observe(self, results) -> int:
+        """Fold one frame's results in and return the current estimate."""
+        for person_id in {r['person_id'] for r in results if r.get('emotion') and r.get('person_id', -1) >= 0}:
+            seen = self._frames_seen.get(person_id, 0) + 1
+            self._frames_seen[person_id] = seen
+            if seen == self.min_frames:
+                self.persons += 1
+        return self.persons
+
+
+def estimate(frames, min_frames: int = None) -> int:
+    """Attendance for a complete list of (timestamp, results) frames: tracked
+    people, or the busiest frame when that is higher (untracked captures)."""
+    counter = PersonCounter(min_frames)
+    busiest = 0
+    for _, results in frames:
+        counter.observe(results)
+        busiest = max(busiest, sum(1 for r in results if r.get('emotion')))
+    return max(counter.persons, busiest)
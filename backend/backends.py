@@ -0,0 +1,273 @@
+"""
+Pluggable inference backends for face detection and emotion recognition.
+
+Selected by environment so each host can run its fastest CPU engine:
+
+    INFER_BACKEND     default for both models: opencv | onnxruntime | stub
+    FACE_BACKEND      opencv (Caffe res10 SSD, default) | onnxruntime | stub
+    EMOTION_BACKEND   hsemotion (default) | onnxruntime | opencv | stub
+    EMOTION_MODE      accurate (default) | fast; upload endpoints can pick per request
+
+A face detector takes the (frames, 3, 300, 300) mean-subtracted blob services
+builds and returns SSD detections shaped (1, 1, N, 7), each row tagged in
+column 0 with the frame it belongs to. An emotion model takes RGB face
+crops and returns (labels, scores) like HSEmotionRecognizer.predict_multi_emotions.
+"hsemotion" is the HSEmotion package as shipped (ONNX Runtime with its own
+defaults); "onnxruntime" and "opencv" run the same .onnx file with the thread
+and optimisation settings below. "stub" needs no weights: it finds the faces
+drawn by benchmarks.synthetic and maps each crop to a fixed label.
+
+"fast" mode runs EMOTION_FAST_MODEL, an INT8 copy of the emotion model written
+by quantize_emotion_model.py, on ONNX Runtime, optionally on smaller crops
+(EMOTION_FAST_SIZE). benchmarks/eval_fast_emotion.py measures what it costs in
+label agreement.
+
+Threads: OPENCV_THREADS is passed to cv2.setNumThreads. ORT_INTRA_OP_THREADS=0
+splits the cores between the face detector replicas (one session each) and lets
+ONNX Runtime choose for the emotion model. Worker processes pin both to 1.
+"""
+import os
+
+import cv2
+import numpy as np
+
+INFER_BACKEND   = os.getenv("INFER_BACKEND", "")
+FACE_BACKEND    = os.getenv("FACE_BACKEND", INFER_BACKEND or "opencv")
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", INFER_BACKEND or "hsemotion")
+
+FACE_PROTOTXT      = os.getenv("FACE_PROTOTXT", "deploy.prototxt")
+FACE_CAFFEMODEL    = os.getenv("FACE_CAFFEMODEL", "face.caffemodel")
+FACE_ONNX_MODEL    = os.getenv("FACE_ONNX_MODEL", "face.onnx")  # res10 SSD exported with the Caffe output layout
+EMOTION_MODEL      = os.getenv("EMOTION_MODEL", "enet_b0_8_best_afew")
+EMOTION_ONNX_MODEL = os.getenv("EMOTION_ONNX_MODEL", "")  # default: HSEmotion's download of EMOTION_MODEL
+
+EMOTION_MODES      = ("accurate", "fast")
+EMOTION_MODE       = os.getenv("EMOTION_MODE", "accurate")
+EMOTION_FAST_MODEL = os.getenv("EMOTION_FAST_MODEL", f"{EMOTION_MODEL}.int8.onnx")
+EMOTION_FAST_SIZE  = int(os.getenv("EMOTION_FAST_SIZE", "0"))  # crop side in fast mode; 0 = the model's own
+
+OPENCV_THREADS       = int(os.getenv("OPENCV_THREADS", "-1"))  # -1 keeps OpenCV's default
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+ORT_GRAPH_OPT_LEVEL  = os.getenv("ORT_GRAPH_OPT_LEVEL", "all")  # disable | basic | extended | all
+ORT_EXECUTION_MODE   = os.getenv("ORT_EXECUTION_MODE", "sequential")  # sequential | parallel
+ORT_PROVIDERS        = [p.strip() for p in os.getenv("ORT_PROVIDERS", "CPUExecutionProvider").split(",") if p.strip()]
+
+# Class order of the HSEmotion models (8-class, and the "_7" ones without Contempt)
+EMOTION_CLASSES = ['Anger', 'Contempt', 'Disgust', 'Fear', 'Happiness', 'Neutral', 'Sadness', 'Surprise']
+EMOTION_CLASSES_7 = ['Anger', 'Disgust', 'Fear', 'Happiness', 'Neutral', 'Sadness', 'Surprise']
+# (x / 255 - mean) / std, folded into one subtract and one multiply on 0..255 pixels
+_MEAN = np.array([0.485, 0.456, 0.406], np.float32) * 255
+_SCALE = 1 / (np.array([0.229, 0.224, 0.225], np.float32) * 255)
+
+
+def configure_threads() -> None:
+    if OPENCV_THREADS >= 0:
+        cv2.setNumThreads(OPENCV_THREADS)
+
+
+def ort_session(path: str, intra_threads: int = 0):
+    """An ONNX Runtime session with the ORT_* settings. `intra_threads` is the
+    fallback when ORT_INTRA_OP_THREADS is 0; 0 there too leaves ORT's default."""
+    import onnxruntime as ort
+
+    levels = {"disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+              "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+              "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+              "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL}
+    options = ort.SessionOptions()
+    options.graph_optimization_level = levels[ORT_GRAPH_OPT_LEVEL]
+    options.execution_mode = (ort.ExecutionMode.ORT_PARALLEL if ORT_EXECUTION_MODE == "parallel"
+                              else ort.ExecutionMode.ORT_SEQUENTIAL)
+    if ORT_INTRA_OP_THREADS or intra_threads:
+        options.intra_op_num_threads = ORT_INTRA_OP_THREADS or intra_threads
+    if ORT_INTER_OP_THREADS:
+        options.inter_op_num_threads = ORT_INTER_OP_THREADS
+
+    available = ort.get_available_providers()
+    providers = [p for p in ORT_PROVIDERS if p in available]
+    missing = [p for p in ORT_PROVIDERS if p not in available]
+    if missing:
+        print(f"[Inference] ONNX Runtime providers not available here, skipped: {', '.join(missing)}")
+    return ort.InferenceSession(path, sess_options=options, providers=providers or ["CPUExecutionProvider"])
+
+
+# ─── Face detection ──────────────────────────────────────────────────────────────
+class OpenCVFaceDetector:
+    name = "opencv"
+
+    def __init__(self, replicas: int = 1):
+        self._net = cv2.dnn.readNetFromCaffe(FACE_PROTOTXT, FACE_CAFFEMODEL)
+
+    def detect(self, blob: np.ndarray) -> np.ndarray:
+        self._net.setInput(blob)
+        return self._net.forward()
+
+
+class OnnxFaceDetector:
+    name = "onnxruntime"
+
+    def __init__(self, replicas: int = 1):
+        self._session = ort_session(FACE_ONNX_MODEL, max(1, (os.cpu_count() or 1) // max(1, replicas)))
+        model_input = self._session.get_inputs()[0]
+        self._input = model_input.name
+        # Exports with a fixed batch of 1 run a multi-frame blob one frame at a time
+        self._fixed_batch = model_input.shape[0] == 1
+
+    def detect(self, blob: np.ndarray) -> np.ndarray:
+        blob = blob.astype(np.float32, copy=False)
+        if not self._fixed_batch or len(blob) == 1:
+            return self._session.run(None, {self._input: blob})[0]
+        outputs = []
+        for i in range(len(blob)):
+            out = self._session.run(None, {self._input: blob[i:i + 1]})[0]
+            out[..., 0] = i
+            outputs.append(out)
+        return np.concatenate(outputs, axis=2)
+
+
+class StubFaceDetector:
+    """Finds the skin-toned blobs benchmarks.synthetic draws; no weights needed."""
+    name = "stub"
+
+    def __init__(self, replicas: int = 1):
+        pass
+
+    def detect(self, blob: np.ndarray) -> np.ndarray:
+        detections = []
+        for image, planes in enumerate(blob):
+            # Mean-subtracted red channel: synthetic faces are ~+97, background ~-63
+            red = planes[2]
+            count, _, boxes, _ = cv2.connectedComponentsWithStats((red > 40).astype(np.uint8))
+            h, w = red.shape
+            detections += [(image, 1, 0.99, x / w, y / h, (x + bw) / w, (y + bh) / h)
+                           for x, y, bw, bh, area in boxes[1:count] if area >= 30]
+        out = np.zeros((1, 1, max(1, len(detections)), 7), np.float32)
+        if detections:
+            out[0, 0] = detections
+        return out
+
+
+FACE_DETECTORS = {"opencv": OpenCVFaceDetector, "onnxruntime": OnnxFaceDetector, "stub": StubFaceDetector}
+
+
+def load_face_detector(replicas: int = 1):
+    """One face detector replica of the FACE_BACKEND kind; `replicas` is how many share the CPU."""
+    return _choose(FACE_DETECTORS, FACE_BACKEND, "FACE_BACKEND")(replicas)
+
+
+# ─── Emotion recognition ─────────────────────────────────────────────────────────
+def _emotion_model_path() -> str:
+    if EMOTION_ONNX_MODEL:
+        return EMOTION_ONNX_MODEL
+    from hsemotion_onnx.facial_emotions import get_model_path
+    return get_model_path(EMOTION_MODEL)
+
+
+def _emotion_blob(face_crops: list, size: int) -> np.ndarray:
+    """HSEmotion's preprocessing for a whole batch: resize, scale, normalise, NCHW."""
+    batch = np.stack([cv2.resize(crop, (size, size)) for crop in face_crops]).astype(np.float32)
+    batch -= _MEAN
+    batch *= _SCALE
+    return np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+
+
+class _OnnxEmotionModel:
+    """Shared by the ONNX Runtime and OpenCV runners of an HSEmotion .onnx file."""
+
+    def __init__(self, size: int = 0):
+        self.size = size or (224 if "_b0_" in EMOTION_MODEL else 260)
+        self.is_mtl = "_mtl" in EMOTION_MODEL
+        self.classes = EMOTION_CLASSES_7 if "_7" in EMOTION_MODEL else EMOTION_CLASSES
+
+    def predict(self, face_crops: list):
+        scores = self._run(_emotion_blob(face_crops, self.size))
+        preds = np.argmax(scores[:, :-2] if self.is_mtl else scores, axis=1)
+        return [self.classes[p] for p in preds], scores
+
+
+class OnnxEmotionModel(_OnnxEmotionModel):
+    name = "onnxruntime"
+
+    def __init__(self, path: str = None, size: int = 0):
+        super().__init__(size)
+        self._session = ort_session(path or _emotion_model_path())
+        self._input = self._session.get_inputs()[0].name
+
+    def _run(self, blob):
+        return self._session.run(None, {self._input: blob})[0]
+
+
+class OpenCVEmotionModel(_OnnxEmotionModel):
+    name = "opencv"
+
+    def __init__(self):
+        super().__init__()
+        self._net = cv2.dnn.readNetFromONNX(_emotion_model_path())
+
+    def _run(self, blob):
+        self._net.setInput(blob)
+        return self._net.forward()
+
+
+class HSEmotionModel:
+    name = "hsemotion"
+
+    def __init__(self):
+        from hsemotion_onnx.facial_emotions import HSEmotionRecognizer
+        self._recognizer = HSEmotionRecognizer(model_name=EMOTION_MODEL)
+
+    def predict(self, face_crops: list):
+        return self._recognizer.predict_multi_emotions(face_crops)
+
+
+class StubEmotionModel:
+    """Maps each crop to a label from its mean colour; no weights needed."""
+    name = "stub"
+
+    def predict(self, face_crops: list):
+        labels, scores = [], []
+        for crop in face_crops:
+            index = int(np.asarray(crop, np.float32).mean()) % len(EMOTION_CLASSES)
+            score = np.full(len(EMOTION_CLASSES), 0.1 / (len(EMOTION_CLASSES) - 1), np.float32)
+            score[index] = 0.9
+            labels.append(EMOTION_CLASSES[index])
+            scores.append(score)
+        return labels, np.array(scores)
+
+
+EMOTION_MODELS = {"hsemotion": HSEmotionModel, "onnxruntime": OnnxEmotionModel, "opencv": OpenCVEmotionModel, "stub": StubEmotionModel}
+
+
+class FastEmotionModel(OnnxEmotionModel):
+    name = "onnxruntime-int8"
+
+    def __init__(self):
+        if not os.path.isfile(EMOTION_FAST_MODEL):
+            raise FileNotFoundError(f"Fast emotion model {EMOTION_FAST_MODEL!r} not found; "
+                                    "create it with `python quantize_emotion_model.py`")
+        super().__init__(EMOTION_FAST_MODEL, EMOTION_FAST_SIZE)
+
+
+def load_emotion_model(mode: str = None):
+    """The emotion model for `mode` (default EMOTION_MODE): EMOTION_BACKEND's
+    model for "accurate", the quantized one for "fast" (stubbed with the rest)."""
+    mode = emotion_mode(mode)
+    if mode == "fast" and EMOTION_BACKEND != "stub":
+        return FastEmotionModel()
+    return _choose(EMOTION_MODELS, EMOTION_BACKEND, "EMOTION_BACKEND")()
+
+
+def emotion_mode(mode: str = None) -> str:
+    """Validate a requested emotion mode; None means EMOTION_MODE."""
+    mode = (mode or EMOTION_MODE).lower()
+    if mode not in EMOTION_MODES:
+        raise ValueError(f"Unknown emotion mode {mode!r}; choose one of: {', '.join(EMOTION_MODES)}")
+    return mode
+
+
+def _choose(registry: dict, name: str, setting: str):
+    try:
+        return registry[name.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown {setting} {name!r}; choose one of: {', '.join(registry)}") from None
@@ -0,0 +1,62 @@
+"""
+Face detection cost per frame at several batch sizes (services.detect_faces_batch).
+
+Detects the same synthetic frames in batches of each size (one blobFromImages
+forward pass per batch) and reports milliseconds per frame, the speed-up over
+batch size 1, and whether every batch size found the same boxes.
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/bench_face_batch.py --frames 64 --batch-sizes 1 4 8 16
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services
+from benchmarks.synthetic import make_frame
+
+
+def run(frames: list, batch_size: int) -> tuple:
+    """(boxes per frame, seconds) for detecting `frames` `batch_size` at a time."""
+    boxes = []
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        boxes += services.detect_faces_batch(frames[i:i + batch_size])
+    return boxes, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=64)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--faces", type=int, default=5)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs per batch size")
+    args = parser.parse_args()
+
+    frames = [make_frame(args.width, args.height, faces=args.faces, t=t) for t in range(args.frames)]
+    run(frames[:max(args.batch_sizes)], max(args.batch_sizes))  # warm-up
+    reference, _ = run(frames, 1)
+    report = {"frames": args.frames, "frame": [args.width, args.height], "faces": args.faces,
+              "backend": services.backends.FACE_BACKEND, "runs": []}
+    baseline = None
+    for batch_size in args.batch_sizes:
+        seconds = min(run(frames, batch_size)[1] for _ in range(args.repeat))
+        boxes, _ = run(frames, batch_size)
+        per_frame = 1000 * seconds / len(frames)
+        baseline = baseline or per_frame
+        report["runs"].append({
+            "batch_size": batch_size,
+            "ms_per_frame": round(per_frame, 3),
+            "speedup_vs_first": round(baseline / per_frame, 2),
+            "same_boxes": boxes == reference,
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Fixed vs adaptive frame sampling: frames analysed, wall time and changes caught.
+
+Builds a lecture-like synthetic clip (static stretches, stretches where the
+faces move, and scene cuts to a different room) and runs the same decode and
+analysis loop as services.process_video_file under each policy. A change is
+"caught" when a frame within --catch-window seconds of it was analysed.
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/bench_sampling.py --seconds 60 --fps 30 --sample-fps 3
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+import sampling, services
+from benchmarks.synthetic import make_frame
+
+
+def make_lecture(path: str, seconds: float, fps: int, segment: float) -> list:
+    """Write the clip; returns the 1-based frame indices where the picture changes.
+    Segments cycle static -> moving -> cut to a new scene (held static)."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (640, 480))
+    changes, scene, t = [], 0, 0
+    per_segment = int(segment * fps)
+    for i in range(int(seconds * fps)):
+        phase = (i // per_segment) % 3
+        if i % per_segment == 0 and i and phase != 0:
+            changes.append(i + 1)
+            if phase == 2:
+                scene += 1
+        if phase == 1:
+            t += 1
+        writer.write(make_frame(faces=3, t=t, seed=scene))
+    writer.release()
+    return changes
+
+
+def run(path: str, policy: sampling.SamplingPolicy, mode: str = None):
+    """(analysed frame indices, seconds, frames decoded)."""
+    cap = cv2.VideoCapture(path)
+    sampler = policy.sampler(cap.get(cv2.CAP_PROP_FPS))
+    tracker = services.new_face_tracker()
+    analysed, index = [], 0
+    start = time.perf_counter()
+    while cap.grab():
+        index += 1
+        if not sampler.candidate(index):
+            continue
+        ok, frame = cap.retrieve()
+        if ok and sampler.analyse(index, frame):
+            services._process_frame(frame, tracker, mode)
+            analysed.append(index)
+    elapsed = time.perf_counter() - start
+    cap.release()
+    return analysed, elapsed, index
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=60)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--segment", type=float, default=5, help="seconds per static / moving / cut segment")
+    parser.add_argument("--sample-fps", type=float, default=sampling.VIDEO_SAMPLE_FPS)
+    parser.add_argument("--catch-window", type=float, default=0.5)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+        changes = make_lecture(tmp.name, args.seconds, args.fps, args.segment)
+    report = {"video_seconds": args.seconds, "fps": args.fps, "changes": len(changes), "runs": []}
+    window = args.catch_window * args.fps
+    try:
+        for name in sampling.SAMPLE_POLICIES:
+            policy = sampling.SamplingPolicy(name, args.sample_fps)
+            analysed, elapsed, frames = run(tmp.name, policy)
+            delays = [min((a - c for a in analysed if a >= c), default=None) for c in changes]
+            report["runs"].append({
+                "policy": repr(policy),
+                "frames_decoded": frames,
+                "frames_analysed": len(analysed),
+                "seconds": round(elapsed, 3),
+                "changes_caught": sum(d is not None and d <= window for d in delays),
+                "max_delay_s": round(max(d for d in delays if d is not None) / args.fps, 2) if any(d is not None for d in delays) else None,
+            })
+    finally:
+        os.unlink(tmp.name)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Table size and per-session query time: legacy `emotion_data` vs compact `emotion_detections`.
+
+Fills a legacy table with synthetic detections, migrates them with
+migrate_emotion_data.convert_row, then compares the two on SQLite files of their own.
+Run from the backend directory:
+    python benchmarks/bench_schema.py --sessions 200 --rows-per-session 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Integer, MetaData, String, Table, create_engine, func, insert, select
+
+import models
+from migrate_emotion_data import convert_row
+
+BATCH = 5000
+
+# The table as it was before the compact schema (plus migrate.py's person_id)
+_legacy_metadata = MetaData()
+legacy = Table(
+    "emotion_data", _legacy_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("session_id", String(36), index=True),
+    Column("type", String(20)),
+    Column("emotion", String(20)),
+    Column("bbox", String(100)),
+    Column("timestamp", String(30)),
+    Column("person_id", Integer, default=-1),
+)
+
+
+def legacy_rows(sessions: int, rows_per_session: int, faces: int = 3):
+    rng = random.Random(0)
+    base = datetime.now()
+    row_id = 0
+    for _ in range(sessions):
+        session_id = str(uuid.uuid4())
+        for i in range(rows_per_session):
+            row_id += 1
+            yield {
+                "id": row_id,
+                "session_id": session_id,
+                "type": rng.choice(models.CAPTURE_TYPES),
+                "emotion": rng.choice(models.EMOTION_LABELS),
+                "bbox": json.dumps([rng.randint(0, 600), rng.randint(0, 400), 60, 80]),
+                "timestamp": (base + timedelta(milliseconds=(i // faces) * 100)).isoformat(),
+                "person_id": i % faces,
+            }
+
+
+def _fill(engine, table, rows) -> None:
+    with engine.begin() as conn:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH:
+                conn.execute(insert(table), batch)
+                batch = []
+        if batch:
+            conn.execute(insert(table), batch)
+    with engine.connect() as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def _time_queries(engine, table, session_ids, type_value, repeat: int) -> float:
+    """Best time of the report's per-session queries: emotion counts and faces per timestamp."""
+    timestamp = table.c.timestamp_us if "timestamp_us" in table.c else table.c.timestamp
+    best = None
+    with engine.connect() as conn:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for sid in session_ids:
+                where = (table.c.session_id == sid, table.c.type == type_value)
+                conn.execute(select(table.c.emotion, func.count()).where(*where).group_by(table.c.emotion)).all()
+                conn.execute(select(timestamp, func.count()).where(*where).group_by(timestamp)).all()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--rows-per-session", type=int, default=2000)
+    parser.add_argument("--queried-sessions", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = {name: tempfile.NamedTemporaryFile(suffix=".db", delete=False).name for name in ("legacy", "compact")}
+    try:
+        legacy_engine = create_engine(f"sqlite:///{paths['legacy']}")
+        compact_engine = create_engine(f"sqlite:///{paths['compact']}")
+        _legacy_metadata.create_all(bind=legacy_engine)
+        models.EmotionData.__table__.create(bind=compact_engine)
+
+        rows = list(legacy_rows(args.sessions, args.rows_per_session))
+        _fill(legacy_engine, legacy, rows)
+        _fill(compact_engine, models.EmotionData.__table__, (convert_row(r) for r in rows))
+
+        session_ids = sorted({r["session_id"] for r in rows})[:args.queried_sessions]
+        report = {"rows": len(rows), "queried_sessions": len(session_ids), "tables": {}}
+        for name, engine, table, type_value in (
+            ("legacy", legacy_engine, legacy, "entry"),
+            ("compact", compact_engine, models.EmotionData.__table__, models.CAPTURE_TYPE_CODES["entry"]),
+        ):
+            seconds = _time_queries(engine, table, session_ids, type_value, args.repeat)
+            report["tables"][name] = {"bytes": os.path.getsize(paths[name]), "best_query_seconds": round(seconds, 4)}
+            engine.dispose()
+        old, new = report["tables"]["legacy"], report["tables"]["compact"]
+        report["size_ratio"] = round(new["bytes"] / old["bytes"], 2)
+        report["query_speedup"] = round(old["best_query_seconds"] / new["best_query_seconds"], 2)
+    finally:
+        for path in paths.values():
+            os.unlink(path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Face detector calls and box accuracy: detect-every-frame vs detect-every-N tracking.
+
+Feeds a synthetic clip through tracking.FaceTracker at several detection
+intervals and compares each tracked box against a fresh detection of the same
+frame. Run from the backend directory (models are loaded relative to it):
+    python benchmarks/bench_tracking.py --seconds 20 --detect-every 1 3 5 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services, tracking
+from benchmarks.synthetic import make_frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--faces", type=int, default=3)
+    parser.add_argument("--detect-every", type=int, nargs="+", default=[1, 3, 5, 10])
+    args = parser.parse_args()
+
+    frames = [make_frame(faces=args.faces, t=t) for t in range(int(args.seconds * args.fps))]
+    truth = [services._detect_faces(f) for f in frames]
+    report = {"frames": len(frames), "faces": args.faces, "runs": []}
+    for detect_every in args.detect_every:
+        tracker = services.new_face_tracker(detect_every)
+        ious = []
+        start = time.perf_counter()
+        for frame, fresh in zip(frames, truth):
+            for _, box in tracker.update(frame):
+                ious.append(max((tracking.iou(box, f) for f in fresh), default=0.0))
+        elapsed = time.perf_counter() - start
+        report["runs"].append({
+            "detect_every": detect_every,
+            "detector_calls": tracker.detections,
+            "detector_calls_per_second_of_video": round(tracker.detections / args.seconds, 1),
+            "frames_per_second": round(len(frames) / elapsed, 1),
+            "mean_iou_vs_fresh_detection": round(sum(ious) / len(ious), 3) if ious else None,
+            "track_ids_issued": tracker.issued,
+        })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Two-stage (XVID AVI + ffmpeg transcode) vs single-pass ffmpeg pipe encoding
+for /analyze_video_full, on a synthetic clip.
+
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/bench_video_encode.py --seconds 30 --width 1280 --height 720
+Reports wall-clock time, peak temp-dir disk usage and output size per encoder.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services
+from benchmarks.synthetic import make_video
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for entry in os.scandir(path):
+        try:
+            total += entry.stat().st_size
+        except FileNotFoundError:
+            pass
+    return total
+
+
+def _measure(encoder: str, video_path: str, workdir: str, **encode_options) -> dict:
+    """Run one encode with tempfile pointed at `workdir`, polling its size."""
+    peak = 0
+    done = threading.Event()
+
+    def _poll():
+        nonlocal peak
+        while not done.is_set():
+            peak = max(peak, _dir_size(workdir))
+            time.sleep(0.02)
+
+    previous_tempdir = tempfile.tempdir
+    tempfile.tempdir = workdir
+    poller = threading.Thread(target=_poll, daemon=True)
+    poller.start()
+    start = time.perf_counter()
+    try:
+        output_path, results = services.process_and_annotate_video(video_path, encoder=encoder, **encode_options)
+    finally:
+        elapsed = time.perf_counter() - start
+        done.set()
+        poller.join()
+        tempfile.tempdir = previous_tempdir
+
+    output_size = os.path.getsize(output_path) if output_path else 0
+    if output_path:
+        os.unlink(output_path)
+    return {
+        "encoder": encoder,
+        "ok": bool(output_path),
+        "seconds": round(elapsed, 3),
+        "peak_temp_bytes": peak,
+        "output_bytes": output_size,
+        "frames_with_faces": len(results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--preset", default=None)
+    parser.add_argument("--crf", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--scale", type=float, default=None)
+    args = parser.parse_args()
+    encode_options = {k: v for k, v in
+                      {"preset": args.preset, "crf": args.crf, "threads": args.threads, "scale": args.scale}.items()
+                      if v is not None}
+
+    source_dir = tempfile.mkdtemp(prefix="bench_src_")
+    workdir = tempfile.mkdtemp(prefix="bench_enc_")
+    try:
+        video_path = make_video(os.path.join(source_dir, "clip.mp4"), args.seconds, args.fps, args.width, args.height)
+        runs = [_measure(encoder, video_path, workdir, **encode_options) for encoder in ("two_pass", "pipe")]
+    finally:
+        shutil.rmtree(source_dir, ignore_errors=True)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    two_pass, pipe = runs
+    print(json.dumps({
+        "video": {"seconds": args.seconds, "fps": args.fps, "width": args.width, "height": args.height},
+        "encode_options": encode_options,
+        "runs": runs,
+        "pipe_speedup": round(two_pass["seconds"] / pipe["seconds"], 2) if pipe["seconds"] else None,
+        "pipe_peak_temp_ratio": round(pipe["peak_temp_bytes"] / two_pass["peak_temp_bytes"], 3) if two_pass["peak_temp_bytes"] else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Sequential vs multi-process /analyze_video analysis on a synthetic clip.
+
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/bench_video_parallel.py --seconds 60 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sampling, services, video_parallel
+from benchmarks.synthetic import make_video
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--faces", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp:
+        path = make_video(tmp.name, args.seconds, args.fps, faces=args.faces)
+    report = {"video_seconds": args.seconds, "fps": args.fps, "faces": args.faces, "cpu_count": os.cpu_count(), "runs": []}
+    try:
+        baseline = None
+        for workers in args.workers:
+            if workers > 1:
+                # Warm the pool so model loading is not billed to the measurement
+                video_parallel.analyze_video_parallel(path, sampling.SamplingPolicy(), workers)
+            start = time.perf_counter()
+            results = services.process_video_file(path, workers)
+            elapsed = time.perf_counter() - start
+            if baseline is None:
+                baseline = (elapsed, results)
+            report["runs"].append({
+                "workers": workers,
+                "seconds": round(elapsed, 3),
+                "speedup": round(baseline[0] / elapsed, 2),
+                "frames_with_faces": len(results),
+                "matches_first_run": results == baseline[1],
+            })
+    finally:
+        os.unlink(path)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Fast emotion mode trade-off: per-face latency and label agreement vs the FP32 model.
+
+Runs the FP32 emotion model at its own input size as the reference, then the
+FP32 and INT8 (EMOTION_FAST_MODEL) models at each --sizes crop side over the
+same faces, and reports per-face latency, speedup and the share of faces whose
+label matches the reference. Agreement is only meaningful on real faces: point
+--images at a folder of face crops (one face per image). Without it the
+synthetic faces are used, which measures speed only.
+
+Run from the backend directory after quantize_emotion_model.py:
+    python benchmarks/eval_fast_emotion.py --images faces/ --sizes 224 192 160 128
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import cv2
+
+import backends
+from quantize_emotion_model import face_crops, free_input_size
+
+
+def _synthetic_crops(count: int) -> list:
+    from benchmarks.synthetic import make_frame
+    crops = []
+    for t in range(count):
+        frame = make_frame(faces=1, t=t, seed=t)
+        crops.append(cv2.cvtColor(frame[140:340, 220:420], cv2.COLOR_BGR2RGB))
+    return crops
+
+
+def _evaluate(model, crops: list, batch: int, repeat: int):
+    """(labels for every crop, median per-face latency in ms)."""
+    batches = [crops[i:i + batch] for i in range(0, len(crops), batch)]
+    labels = [label for b in batches for label in model.predict(b)[0]]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for b in batches:
+            model.predict(b)
+        timings.append((time.perf_counter() - start) / len(crops))
+    return labels, statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", help="folder of face crops")
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[224, 192, 160, 128])
+    parser.add_argument("--batch", type=int, default=32, help="faces per model call, as INFER_MAX_BATCH")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--fast-model", default=backends.EMOTION_FAST_MODEL)
+    args = parser.parse_args()
+
+    crops = face_crops(args.images, args.limit) if args.images else _synthetic_crops(min(args.limit, 256))
+    if not crops:
+        raise SystemExit(f"No images found in {args.images}")
+
+    reference_model = backends.OnnxEmotionModel()
+    reference, reference_ms = _evaluate(reference_model, crops, args.batch, args.repeat)
+    report = {"faces": len(crops), "image_set": args.images or "synthetic (speed only)", "batch": args.batch,
+              "reference": {"model": "fp32", "size": reference_model.size, "per_face_ms": round(reference_ms, 3)},
+              "candidates": []}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fp32 = os.path.join(tmp, "fp32.onnx")
+        free_input_size(backends._emotion_model_path(), fp32)
+        variants = [("fp32", fp32)]
+        if os.path.isfile(args.fast_model):
+            variants.append(("int8", args.fast_model))
+        else:
+            report["int8"] = f"{args.fast_model} not found; run quantize_emotion_model.py"
+        for name, path in variants:
+            for size in args.sizes:
+                labels, per_face_ms = _evaluate(backends.OnnxEmotionModel(path, size), crops, args.batch, args.repeat)
+                report["candidates"].append({
+                    "model": name, "size": size,
+                    "per_face_ms": round(per_face_ms, 3),
+                    "speedup": round(reference_ms / per_face_ms, 2),
+                    "label_agreement": round(sum(a == b for a, b in zip(labels, reference)) / len(crops), 4),
+                })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+WebSocket frame latency while /sessions/history is under load.
+
+Starts the API in-process on a temporary SQLite database, feeds the webcam hub
+from a synthetic clip instead of a camera, and measures the gap between
+consecutive WebSocket frames: first with the stream alone, then while several
+clients poll /sessions/history in a loop. With the async database layer the
+loaded gaps should stay close to the idle ones.
+
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/load_ws_history.py --sessions 2000 --pollers 8 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmp_db = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+os.environ["DB_URL"] = f"sqlite:///{_tmp_db}"  # never seed sessions into the real database
+
+import httpx
+import uvicorn
+import websockets
+
+import main as api
+import broadcast, services
+from benchmarks.synthetic import make_video
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _gap_summary(gaps) -> dict:
+    if not gaps:
+        return {"frames": 0}
+    ms = [g * 1000 for g in gaps]
+    return {"frames": len(ms) + 1, "p50_ms": round(statistics.median(ms), 1),
+            "p95_ms": round(_percentile(ms, 95), 1), "max_ms": round(max(ms), 1)}
+
+
+async def _watch(url: str, seconds: float) -> list:
+    gaps = []
+    async with websockets.connect(url, max_size=None) as ws:
+        last = None
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            await ws.recv()
+            now = time.perf_counter()
+            if last is not None:
+                gaps.append(now - last)
+            last = now
+        await ws.send("stop")
+    return gaps
+
+
+async def _poll_history(client: httpx.AsyncClient, stop: asyncio.Event, counter: list):
+    while not stop.is_set():
+        response = await client.get("/sessions/history")
+        response.raise_for_status()
+        counter[0] += 1
+
+
+async def run(args, base_url: str) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        for i in range(args.sessions):
+            response = await client.post("/sessions/create", json={"name": f"s{i}", "class_name": "Load", "instructor": "Bench"})
+            session_id = response.json()["id"]
+
+        ws_url = base_url.replace("http", "ws", 1) + f"/ws/webcam/{session_id}/entry"
+        report = {"sessions": args.sessions, "pollers": args.pollers, "seconds": args.seconds}
+        report["idle"] = _gap_summary(await _watch(ws_url, args.seconds))
+
+        stop = asyncio.Event()
+        counter = [0]
+        pollers = [asyncio.create_task(_poll_history(client, stop, counter)) for _ in range(args.pollers)]
+        try:
+            report["under_history_load"] = _gap_summary(await _watch(ws_url, args.seconds))
+        finally:
+            stop.set()
+            await asyncio.gather(*pollers, return_exceptions=True)
+        report["history_requests_per_second"] = round(counter[0] / args.seconds, 1)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--pollers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    clip = tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name
+    make_video(clip, seconds=5)
+    # cv2.VideoCapture reads the clip like a camera; the hub keeps serving its last frame
+    api._webcam_hubs[0] = broadcast.WebcamHub(services.WebcamManager(clip), api._persist_webcam_frames)
+
+    server = uvicorn.Server(uvicorn.Config(api.app, port=args.port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    try:
+        report = asyncio.run(run(args, f"http://127.0.0.1:{args.port}"))
+    finally:
+        server.should_exit = True
+        thread.join()
+        os.unlink(clip)
+        os.unlink(_tmp_db)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
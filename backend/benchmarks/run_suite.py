@@ -0,0 +1,333 @@
+"""
+Offline benchmark suite for the inference, stats and API hot paths, as one JSON report.
+
+Sections (all on CPU, synthetic inputs, a temporary SQLite database):
+  inference  _detect_faces, and _process_frame at several face counts
+  stats      calculate_advanced_stats / calculate_teaching_impact on N raw rows,
+             against the pre-aggregated stats_from_counts path
+  video      process_video_file (and process_and_annotate_video when ffmpeg is
+             installed) on a generated clip
+  api        latency and throughput of the main endpoints through an in-process
+             ASGI client: cold cache, warm cache and 304 revalidation
+
+--stub-models runs with INFER_BACKEND=stub (see backends.py), so the suite needs
+no model weights; those timings cover the pipeline around the models only.
+Without it, the FACE_BACKEND / EMOTION_BACKEND / ORT_* settings in the
+environment are what gets measured. Save a report per release and pass it back with --compare to list
+metrics that got slower by more than --tolerance (exit status 1 if any did).
+
+Run from the backend directory (models are loaded relative to it):
+    python benchmarks/run_suite.py --stub-models --output bench.json
+    python benchmarks/run_suite.py --stub-models --sections stats --rows 10000 1000000 10000000
+    python benchmarks/run_suite.py --stub-models --compare bench.json
+10M stats rows need roughly 4 GB of memory.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Spawned workers re-run this module; they reuse the parent's database file
+if "BENCH_DB_PATH" not in os.environ:
+    os.environ["BENCH_DB_PATH"] = tempfile.NamedTemporaryFile(suffix=".db", delete=False).name
+_tmp_db = os.environ["BENCH_DB_PATH"]
+os.environ["DB_URL"] = f"sqlite:///{_tmp_db}"  # never benchmark against the real database
+os.environ.setdefault("AI_COACH_LLM", "fake")
+os.environ.setdefault("AI_FAKE_DELAY", "0")
+
+SECTIONS = ("inference", "stats", "video", "api")
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _summary_ms(seconds: list) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {"runs": len(ms), "median_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(_percentile(ms, 95), 3), "min_ms": round(min(ms), 3)}
+
+
+def _time(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return _summary_ms(samples)
+
+
+# ─── Inference ────────────────────────────────────────────────────────────────────
+def bench_inference(args) -> dict:
+    import services
+    from benchmarks.synthetic import make_frame
+
+    frame = make_frame(args.width, args.height, faces=3)
+    report = {"frame": [args.width, args.height], "detect_faces": _time(lambda: services._detect_faces(frame), args.repeat)}
+    process_frame = {}
+    for faces in args.faces:
+        frame = make_frame(args.width, args.height, faces=faces, seed=faces)
+        timing = _time(lambda: services._process_frame(frame), args.repeat)
+        timing["detected"] = len(services._process_frame(frame))
+        process_frame[str(faces)] = timing
+    report["process_frame"] = process_frame
+    return report
+
+
+# ─── Stats ────────────────────────────────────────────────────────────────────────
+def synthetic_rows(count: int, faces_per_frame: int = 5, seed: int = 0) -> list:
+    """Raw detection rows as dicts, `faces_per_frame` tracked people per timestamp."""
+    import services
+
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    emotions = rng.choices(services.EMOTIONS, k=count)
+    return [{"emotion": emotions[i], "person_id": i % faces_per_frame + 1,
+             "timestamp": (base + timedelta(milliseconds=100 * (i // faces_per_frame))).isoformat()}
+            for i in range(count)]
+
+
+def bench_stats(args) -> dict:
+    import services
+    from collections import Counter
+
+    report = {}
+    for count in args.rows:
+        rows = synthetic_rows(count)
+        half = count // 2
+        entry, exit_ = rows[:half], rows[half:]
+        repeat = args.repeat if count <= 100_000 else max(1, args.repeat // 10)
+        entry_counts, exit_counts = Counter(r["emotion"] for r in entry), Counter(r["emotion"] for r in exit_)
+        report[str(count)] = {
+            "advanced_stats": _time(lambda: services.calculate_advanced_stats(rows), repeat, warmup=0),
+            "teaching_impact": _time(lambda: services.calculate_teaching_impact(entry, exit_), repeat, warmup=0),
+            # What the API does: counts are aggregated as rows are inserted
+            "from_counts": _time(lambda: (services.stats_from_counts(entry_counts),
+                                          services.calculate_teaching_impact_from_counts(entry_counts, exit_counts)), args.repeat),
+        }
+        del rows, entry, exit_
+    return report
+
+
+# ─── Video ────────────────────────────────────────────────────────────────────────
+def bench_video(args) -> dict:
+    import shutil
+    import services
+    from benchmarks.synthetic import make_video
+
+    clip = make_video(tempfile.NamedTemporaryFile(suffix=".mp4", delete=False).name,
+                      seconds=args.video_seconds, width=args.width, height=args.height)
+    frames = int(args.video_seconds * 30)
+    report = {"clip_seconds": args.video_seconds, "clip_frames": frames}
+    try:
+        for workers in args.video_workers:
+            start = time.perf_counter()
+            results = services.process_video_file(clip, workers=workers)
+            elapsed = time.perf_counter() - start
+            report[f"process_video_file_w{workers}"] = {"seconds": round(elapsed, 3), "frames_per_s": round(frames / elapsed, 1),
+                                                        "frames_with_faces": len(results)}
+        if shutil.which("ffmpeg"):
+            start = time.perf_counter()
+            path, results = services.process_and_annotate_video(clip)
+            elapsed = time.perf_counter() - start
+            if path:
+                os.unlink(path)
+            report["annotate_video"] = {"seconds": round(elapsed, 3), "frames_per_s": round(frames / elapsed, 1), "ok": bool(path)}
+        else:
+            report["annotate_video"] = {"skipped": "ffmpeg not found"}
+    finally:
+        os.unlink(clip)
+    return report
+
+
+# ─── API ──────────────────────────────────────────────────────────────────────────
+async def _measure(client, method: str, url: str, requests: int, concurrency: int, before=None, **kwargs) -> dict:
+    """Issue `requests` requests, `concurrency` at a time; latency summary plus requests/s."""
+    latencies = []
+    statuses = set()
+    pending = iter(range(requests))
+
+    async def worker():
+        for _ in pending:
+            if before:
+                before()
+            start = time.perf_counter()
+            response = await client.request(method, url, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            statuses.add(response.status_code)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {**_summary_ms(latencies), "requests_per_s": round(requests / elapsed, 1), "status": sorted(statuses)}
+
+
+def _seed_detections(session_id: str, rows: int) -> None:
+    import database, main as api
+
+    base = datetime.now()
+    for capture_type in ("entry", "exit"):
+        frames = [((base + timedelta(milliseconds=100 * i)).isoformat(),
+                   [{"emotion": e, "confidence": 0.9, "bbox": [10 * f, 10, 50, 60], "person_id": f + 1}
+                    for f, e in enumerate(random.Random(i).choices(api.services.EMOTIONS, k=5))])
+                  for i in range(rows // 10)]
+        with database.SessionLocal() as db:
+            api._save_detections(db, session_id, capture_type, frames)
+            db.commit()
+
+
+async def _bench_api(args) -> dict:
+    import cv2
+    import httpx
+    import cache_utils, main as api
+    from benchmarks.synthetic import make_frame
+
+    def cold():
+        for cache in (cache_utils.session_stats_cache, cache_utils.report_pdf_cache):
+            cache.clear()
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        session_ids = []
+        for i in range(args.api_sessions):
+            response = await client.post("/sessions/create", json={"name": f"s{i}", "class_name": "Bench", "instructor": "Suite"})
+            session_ids.append(response.json()["id"])
+        sid = session_ids[-1]
+        await asyncio.to_thread(_seed_detections, sid, args.api_rows)
+
+        endpoints = {
+            "report": f"/sessions/{sid}/report",
+            "impact": f"/sessions/{sid}/impact",
+            "details": f"/sessions/{sid}/details",
+            "chat_history": f"/sessions/{sid}/chat_history",
+            "history": "/sessions/history",
+            "impact_trends": "/sessions/impact_trends",
+            "export_pdf": f"/sessions/{sid}/export_pdf",
+        }
+        n, c = args.api_requests, args.concurrency
+        report = {"sessions": args.api_sessions, "rows": args.api_rows, "requests": n, "concurrency": c}
+        for name, url in endpoints.items():
+            etag = (await client.get(url)).headers.get("etag")
+            result = {
+                "cold": await _measure(client, "GET", url, max(1, n // 10), 1, before=cold),
+                "warm": await _measure(client, "GET", url, n, c),
+            }
+            if etag:
+                result["not_modified"] = await _measure(client, "GET", url, n, c, headers={"If-None-Match": etag})
+            report[name] = result
+
+        report["chat_cached"] = await _measure(client, "POST", f"/sessions/{sid}/chat", max(1, n // 10), c,
+                                               json={"question": "How do I keep them engaged?"})
+        ok, jpeg = cv2.imencode(".jpg", make_frame(args.width, args.height, faces=3))
+        # Writes detections, so it runs last
+        report["analyze_frame"] = await _measure(client, "POST", f"/sessions/{sid}/analyze", max(1, n // 10), c,
+                                                 data={"type": "entry"}, files={"file": ("frame.jpg", jpeg.tobytes(), "image/jpeg")})
+    return report
+
+
+def bench_api(args) -> dict:
+    return asyncio.run(_bench_api(args))
+
+
+# ─── Report ───────────────────────────────────────────────────────────────────────
+def _environment(args) -> dict:
+    import cv2
+    import numpy as np
+    import backends
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "numpy": np.__version__, "opencv": cv2.__version__,
+            "face_backend": backends.FACE_BACKEND, "emotion_backend": backends.EMOTION_BACKEND,
+            "timestamp": datetime.now().isoformat(timespec="seconds")}
+
+
+def _metrics(node, prefix=""):
+    """Flatten a report to {"a.b.median_ms": value} for the comparable leaves."""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from _metrics(value, f"{prefix}{key}.")
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        name = prefix[:-1]
+        if name.endswith(("median_ms", "_per_s", ".seconds")):  # p95 of a few runs is too noisy to gate on
+            yield name, node
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """Metrics worse than the baseline by more than `tolerance` (0.25 = 25%)."""
+    old = dict(_metrics(baseline.get("results", {})))
+    regressions = []
+    for name, value in _metrics(current.get("results", {})):
+        before = old.get(name)
+        if not before or not value:
+            continue
+        higher_is_better = name.endswith("_per_s")
+        change = (before / value - 1) if higher_is_better else (value / before - 1)
+        if change > tolerance:
+            regressions.append({"metric": name, "baseline": before, "current": value, "worse_by": f"{change:.0%}"})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--stub-models", action="store_true", help="run on the stub inference backend, without model weights")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--faces", type=int, nargs="+", default=[0, 1, 5, 10, 20])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--video-seconds", type=float, default=10)
+    parser.add_argument("--video-workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--api-sessions", type=int, default=200)
+    parser.add_argument("--api-rows", type=int, default=100_000, help="detections seeded per capture type")
+    parser.add_argument("--api-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", help="also write the report to this file")
+    parser.add_argument("--compare", help="baseline report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    if args.stub_models:
+        os.environ["INFER_BACKEND"] = "stub"  # before backends is imported; worker processes inherit it
+
+    runners = {"inference": bench_inference, "stats": bench_stats, "video": bench_video, "api": bench_api}
+    report = {"environment": _environment(args), "args": vars(args), "results": {}}
+    try:
+        for section in args.sections:
+            start = time.perf_counter()
+            report["results"][section] = runners[section](args)
+            print(f"[bench] {section} done in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    finally:
+        os.unlink(_tmp_db)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), report, args.tolerance)
+        report["regressions"] = regressions
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
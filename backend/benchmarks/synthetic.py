@@ -0,0 +1,31 @@
+"""
+Synthetic inputs for the benchmarks: frames and video clips with moving
+face-like blobs, so runs are reproducible and need no recorded footage.
+"""
+import cv2
+import numpy as np
+
+
+def make_frame(width: int = 640, height: int = 480, faces: int = 3, t: int = 0, seed: int = 0) -> np.ndarray:
+    """A BGR frame with `faces` skin-toned ellipses drifting with `t`."""
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), 60, np.uint8)
+    cv2.randn(frame, 60, 12)
+    size = max(20, min(width, height) // 8)
+    for i in range(faces):
+        cx = int((rng.uniform(0.1, 0.9) * width + t * 2 * (i + 1)) % width)
+        cy = int(rng.uniform(0.2, 0.8) * height)
+        cv2.ellipse(frame, (cx, cy), (size // 2, int(size * 0.65)), 0, 0, 360, (140, 170, 220), -1)
+        cv2.circle(frame, (cx - size // 6, cy - size // 8), size // 12, (40, 40, 40), -1)
+        cv2.circle(frame, (cx + size // 6, cy - size // 8), size // 12, (40, 40, 40), -1)
+        cv2.ellipse(frame, (cx, cy + size // 4), (size // 5, size // 12), 0, 0, 180, (60, 60, 150), 2)
+    return frame
+
+
+def make_video(path: str, seconds: float = 10, fps: int = 30, width: int = 640, height: int = 480, faces: int = 3) -> str:
+    """Write a synthetic MP4 clip and return its path."""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    for t in range(int(seconds * fps)):
+        writer.write(make_frame(width, height, faces, t))
+    writer.release()
+    return path
@@ -0,0 +1,191 @@
+"""
+Shared capture-and-detect hub for webcam WebSocket viewers.
+
+One producer loop per camera grabs a frame, runs detection and encodes it
+once, then fans the serialised message out to every subscriber through a
+small per-subscriber queue. Detections are persisted once per
+(session, capture type) target, however many viewers are watching it, by a
+separate writer task: the producer only queues each batch, so a slow commit
+never holds up the frames.
+
+Viewers pick a wire format when they connect:
+
+  json    text message {"frame": <base64 JPEG>, "results", "face_count", "timestamp"}
+  binary  one binary message:
+            byte  0      protocol version (BINARY_VERSION)
+            bytes 1..4   sidecar length N, unsigned big-endian
+            bytes 5..5+N UTF-8 JSON sidecar {"results", "face_count", "timestamp"}
+            rest         the raw JPEG
+
+Each format is encoded at most once per frame, and only if some viewer uses it.
+"""
+import asyncio
+import base64
+import json
+import struct
+from datetime import datetime
+
+import attendance
+
+SUBSCRIBER_QUEUE_SIZE = 2  # a slow viewer drops stale frames instead of stalling the rest
+PERSIST_EVERY_FRAMES = 10  # batched commits, as the per-connection loop did
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+BINARY_VERSION = 1
+_BINARY_HEADER = struct.Struct(">BI")
+
+
+def encode_binary_frame(jpeg: bytes, sidecar: dict) -> bytes:
+    meta = json.dumps(sidecar, separators=(",", ":")).encode("utf-8")
+    return b"".join((_BINARY_HEADER.pack(BINARY_VERSION, len(meta)), meta, jpeg))
+
+
+def decode_binary_frame(message: bytes) -> tuple:
+    """Inverse of encode_binary_frame: returns (jpeg, sidecar)."""
+    version, length = _BINARY_HEADER.unpack_from(message)
+    if version != BINARY_VERSION:
+        raise ValueError(f"Unsupported frame protocol version {version}")
+    start = _BINARY_HEADER.size
+    return message[start + length:], json.loads(message[start:start + length])
+
+
+class Subscriber:
+    def __init__(self, session_id: str, capture_type: str, protocol: str = PROTOCOL_JSON):
+        self.session_id = session_id
+        self.capture_type = capture_type
+        self.protocol = protocol
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    @property
+    def target(self):
+        return (self.session_id, self.capture_type)
+
+    def offer(self, message):
+        """Enqueue without blocking; the oldest frame is dropped when full."""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(message)
+
+
+class WebcamHub:
+    """Single producer for one camera, many WebSocket consumers."""
+
+    def __init__(self, manager, persist):
+        # persist(session_id, capture_type, frames, persons) saves and commits; runs in the executor
+        self._manager = manager
+        self._persist = persist
+        self._subscribers = set()
+        self._pending = {}  # (session_id, capture_type) -> [(timestamp, results)]
+        # (session_id, capture_type) -> PersonCounter for the current viewing, so
+        # track ids are counted across flushes but not across camera restarts
+        self._persons = {}
+        self._producer = None
+        self._writes = asyncio.Queue()  # (target, frames, persons) batches, saved in order
+        self._writer = None
+        self._lock = asyncio.Lock()
+        self.frames_produced = 0
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    async def subscribe(self, session_id: str, capture_type: str, protocol: str = PROTOCOL_JSON) -> Subscriber:
+        loop = asyncio.get_running_loop()
+        subscriber = Subscriber(session_id, capture_type, protocol)
+        async with self._lock:
+            if not self._subscribers:
+                await loop.run_in_executor(None, self._manager.start)
+                self._producer = asyncio.create_task(self._produce())
+                if self._writer is None:
+                    self._writer = asyncio.create_task(self._write_loop())
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            self._subscribers.discard(subscriber)
+            if not any(s.target == subscriber.target for s in self._subscribers):
+                self._flush(subscriber.target)
+                self._persons.pop(subscriber.target, None)
+            if self._subscribers:
+                return
+            producer, self._producer = self._producer, None
+            if producer:
+                producer.cancel()
+                try:
+                    await producer
+                except (asyncio.CancelledError, Exception):
+                    pass
+            for target in list(self._pending):
+                self._flush(target)
+            self._persons.clear()
+            # Everything watched so far is saved before the camera goes
+            await self._writes.join()
+            writer, self._writer = self._writer, None
+            if writer:
+                writer.cancel()
+            await loop.run_in_executor(None, self._manager.stop)
+
+    def _flush(self, target):
+        """Queue the target's pending frames for the writer task."""
+        frames = self._pending.pop(target, None)
+        if not frames:
+            return
+        persons = self._persons.setdefault(target, attendance.PersonCounter())
+        self._writes.put_nowait((target, frames, persons))
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            target, frames, persons = await self._writes.get()
+            try:
+                await loop.run_in_executor(None, self._persist, *target, frames, persons)
+            except Exception as e:
+                print(f"[WS] Failed to persist detections for {target}: {e}")
+            finally:
+                self._writes.task_done()
+
+    async def _produce(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                jpeg, results = await loop.run_in_executor(None, self._manager.capture_and_detect_jpeg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[WS] Capture error: {e}")
+                await asyncio.sleep(0.1)
+                continue
+
+            if jpeg is None:
+                await asyncio.sleep(0.1)
+                continue
+
+            self.frames_produced += 1
+            timestamp = datetime.now().isoformat()
+
+            # Persist once per watched (session, type), not once per viewer
+            if results:
+                for target in {s.target for s in self._subscribers}:
+                    frames = self._pending.setdefault(target, [])
+                    frames.append((timestamp, results))
+                    if len(frames) >= PERSIST_EVERY_FRAMES:
+                        self._flush(target)
+
+            # Serialise each format once; every viewer of it gets the same message
+            sidecar = {"results": results, "face_count": len(results), "timestamp": timestamp}
+            subscribers = list(self._subscribers)
+            messages = {}
+            if any(s.protocol == PROTOCOL_BINARY for s in subscribers):
+                messages[PROTOCOL_BINARY] = encode_binary_frame(jpeg, sidecar)
+            if any(s.protocol != PROTOCOL_BINARY for s in subscribers):
+                messages[PROTOCOL_JSON] = json.dumps({"frame": base64.b64encode(jpeg).decode("utf-8"), **sidecar})
+            for subscriber in subscribers:
+                subscriber.offer(messages[PROTOCOL_BINARY if subscriber.protocol == PROTOCOL_BINARY else PROTOCOL_JSON])
+
+            await asyncio.sleep(0.01)
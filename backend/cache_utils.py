@@ -1,65 +1,224 @@
 """
 Caching utilities for emotion detection models and session data
 Improves performance by avoiding redundant model loading and calculations
+
+`Cache` is a bounded LRU + TTL map that is safe to share between the event
+loop and the threadpool. Entries carry tags (session ids) and are dropped when
+a transaction that wrote rows for one of those sessions commits: writers call
+`mark_written(db, session_id)` and the commit hooks below do the rest. The same
+hooks bump each written session's `data_version`, which the polled endpoints
+turn into ETags.
+
+Caches are per process, and invalidation only reaches the committing process.
+So anything that must be current across several server workers is checked
+against `data_version` read from the database. ETags are, and so are the
+report, impact and PDF payloads, whose keys include the version. Other entries
+may be up to their TTL stale in other workers.
 """
+import os
+import threading
 import time
+from collections import OrderedDict
 from functools import wraps
-from typing import Any, Callable, Dict, Optional
+from typing import Any, Callable, Hashable, Iterable
+
+from sqlalchemy import event, func, update
+from sqlalchemy.orm import Session
+
+import models
+
+ANALYTICS_CACHE_TTL = float(os.getenv("ANALYTICS_CACHE_TTL", "60"))
+ANALYTICS_CACHE_SIZE = int(os.getenv("ANALYTICS_CACHE_SIZE", "1024"))
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "3600"))
+REPORT_CACHE_SIZE = int(os.getenv("REPORT_CACHE_SIZE", "64"))
+AI_CACHE_TTL = float(os.getenv("AI_CACHE_TTL", "3600"))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", "512"))
+
+# Tag for results that depend on the list of sessions itself (history pages)
+SESSION_LIST_TAG = "__sessions__"
+
+_MISSING = object()
+
 
 class Cache:
-    """Simple in-memory cache with TTL support"""
-    def __init__(self, ttl: int = 300):  # 5 minutes default
+    """LRU cache with TTL, a size bound and tag-based invalidation"""
+    def __init__(self, ttl: float = 300, max_size: int = 1024):  # 5 minutes default
         self.ttl = ttl
-        self.data: Dict[str, tuple] = {}  # {key: (value, expiry_time)}
+        self.max_size = max(1, max_size)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()  # {key: (value, expiry_time, tags)}
+        self._tags: dict = {}  # {tag: {keys}}
+        self._lock = threading.Lock()
+        # Bumped by every invalidation, so a value computed across one is not stored
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
 
-    def set(self, key: str, value: Any) -> None:
-        """Store value with TTL"""
-        self.data[key] = (value, time.time() + self.ttl)
+    def set(self, key: Hashable, value: Any, tags: Iterable[Hashable] = (), generation: int = None) -> bool:
+        """Store value with TTL. Skipped (False) if anything was invalidated
+        since `generation` was read, because the value may predate that write."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return False
+            self._remove(key)
+            tags = frozenset(tags)
+            self._data[key] = (value, time.monotonic() + self.ttl, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_size:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+            return True
 
-    def get(self, key: str) -> Optional[Any]:
-        """Retrieve value if not expired"""
-        if key in self.data:
-            value, expiry = self.data[key]
-            if time.time() < expiry:
-                return value
-            else:
-                del self.data[key]
-        return None
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Retrieve value if not expired. `None` and falsy values are cached like any other."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if time.monotonic() < entry[1]:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def invalidate(self, *tags: Hashable) -> int:
+        """Drop every entry carrying one of `tags`. Returns how many were dropped."""
+        with self._lock:
+            self.generation += 1
+            keys = set()
+            for tag in tags:
+                keys |= self._tags.get(tag, set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
 
     def clear(self) -> None:
         """Clear all cache"""
-        self.data.clear()
+        with self._lock:
+            self.generation += 1
+            self._data.clear()
+            self._tags.clear()
 
     def cleanup_expired(self) -> None:
         """Remove expired entries"""
-        current_time = time.time()
-        expired_keys = [k for k, (_, expiry) in self.data.items() if current_time > expiry]
-        for k in expired_keys:
-            del self.data[k]
+        current_time = time.monotonic()
+        with self._lock:
+            for k in [k for k, (_, expiry, _) in self._data.items() if current_time > expiry]:
+                self._remove(k)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._data), "max_size": self.max_size, "ttl": self.ttl, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "invalidations": self.invalidations}
+
+    def _remove(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
 
 
 # Global caches
 model_cache = Cache(ttl=3600)  # 1 hour TTL for models
-session_stats_cache = Cache(ttl=60)  # 1 minute TTL for stats
+session_stats_cache = Cache(ttl=ANALYTICS_CACHE_TTL, max_size=ANALYTICS_CACHE_SIZE)  # report/history payloads
 detector_cache = Cache(ttl=3600)  # 1 hour TTL for face detectors
+report_pdf_cache = Cache(ttl=REPORT_CACHE_TTL, max_size=REPORT_CACHE_SIZE)  # {(session_id, data_version): pdf bytes}
+ai_response_cache = Cache(ttl=AI_CACHE_TTL, max_size=AI_CACHE_SIZE)  # {(question, stats context): answer}
 
 
-def cached(cache_obj: Cache, ttl: int = None):
-    """Decorator for caching function results"""
+def _make_key(func: Callable, args: tuple, kwargs: dict) -> tuple:
+    return (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+
+
+def cached(cache_obj: Cache, tags: Callable = None):
+    """Decorator for caching function results.
+    Arguments must be hashable; `tags(*args, **kwargs)` names the entry's tags.
+    """
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
-            # Generate cache key from function name and arguments
-            cache_key = f"{func.__name__}:{str(args)}:{str(kwargs)}"
-            
-            # Try to get from cache
-            cached_value = cache_obj.get(cache_key)
-            if cached_value is not None:
-                return cached_value
-            
-            # Execute function and cache result
+            cache_key = _make_key(func, args, kwargs)
+            value = cache_obj.get(cache_key, _MISSING)
+            if value is not _MISSING:
+                return value
+            generation = cache_obj.generation
             result = func(*args, **kwargs)
-            cache_obj.set(cache_key, result)
+            cache_obj.set(cache_key, result, tags(*args, **kwargs) if tags else (), generation)
             return result
         return wrapper
     return decorator
+
+
+async def cached_async(cache_obj: Cache, key: Hashable, compute: Callable, tags=()) -> Any:
+    """Return the cached value for `key`, or await `compute()` and cache it.
+    `tags` is an iterable of tags or a callable that derives them from the value.
+    """
+    value = cache_obj.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    generation = cache_obj.generation
+    value = await compute()
+    cache_obj.set(key, value, tags(value) if callable(tags) else tags, generation)
+    return value
+
+
+# ─── Write invalidation ─────────────────────────────────────────────────────────
+_commit_listeners = []
+
+
+def on_commit(listener: Callable) -> None:
+    """Call `listener(tags)` after every commit that wrote tagged rows, from the committing thread."""
+    _commit_listeners.append(listener)
+
+
+def mark_written(db, *tags: Hashable) -> None:
+    """Record that this DB session's transaction wrote rows for `tags` (session ids).
+    The cached entries are invalidated once the transaction commits.
+    """
+    db = getattr(db, "sync_session", db)  # AsyncSession -> its Session
+    db.info.setdefault("cache_tags", set()).update(tags)
+
+
+def _written_session_ids(db) -> list:
+    return [tag for tag in db.info.get("cache_tags", ()) if tag != SESSION_LIST_TAG]
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_versions(db):
+    if db.in_nested_transaction():
+        return
+    session_ids = _written_session_ids(db)
+    if session_ids:
+        S = models.Session
+        db.execute(
+            update(S).where(S.id.in_(session_ids)).values(data_version=func.coalesce(S.data_version, 0) + 1),
+            execution_options={"synchronize_session": False},
+        )
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_written(db):
+    if db.in_nested_transaction():
+        return  # a SAVEPOINT was released; wait for the outer commit
+    tags = db.info.pop("cache_tags", None)
+    if tags:
+        session_stats_cache.invalidate(*tags)
+        report_pdf_cache.invalidate(*tags)  # keyed by version, so this only frees memory early
+        for listener in _commit_listeners:
+            listener(tags)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_written(db, previous_transaction):
+    # The whole transaction was rolled back, so its rows were never written
+    if previous_transaction.parent is None:
+        db.info.pop("cache_tags", None)
@@ -0,0 +1,65 @@
+"""
+Shared test setup: the stub inference backends (no model weights) and a
+throwaway SQLite database, job and upload directory, configured before any
+backend module reads its settings. Run from backend/:
+    python -m pytest
+"""
+import os
+import shutil
+import tempfile
+import uuid
+
+_ROOT = tempfile.mkdtemp(prefix="behaviour-tests-")
+os.environ.setdefault("INFER_BACKEND", "stub")
+os.environ.setdefault("AI_COACH_LLM", "fake")
+os.environ.setdefault("INGEST_CHUNK_ROWS", "10")  # small chunks, so a job commits detections mid-run
+os.environ["DB_URL"] = f"sqlite:///{_ROOT}/test.db"
+os.environ["JOB_DIR"] = os.path.join(_ROOT, "jobs")
+os.environ["UPLOAD_DIR"] = os.path.join(_ROOT, "uploads")
+
+import pytest
+
+import database, migrate, models
+
+collect_ignore = ["test_ws.py"]  # a manual script against a running server
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    models.Base.metadata.create_all(bind=database.engine)
+    migrate.upgrade(database.engine)
+    os.makedirs(os.environ["JOB_DIR"], exist_ok=True)
+    yield
+    database.engine.dispose()
+    shutil.rmtree(_ROOT, ignore_errors=True)
+
+
+@pytest.fixture(scope="module")
+def client():
+    """The API, with its startup (the video job workers) and shutdown run."""
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def session_id() -> str:
+    """A new classroom session row."""
+    db = database.SessionLocal()
+    try:
+        session = models.Session(id=str(uuid.uuid4()), name="Test", class_name="Class", instructor="Teacher")
+        db.add(session)
+        db.commit()
+        return session.id
+    finally:
+        db.close()
+
+
+def detection_count(session_id: str, **filters) -> int:
+    """Raw emotion_detections rows of a session."""
+    db = database.SessionLocal()
+    try:
+        return db.query(models.EmotionData).filter_by(session_id=session_id, **filters).count()
+    finally:
+        db.close()
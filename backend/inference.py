@@ -0,0 +1,168 @@
+"""
+Cross-request inference scheduling.
+
+`BatchScheduler` coalesces emotion-recognition requests from concurrent callers
+(upload endpoints, the webcam loop, video jobs) into one batched model call
+and hands each caller its slice back through a future. `ModelPool` holds a few
+face-detector replicas so detection runs in parallel instead of behind a
+single process-wide lock.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+
+class ModelPool:
+    """Fixed set of model replicas checked out one caller at a time."""
+
+    def __init__(self, factory, size: int):
+        self.size = max(1, size)
+        self._idle = queue.Queue()
+        for _ in range(self.size):
+            self._idle.put(factory())
+        self._lock = threading.Lock()
+        self._acquired = 0
+        self._waited = 0
+
+    @contextmanager
+    def acquire(self):
+        try:
+            model = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                self._waited += 1
+            model = self._idle.get()
+        with self._lock:
+            self._acquired += 1
+        try:
+            yield model
+        finally:
+            self._idle.put(model)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"replicas": self.size, "acquired": self._acquired, "waited": self._waited}
+
+
+class BatchScheduler:
+    """Micro-batches `predict_fn` calls across threads.
+
+    `predict_fn(items) -> outputs` must return one output per input item.
+    A batch is dispatched when it reaches `max_batch` items, when `max_wait_ms`
+    has passed since its first request, or as soon as every registered caller
+    (see `caller()`) has submitted, so a lone caller never waits for the window.
+    """
+
+    def __init__(self, predict_fn, max_batch: int = 32, max_wait_ms: float = 5.0, name: str = "batch"):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._predict_fn = predict_fn
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self._callers = 0
+        self._requests = 0
+        self._items = 0
+        self._batches = 0
+        self._largest_batch = 0
+        self._queue_wait = 0.0
+        self._infer_time = 0.0
+
+    @contextmanager
+    def caller(self):
+        """Mark a caller that is about to submit, so the collector knows whom to wait for."""
+        with self._stats_lock:
+            self._callers += 1
+        try:
+            yield self
+        finally:
+            with self._stats_lock:
+                self._callers -= 1
+
+    def submit(self, items: list) -> Future:
+        future = Future()
+        if not items:
+            future.set_result([])
+            return future
+        self._ensure_started()
+        self._queue.put((list(items), future, time.perf_counter()))
+        return future
+
+    def predict(self, items: list) -> list:
+        return self.submit(items).result()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-scheduler", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while size < self.max_batch:
+            with self._stats_lock:
+                everyone_in = len(batch) >= self._callers
+            if everyone_in and self._queue.empty():
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for request_items, _, _ in batch for item in request_items]
+            started = time.perf_counter()
+            try:
+                outputs = self._predict_fn(items)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.perf_counter()
+
+            offset = 0
+            for request_items, future, _ in batch:
+                future.set_result(outputs[offset:offset + len(request_items)])
+                offset += len(request_items)
+
+            with self._stats_lock:
+                self._requests += len(batch)
+                self._items += len(items)
+                self._batches += 1
+                self._largest_batch = max(self._largest_batch, len(items))
+                self._queue_wait += sum(started - queued for _, _, queued in batch)
+                self._infer_time += finished - started
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = self._batches or 1
+            requests = self._requests or 1
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "requests": self._requests,
+                "items": self._items,
+                "batches": self._batches,
+                "avg_batch_size": round(self._items / batches, 2),
+                "largest_batch": self._largest_batch,
+                "avg_queue_wait_ms": round(self._queue_wait / requests * 1000, 2),
+                "avg_infer_ms": round(self._infer_time / batches * 1000, 2),
+                "queued": self._queue.qsize(),
+            }
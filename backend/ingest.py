@@ -0,0 +1,152 @@
+"""
+Bulk ingestion of emotion detections.
+
+Detections are written with a Core `insert()` executemany per chunk, or with
+COPY ... FROM STDIN on PostgreSQL (psycopg2), instead of one ORM object per
+face going through the unit-of-work flush. `DetectionWriter` buffers rows for
+one (session, capture type) and writes them every `chunk_rows`, so long videos
+are persisted while they are still being analysed.
+"""
+import csv
+import io
+import itertools
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+import models, aggregates, attendance, cache_utils
+
+INGEST_CHUNK_ROWS = int(os.getenv("INGEST_CHUNK_ROWS", "2000"))
+POSTGRES_COPY = os.getenv("POSTGRES_COPY", "1") == "1"
+
+_COLUMNS = ("session_id", "type", "emotion", "bbox_x", "bbox_y", "bbox_w", "bbox_h", "timestamp_us", "person_id",
+            "job_number")
+
+
+def detection_rows(session_id: str, capture_type: str, timestamp: str, results, job_number: int = None) -> list:
+    """Compact `emotion_detections` rows for one frame's results."""
+    type_code = models.CAPTURE_TYPE_CODES[capture_type]
+    timestamp_us = models.timestamp_to_us(timestamp)
+    rows = []
+    for r in results:
+        x, y, w, h = (int(v) for v in r['bbox'])
+        rows.append({
+            "session_id": session_id,
+            "type": type_code,
+            "emotion": models.EMOTION_CODES.get(r['emotion']),
+            "bbox_x": x, "bbox_y": y, "bbox_w": w, "bbox_h": h,
+            "timestamp_us": timestamp_us,
+            "person_id": r.get('person_id', -1),
+            "job_number": job_number,
+        })
+    return rows
+
+
+def _use_copy(db) -> bool:
+    return POSTGRES_COPY and db.get_bind().dialect.driver == "psycopg2"
+
+
+def _copy_rows(db, rows: list) -> None:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # An unquoted empty field is NULL in COPY's CSV format
+        writer.writerow(["" if row.get(c) is None else row[c] for c in _COLUMNS])
+    buffer.seek(0)
+    # The session's own connection, so the rows share its transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY {models.EmotionData.__tablename__} ({', '.join(_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            buffer,
+        )
+    finally:
+        cursor.close()
+
+
+def insert_rows(db, rows: list, method: str = None) -> int:
+    """Write `emotion_detections` rows in one statement. Does not commit.
+    `method` is "copy" or "executemany" (default: COPY on psycopg2 if enabled).
+    """
+    if not rows:
+        return 0
+    if method is None:
+        method = "copy" if _use_copy(db) else "executemany"
+    if method == "copy":
+        _copy_rows(db, rows)
+    else:
+        db.execute(insert(models.EmotionData.__table__), rows)
+    return len(rows)
+
+
+class DetectionWriter:
+    """Chunked writer for one (session, capture type).
+
+    `add()` frames in capture order, then `close()` to write the remainder.
+    Each chunk lands with its aggregate update; the caller commits, unless
+    `commit` is set, in which case every chunk is committed as it is written
+    (a long video then never holds the write lock for its whole analysis).
+    `job_number` tags the rows of a background job, so `discard_job()` can
+    remove them again if the job does not finish.
+    `persons` is the stream's attendance.PersonCounter; pass the same one to
+    every writer of a stream that outlives a writer (the webcam hub does).
+    """
+
+    def __init__(self, db, session_id: str, capture_type: str, chunk_rows: int = None, method: str = None,
+                 persons: attendance.PersonCounter = None, commit: bool = False, job_number: int = None):
+        self.db = db
+        self.session_id = session_id
+        self.capture_type = capture_type
+        self.chunk_rows = max(1, chunk_rows or INGEST_CHUNK_ROWS)
+        self.method = method
+        self.persons = persons or attendance.PersonCounter()
+        self.commit = commit
+        self.job_number = job_number
+        self.rows_written = 0
+        self._rows = []
+        self._frames = []
+
+    def add(self, timestamp: str, results) -> None:
+        if not results:
+            return
+        self._rows.extend(detection_rows(self.session_id, self.capture_type, timestamp, results, self.job_number))
+        self._frames.append((timestamp, results))
+        self.persons.observe(results)
+        if len(self._rows) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._frames:
+            return
+        cache_utils.mark_written(self.db, self.session_id)
+        self.rows_written += insert_rows(self.db, self._rows, self.method)
+        aggregates.record_frames(self.db, self.session_id, self.capture_type, self._frames, self.persons.persons)
+        self._rows, self._frames = [], []
+        if self.commit:
+            self.db.commit()
+
+    def close(self) -> int:
+        """Write anything still buffered and return the total rows written."""
+        self.flush()
+        return self.rows_written
+
+
+def discard_job(db, session_id: str, job_number: int) -> None:
+    """Delete the rows a background job wrote for a session and take them out of
+    the session aggregates. Does not commit."""
+    aggregates.discard_rows(db, session_id, models.EmotionData.job_number == job_number)
+
+
+def video_frame_writer(db, session_id: str, capture_type: str, commit: bool = False, job_number: int = None):
+    """Chunked writer plus an `on_frame` callback for the video analysers.
+    Frames get distinct timestamps 100ms apart; attendance comes from the
+    writer's track-id counter, not from these timestamps.
+    """
+    writer = DetectionWriter(db, session_id, capture_type, commit=commit, job_number=job_number)
+    base_time = datetime.now()
+    frame_no = itertools.count()
+
+    def on_frame(frame_results):
+        writer.add((base_time + timedelta(milliseconds=next(frame_no) * 100)).isoformat(), frame_results)
+    return writer, on_frame
@@ -0,0 +1,498 @@
+"""
+Background video analysis jobs.
+
+An upload to /sessions/{id}/video_jobs is spooled into JOB_DIR and recorded as a
+`video_jobs` row, and the request returns the job id straight away. Each API
+process runs a `JobQueue` of JOB_WORKERS dedicated threads that claim queued
+rows (highest priority, then oldest) with a conditional UPDATE, so several
+processes can share the queue through the database without a broker. The
+threads are not the request threadpool, and on Linux they run at a lower
+scheduling priority (JOB_NICE), so a long recording does not starve live
+webcam frames or API requests.
+
+A job's detections are committed chunk by chunk as it runs, so it never holds
+the write lock (SQLite has only one) for a whole video. They are tagged with the
+job's number. If an attempt does not finish (it failed, was cancelled or
+interrupted by a shutdown, or its process died), its rows are deleted again and
+taken back out of the session aggregates, so only finished jobs leave detections
+behind.
+`running` rows whose owning process is gone are queued again, up to
+JOB_MAX_ATTEMPTS times.
+The process running a job keeps its progress and recent detections in memory
+for GET /video_jobs/{id} and the /events stream. Progress is also written to
+the row every JOB_PROGRESS_SECONDS, so every API process can report it.
+Finished jobs and their files are removed after JOB_RETENTION_HOURS.
+"""
+import contextlib
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+
+import psutil
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+
+import database, ingest, models, sampling, services, uploads
+
+JOB_DIR              = os.getenv("JOB_DIR", "video_jobs")  # uploads and annotated MP4s; shared storage across hosts
+JOB_WORKERS          = int(os.getenv("JOB_WORKERS", "1"))  # jobs run at once per API process
+JOB_NICE             = int(os.getenv("JOB_NICE", "10"))    # niceness added to job threads (Linux); 0 = none
+JOB_POLL_SECONDS     = float(os.getenv("JOB_POLL_SECONDS", "5"))  # idle workers look for jobs from other processes
+JOB_PROGRESS_SECONDS = float(os.getenv("JOB_PROGRESS_SECONDS", "2"))
+JOB_MAX_ATTEMPTS     = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_HOURS  = float(os.getenv("JOB_RETENTION_HOURS", "24"))
+JOB_STREAM_FRAMES    = int(os.getenv("JOB_STREAM_FRAMES", "1000"))  # recent frames kept for /events clients
+_FINISHED_RUNS = 16  # finished jobs whose last frames /events clients may still collect
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = models.JOB_STATUSES
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+def _now() -> str:
+    # Fixed width, so stored timestamps compare correctly as strings
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+def _lower_priority() -> None:
+    """Renice the calling thread by JOB_NICE (Linux schedules threads individually)."""
+    if JOB_NICE > 0 and hasattr(os, "setpriority"):
+        try:
+            tid = threading.get_native_id()
+            os.setpriority(os.PRIO_PROCESS, tid, min(19, os.getpriority(os.PRIO_PROCESS, tid) + JOB_NICE))
+        except OSError:
+            pass
+
+
+def _remove(path: str) -> None:
+    if path and os.path.exists(path):
+        os.unlink(path)
+
+
+def _remove_input(job: models.VideoJob) -> None:
+    """Delete a job's input, unless a chunked upload (uploads.py) owns the file."""
+    if not json.loads(job.options or "{}").get("upload_id"):
+        _remove(job.input_path)
+
+
+class _Stopped(Exception):
+    """Raised from the progress callback to abandon a cancelled or interrupted job."""
+
+
+class _Run:
+    """Progress and recent detections of a job running in this process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.saved = self.started
+        self.frames_done = 0
+        self.frames_total = 0
+        self.frames_detected = 0
+        self.recent = deque(maxlen=JOB_STREAM_FRAMES)  # frame results; the oldest is number frames_detected - len
+        self.stop = None  # CANCELLED, or QUEUED when the process shuts down
+
+    def add(self, frame_results: list) -> None:
+        with self.lock:
+            self.recent.append(frame_results)
+            self.frames_detected += 1
+
+    def since(self, cursor: int):
+        """(next cursor, frames after `cursor`, frames dropped before the client read them)."""
+        with self.lock:
+            first = self.frames_detected - len(self.recent)
+            start = max(cursor, first)
+            return self.frames_detected, list(self.recent)[start - first:], start - cursor
+
+    def eta_seconds(self):
+        if not self.frames_done or self.frames_total <= self.frames_done:
+            return None
+        rate = self.frames_done / (time.monotonic() - self.started)
+        return round((self.frames_total - self.frames_done) / rate, 1)
+
+
+class JobQueue:
+    """The video job workers of this process. `start()` on app startup, `stop()` on shutdown."""
+
+    def __init__(self, workers: int = None):
+        self.workers = JOB_WORKERS if workers is None else workers
+        self.owner = None
+        self._runs = {}
+        self._finished_runs = OrderedDict()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._maintained = 0.0
+
+    # ─── Lifecycle ───────────────────────────────────────────────────────────────
+    def start(self) -> None:
+        if self._threads:
+            return
+        os.makedirs(JOB_DIR, exist_ok=True)
+        # Set here, not in __init__: servers may fork workers after importing the app
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"video-job-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 10) -> None:
+        """Stop the workers. Running jobs go back to the queue for the next start."""
+        self._stopping.set()
+        with self._lock:
+            for run in self._runs.values():
+                run.stop = QUEUED
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    # ─── API ─────────────────────────────────────────────────────────────────────
+    def submit(self, session_id: str, capture_type: str, kind: str, upload_path: str,
+               options: dict = None, priority: int = 0, move: bool = True) -> str:
+        """Queue a job for an upload spooled into JOB_DIR, which the job then owns.
+        With move=False the file stays where it is (a chunked upload, whose
+        "upload_id" option lets the job start before the file is complete).
+        Returns the job id."""
+        job_id = str(uuid.uuid4())
+        input_path = upload_path
+        if move:
+            input_path = os.path.join(JOB_DIR, job_id + os.path.splitext(upload_path)[1])
+            os.replace(upload_path, input_path)
+        db = database.SessionLocal()
+        try:
+            db.add(models.VideoJob(
+                id=job_id, session_id=session_id, type=capture_type, kind=kind,
+                options=json.dumps(options or {}), priority=priority, status=QUEUED,
+                input_path=input_path, created_at=_now(),
+            ))
+            db.commit()
+        except BaseException:
+            if move:
+                _remove(input_path)
+            raise
+        finally:
+            db.close()
+        self._wake.set()
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; False if it is unknown or already finished.
+        A job running in this process stops at its next frame; one running in
+        another process is discarded when it next saves progress or finishes."""
+        with self._lock:
+            run = self._runs.get(job_id)
+            if run is not None:
+                run.stop = CANCELLED
+                return True
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            job = db.get(J, job_id)
+            if job is None or job.status in FINISHED:
+                return False
+            cancelled = db.execute(
+                update(J).where(J.id == job_id, J.status == job.status)
+                .values(status=CANCELLED, finished_at=_now())
+            ).rowcount
+            db.commit()
+            if cancelled and job.status == QUEUED:
+                _remove_input(job)
+            return bool(cancelled)
+        finally:
+            db.close()
+
+    def delete(self, job_id: str) -> bool:
+        """Remove a finished job and its files; False if it is unknown or still active."""
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            job = db.get(J, job_id)
+            if job is None or job.status not in FINISHED:
+                return False
+            _remove_input(job)
+            _remove(job.output_path)
+            db.delete(job)
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    def state(self, job_id: str):
+        """The job as a dict for the API, or None if there is no such job."""
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.VideoJob, job_id)
+            return self._describe(job) if job is not None else None
+        finally:
+            db.close()
+
+    def session_jobs(self, session_id: str, limit: int = 50) -> list:
+        """A session's jobs, newest first."""
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            jobs = db.scalars(select(J).where(J.session_id == session_id).order_by(J.created_at.desc()).limit(limit))
+            return [self._describe(job) for job in jobs]
+        finally:
+            db.close()
+
+    def frames_since(self, job_id: str, cursor: int):
+        """(next cursor, new frame results, frames skipped) for a job running (or
+        just finished) in this process, else None."""
+        run = self._runs.get(job_id) or self._finished_runs.get(job_id)
+        return run.since(cursor) if run is not None else None
+
+    def output_path(self, job_id: str):
+        """The annotated MP4 of a finished annotate job, or None."""
+        db = database.SessionLocal()
+        try:
+            job = db.get(models.VideoJob, job_id)
+            return job.output_path if job is not None and job.status == DONE else None
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            counts = dict(db.execute(select(J.status, func.count()).group_by(J.status)).all())
+        finally:
+            db.close()
+        return {"workers": self.workers, "running_here": len(self._runs),
+                **{status: counts.get(status, 0) for status in models.JOB_STATUSES}}
+
+    def _describe(self, job: models.VideoJob) -> dict:
+        frames_done, frames_total, frames_detected = job.frames_done, job.frames_total, job.frames_detected
+        eta = None
+        run = self._runs.get(job.id)
+        if run is not None and job.status == RUNNING:
+            frames_done, frames_total, frames_detected = run.frames_done, run.frames_total, run.frames_detected
+            eta = run.eta_seconds()
+        return {
+            "id": job.id, "session_id": job.session_id, "type": job.type, "kind": job.kind,
+            "options": json.loads(job.options or "{}"), "priority": job.priority,
+            "status": job.status, "attempts": job.attempts, "error": job.error,
+            "progress": {
+                "frames_done": frames_done or 0,
+                "frames_total": frames_total or 0,
+                "percent": round(100 * frames_done / frames_total, 1) if frames_total else None,
+                "eta_seconds": eta,
+            },
+            "frames_detected": frames_detected or 0,
+            "detections": job.detections or 0,
+            "has_video": job.status == DONE and bool(job.output_path),
+            "created_at": job.created_at, "started_at": job.started_at, "finished_at": job.finished_at,
+        }
+
+    # ─── Workers ─────────────────────────────────────────────────────────────────
+    def _work(self) -> None:
+        _lower_priority()
+        while not self._stopping.is_set():
+            job_id = None
+            try:
+                self._maintain()
+                job_id = self._claim()
+            except Exception as e:  # e.g. SQLite busy while another job holds the write lock
+                print(f"[Jobs] Could not poll the queue: {e}")
+            if job_id is None:
+                self._wake.wait(JOB_POLL_SECONDS)
+                self._wake.clear()
+                continue
+            try:
+                self._execute(job_id)
+            except Exception as e:  # keep the worker alive; _maintain recovers the job's row
+                print(f"[Jobs] Worker error running job {job_id}: {e}")
+
+    def _claim(self):
+        """Take the next queued job for this process; its id, or None if there is none."""
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            candidates = db.scalars(
+                select(J.id).where(J.status == QUEUED).order_by(J.priority.desc(), J.created_at).limit(self.workers + 1)
+            ).all()
+            for job_id in candidates:
+                # Registered first, so maintenance never sees our running row without its run
+                with self._lock:
+                    if self._stopping.is_set():
+                        return None
+                    self._runs[job_id] = _Run()
+                # The first claim numbers the job; a clash with another process's claim just skips it for now
+                next_number = select(func.coalesce(func.max(J.number), 0) + 1).scalar_subquery()
+                try:
+                    claimed = db.execute(
+                        update(J).where(J.id == job_id, J.status == QUEUED)
+                        .values(status=RUNNING, owner=self.owner, attempts=J.attempts + 1, started_at=_now(),
+                                frames_done=0, frames_detected=0, error=None,
+                                number=func.coalesce(J.number, next_number))
+                    ).rowcount
+                    db.commit()
+                except IntegrityError:
+                    db.rollback()
+                    claimed = 0
+                if claimed:
+                    return job_id
+                with self._lock:
+                    self._runs.pop(job_id, None)
+            return None
+        finally:
+            db.close()
+
+    def _finish(self, db, job_id: str, **values) -> bool:
+        """Conditionally move our running job to its final (or queued) state. Caller commits."""
+        J = models.VideoJob
+        return bool(db.execute(
+            update(J).where(J.id == job_id, J.status == RUNNING, J.owner == self.owner).values(**values)
+        ).rowcount)
+
+    def _discard_detections(self, db, job) -> None:
+        """Delete what an unfinished attempt of `job` (None if it never loaded) committed. Caller commits."""
+        if job is not None and job.number is not None:
+            ingest.discard_job(db, job.session_id, job.number)
+
+    def _abandon(self, db, job, job_id: str, **values) -> bool:
+        """Discard an unfinished attempt's detections and move the job to `values`
+        (if any), in one commit. If that fails too (e.g. SQLite busy), the row is
+        left running: once the run is gone, _maintain requeues it and discards again."""
+        try:
+            self._discard_detections(db, job)
+            if values:
+                self._finish(db, job_id, **values)
+            db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            print(f"[Jobs] Could not clean up job {job_id}, leaving it for recovery: {e}")
+            return False
+
+    def _save_progress(self, job_id: str, run: _Run) -> None:
+        J = models.VideoJob
+        db = database.SessionLocal()
+        try:
+            saved = db.execute(
+                update(J).where(J.id == job_id, J.status == RUNNING, J.owner == self.owner)
+                .values(frames_done=run.frames_done, frames_total=run.frames_total, frames_detected=run.frames_detected)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if not saved:  # cancelled from another process
+            run.stop = CANCELLED
+
+    def _execute(self, job_id: str) -> None:
+        run = self._runs[job_id]
+        output_path = os.path.join(JOB_DIR, f"{job_id}.annotated.mp4")
+        db = database.SessionLocal()
+        job = None
+        try:
+            job = db.get(models.VideoJob, job_id)
+            kind, input_path = job.kind, job.input_path
+            options = json.loads(job.options or "{}")
+            # A chunked upload keeps its file, and may still be receiving it
+            upload_id = options.get("upload_id")
+            # Committed per chunk; discarded below unless the job finishes
+            writer, write_frame = ingest.video_frame_writer(db, job.session_id, job.type, commit=True,
+                                                            job_number=job.number)
+
+            def on_frame(frame_results):
+                write_frame(frame_results)
+                run.add(frame_results)
+
+            def on_progress(frames_done, frames_total):
+                run.frames_done, run.frames_total = frames_done, frames_total
+                if run.stop:
+                    raise _Stopped()
+                if time.monotonic() - run.saved >= JOB_PROGRESS_SECONDS:
+                    run.saved = time.monotonic()
+                    self._save_progress(job_id, run)
+
+            analysis = dict(on_frame=on_frame, on_progress=on_progress, mode=options.get("mode"),
+                            policy=sampling.SamplingPolicy(options.get("sample_policy"), options.get("sample_fps")))
+            source = uploads.video_source(upload_id, input_path) if upload_id else contextlib.nullcontext(input_path)
+            with source as video_path:
+                if kind == "annotate":
+                    annotated, _ = services.process_and_annotate_video(video_path, **analysis)
+                    if not annotated:
+                        raise RuntimeError("Video processing failed")
+                    shutil.move(annotated, output_path)
+                else:
+                    services.process_video_file(video_path, **analysis)
+
+            detections = writer.close()
+            if self._finish(db, job_id, status=DONE, finished_at=_now(), detections=detections,
+                            frames_done=run.frames_done, frames_total=max(run.frames_total, run.frames_done),
+                            frames_detected=run.frames_detected,
+                            output_path=output_path if kind == "annotate" else None):
+                db.commit()
+                if not upload_id:
+                    _remove(input_path)
+            else:
+                # Cancelled from another process just before the end
+                db.rollback()
+                _remove(output_path)
+                self._abandon(db, job, job_id)
+        except _Stopped:
+            db.rollback()
+            _remove(output_path)
+            if run.stop == QUEUED:
+                # Shutting down: not the job's fault, so the attempt is not counted
+                self._abandon(db, job, job_id, status=QUEUED, owner=None, attempts=models.VideoJob.attempts - 1)
+            elif self._abandon(db, job, job_id, status=CANCELLED, finished_at=_now()) and not upload_id:
+                _remove(input_path)
+        except Exception as e:
+            db.rollback()
+            _remove(output_path)
+            print(f"[Jobs] Job {job_id} failed: {e}")
+            self._abandon(db, job, job_id, status=FAILED, finished_at=_now(), error=str(e)[:1000])
+        finally:
+            db.close()
+            with self._lock:
+                self._finished_runs[job_id] = self._runs.pop(job_id)
+                if len(self._finished_runs) > _FINISHED_RUNS:
+                    self._finished_runs.popitem(last=False)
+
+    def _maintain(self) -> None:
+        """Requeue jobs whose process died and drop expired finished jobs and
+        abandoned uploads, every JOB_POLL_SECONDS."""
+        with self._lock:
+            if time.monotonic() - self._maintained < JOB_POLL_SECONDS:
+                return
+            self._maintained = time.monotonic()
+        J = models.VideoJob
+        host = self.owner.rpartition(":")[0]
+        db = database.SessionLocal()
+        try:
+            for job in db.scalars(select(J).where(J.status == RUNNING)).all():
+                owner_host, _, pid = (job.owner or "").rpartition(":")
+                if owner_host != host:
+                    continue  # another machine recovers its own jobs
+                if job.owner == self.owner:
+                    if job.id in self._runs:
+                        continue
+                elif pid.isdigit() and psutil.pid_exists(int(pid)):
+                    continue
+                if job.attempts >= JOB_MAX_ATTEMPTS:
+                    values = dict(status=FAILED, finished_at=_now(), error=f"Gave up after {job.attempts} interrupted attempts")
+                else:
+                    values = dict(status=QUEUED, owner=None)
+                print(f"[Jobs] Job {job.id} lost its process ({job.owner}); now {values['status']}")
+                if db.execute(update(J).where(J.id == job.id, J.status == RUNNING, J.owner == job.owner).values(**values)).rowcount:
+                    self._discard_detections(db, job)
+
+            cutoff = (datetime.now() - timedelta(hours=JOB_RETENTION_HOURS)).isoformat(timespec="microseconds")
+            for job in db.scalars(select(J).where(J.status.in_(FINISHED), J.finished_at < cutoff)).all():
+                _remove_input(job)
+                _remove(job.output_path)
+                db.delete(job)
+            db.commit()
+        finally:
+            db.close()
+        uploads.expire_stale()
@@ -0,0 +1,166 @@
+"""
+Server-push session analytics.
+
+`LiveStats` keeps one channel per watched session. A commit that writes the
+session's rows (see cache_utils.on_commit) marks the channel dirty; its single
+publisher task recomputes the report at most LIVE_STATS_MAX_HZ times a second
+and hands every viewer the same result. A viewer's first message is the full
+report ("snapshot"); after that it only gets the changed fields ("delta").
+A viewer that falls behind has its pending deltas merged, so it never queues
+more than one message.
+"""
+import asyncio
+import os
+
+import cache_utils
+
+LIVE_STATS_MAX_HZ = float(os.getenv("LIVE_STATS_MAX_HZ", "1"))
+# Recompute even without a local commit, for writes made by other worker processes
+LIVE_STATS_REFRESH_SECONDS = float(os.getenv("LIVE_STATS_REFRESH_SECONDS", "10"))
+KEEPALIVE_SECONDS = 15
+
+SNAPSHOT = "snapshot"
+DELTA = "delta"
+
+
+def diff(old: dict, new: dict) -> dict:
+    """The parts of `new` that differ from `old`, nested dicts diffed recursively."""
+    delta = {}
+    for key, value in new.items():
+        before = old.get(key)
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = diff(before, value)
+            if nested:
+                delta[key] = nested
+        elif value != before or key not in old:
+            delta[key] = value
+    return delta
+
+
+def merge(base: dict, delta: dict) -> dict:
+    """`base` with `delta` applied (the inverse of diff). Does not modify `base`."""
+    merged = dict(base)
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+class Viewer:
+    """One connected client; holds at most one pending message."""
+
+    def __init__(self):
+        self._pending = None  # (kind, data)
+        self._ready = asyncio.Event()
+        self.has_snapshot = False
+
+    def push(self, kind: str, data: dict) -> None:
+        if self._pending is not None and kind == DELTA:
+            # Fold into what the client has not received yet (snapshot or delta)
+            kind, data = self._pending[0], merge(self._pending[1], data)
+        self._pending = (kind, data)
+        self._ready.set()
+
+    async def next(self, timeout: float = None):
+        """The next (kind, data) message, or None after `timeout` seconds idle."""
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._ready.clear()
+        message, self._pending = self._pending, None
+        return message
+
+
+class _Channel:
+    def __init__(self):
+        self.viewers = set()
+        self.dirty = asyncio.Event()
+        self.state = None
+        self.task = None
+
+
+class LiveStats:
+    """Per-session report publisher shared by every viewer of the session.
+
+    `compute(session_id)` is a coroutine returning the report dict.
+    """
+
+    def __init__(self, compute, max_hz: float = None):
+        self._compute = compute
+        self.min_interval = 1.0 / max(0.01, LIVE_STATS_MAX_HZ if max_hz is None else max_hz)
+        self._channels = {}
+        self._loop = None
+        self.computations = 0
+        cache_utils.on_commit(self._on_commit)
+
+    @property
+    def viewer_count(self) -> int:
+        return sum(len(ch.viewers) for ch in self._channels.values())
+
+    def _on_commit(self, tags) -> None:
+        # Runs in whichever thread committed; hop onto the loop
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        for tag in tags:
+            if tag in self._channels:
+                loop.call_soon_threadsafe(self._mark_dirty, tag)
+
+    def _mark_dirty(self, session_id: str) -> None:
+        channel = self._channels.get(session_id)
+        if channel is not None:
+            channel.dirty.set()
+
+    def subscribe(self, session_id: str) -> Viewer:
+        self._loop = asyncio.get_running_loop()
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = _Channel()
+        viewer = Viewer()
+        channel.viewers.add(viewer)
+        if channel.state is not None:
+            viewer.push(SNAPSHOT, channel.state)
+            viewer.has_snapshot = True
+        if channel.task is None:
+            channel.dirty.set()
+            channel.task = asyncio.create_task(self._publish(session_id, channel))
+        return viewer
+
+    def unsubscribe(self, session_id: str, viewer: Viewer) -> None:
+        channel = self._channels.get(session_id)
+        if channel is None:
+            return
+        channel.viewers.discard(viewer)
+        if not channel.viewers:
+            del self._channels[session_id]
+            if channel.task is not None:
+                channel.task.cancel()
+
+    async def _publish(self, session_id: str, channel: _Channel) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(channel.dirty.wait(), LIVE_STATS_REFRESH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            channel.dirty.clear()
+            try:
+                report = await self._compute(session_id)
+                self.computations += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Live] Failed to compute report for {session_id}: {e}")
+            else:
+                delta = diff(channel.state, report) if channel.state is not None else report
+                channel.state = report
+                for viewer in list(channel.viewers):
+                    if not viewer.has_snapshot:
+                        viewer.push(SNAPSHOT, report)
+                        viewer.has_snapshot = True
+                    elif delta:
+                        viewer.push(DELTA, delta)
+            # Commits during this pause collapse into one recompute
+            await asyncio.sleep(self.min_interval)
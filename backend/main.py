@@ -1,22 +1,30 @@
 import os
-import uuid
 import json
+import uuid
+import secrets
 import asyncio
-from datetime import datetime, timedelta
-from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+import tempfile
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from passlib.context import CryptContext
 from jose import jwt
 from dotenv import load_dotenv
 
-import models, database, services, ai_service
+import models, database, services, ai_service, aggregates, broadcast, ingest, cache_utils, live, reports, sampling, jobs, uploads, migrate
 from schemas import UserSignup, UserAuth
 
 load_dotenv()
 models.Base.metadata.create_all(bind=database.engine)
+# Existing databases get the columns and indexes added since they were created
+migrate.upgrade(database.engine, verbose=True)
 
 app = FastAPI(title="Analyzing Student Behavior Before and After Classroom Sessions")
 
@@ -26,12 +34,109 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count", "ETag"],
 )
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# --- DETECTION PERSISTENCE & STATS HELPERS ---
+def _save_detections(db: Session, session_id: str, capture_type: str, frames: list, persons=None) -> int:
+    """Persist per-frame detections and fold them into the session aggregates.
+    `frames` is a list of (timestamp, results); `persons` is the stream's
+    PersonCounter when it spans several saves. Caller commits. Returns rows added.
+    """
+    writer = ingest.DetectionWriter(db, session_id, capture_type, persons=persons)
+    for timestamp, results in frames:
+        writer.add(timestamp, results)
+    return writer.close()
+
+def _save_and_commit(db: Session, session_id: str, capture_type: str, frames: list) -> int:
+    """_save_detections plus commit, for running in the threadpool off the event loop."""
+    added = _save_detections(db, session_id, capture_type, frames)
+    db.commit()
+    return added
+
+def _analyse_video(db: Session, session_id: str, capture_type: str, analyse, video_path: str, **options):
+    """Run a video analyser (`analyse(video_path, on_frame=..., **options)`) off the
+    event loop, committing its detections chunk by chunk while frames are processed.
+    The rows are tagged with a random negative job_number (job numbers are positive),
+    so if the analysis raises they are deleted again by that tag.
+    Returns (the analyser's result, detections written)."""
+    number = -1 - secrets.randbelow(2**31 - 1)
+    writer, on_frame = ingest.video_frame_writer(db, session_id, capture_type, commit=True, job_number=number)
+    try:
+        result = analyse(video_path, on_frame=on_frame, **options)
+        return result, writer.close()
+    except Exception:
+        db.rollback()
+        try:
+            ingest.discard_job(db, session_id, number)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[Video] Could not discard the detections of a failed analysis: {e}")
+        raise
+
+def _annotate_video(video_path: str, **options):
+    """services.process_and_annotate_video, raising if no annotated file came out."""
+    output_path, all_results = services.process_and_annotate_video(video_path, **options)
+    if not output_path or not os.path.exists(output_path):
+        raise HTTPException(500, "Video processing failed")
+    return output_path, all_results
+
+def _confirmed_attendance(entry_count: int, exit_count: int) -> int:
+    # Confirmed attendance = min of entry and exit face counts
+    # This represents students who were detected in BOTH entry and exit
+    return min(entry_count, exit_count) if entry_count > 0 and exit_count > 0 else max(entry_count, exit_count)
+
+def _session_counts(db: Session, session_id: str):
+    """Entry/exit (counts, attendance) pairs read from the stats aggregates."""
+    rows = aggregates.load(db, session_id)
+    return aggregates.combine(rows, aggregates.ENTRY_TYPES), aggregates.combine(rows, aggregates.EXIT_TYPES)
+
+def _session_stats(db: Session, session_id: str):
+    (entry_counts, entry_att), (exit_counts, exit_att) = _session_counts(db, session_id)
+    return services.stats_from_counts(entry_counts, entry_att), services.stats_from_counts(exit_counts, exit_att)
+
+# Async routes reuse the sync helpers above through AsyncSession.run_sync, which
+# drives them over the async connection without blocking the event loop.
+async def _get_session_or_404(db: AsyncSession, session_id: str) -> models.Session:
+    session = await db.get(models.Session, session_id)
+    if not session: raise HTTPException(404, "Not Found")
+    return session
+
+# --- CONDITIONAL GET ---
+# Polled per-session endpoints answer with an ETag built from the session's
+# data_version, which every commit that writes its rows bumps (cache_utils).
+# A matching If-None-Match gets a 304 before any stats code runs. The version
+# is read from the database on every request (one primary-key lookup), so a
+# write committed by another server process is never answered with a 304.
+async def _session_version(db: AsyncSession, session_id: str) -> Optional[int]:
+    """The session's current data_version. None if no such session."""
+    S = models.Session
+    return await db.scalar(select(func.coalesce(S.data_version, 0)).where(S.id == session_id))
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in (tag.strip() for tag in if_none_match.split(","))
+
+async def _conditional(request: Request, response: Response, db: AsyncSession, session_id: str, payload, missing_ok: bool = False):
+    """Return 304 if the client's validator is current, else await `payload(version)` with an ETag."""
+    version = await _session_version(db, session_id)
+    if version is None:
+        if not missing_ok: raise HTTPException(404, "Not Found")
+        return await payload(None)
+    etag = f'W/"{session_id}.{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return await payload(version)
+
 # --- AUTH ROUTES ---
 @app.post("/signup")
 def signup(user: UserSignup, db: Session = Depends(database.get_db)):
@@ -53,7 +158,7 @@ class SessionCreate(BaseModel):
     name: str; class_name: str; instructor: str
 
 @app.post("/sessions/create")
-async def create_session(session: SessionCreate, db: Session = Depends(database.get_db)):
+async def create_session(session: SessionCreate, db: AsyncSession = Depends(database.get_async_db)):
     sid = str(uuid.uuid4())
     new_session = models.Session(
         id=sid,
@@ -63,30 +168,77 @@ async def create_session(session: SessionCreate, db: Session = Depends(database.
         created_at=datetime.now().isoformat()
     )
     db.add(new_session)
-    db.commit()
+    cache_utils.mark_written(db, cache_utils.SESSION_LIST_TAG)
+    await db.commit()
     return {"id": sid, "name": session.name}
 
 @app.get("/sessions/{session_id}/details")
-async def get_session_details(session_id: str, db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
+async def get_session_details(session_id: str, request: Request, response: Response, db: AsyncSession = Depends(database.get_async_db)):
+    return await _conditional(request, response, db, session_id, lambda _: _session_details(db, session_id))
+
+async def _session_details(db: AsyncSession, session_id: str) -> dict:
+    session = await _get_session_or_404(db, session_id)
     
     return {"id": session.id, "name": session.name, "class_name": session.class_name, "instructor": session.instructor, "created_at": session.created_at}
 
+_SESSION_SORT_COLUMNS = {
+    "created_at": models.Session.created_at,
+    "class_name": models.Session.class_name,
+    "instructor": models.Session.instructor,
+    "name": models.Session.name,
+}
+
+def _page_sessions(db: Session, sort: str, order: str, limit: Optional[int], offset: int, search: Optional[str] = None):
+    """Sorted, optionally filtered and paged session list. Returns (sessions, total)."""
+    if sort not in _SESSION_SORT_COLUMNS: raise HTTPException(400, f"sort must be one of {sorted(_SESSION_SORT_COLUMNS)}")
+    if order not in ("asc", "desc"): raise HTTPException(400, "order must be 'asc' or 'desc'")
+
+    query = db.query(models.Session)
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(models.Session.class_name.ilike(pattern) | models.Session.instructor.ilike(pattern))
+    total = query.count()
+
+    column = _SESSION_SORT_COLUMNS[sort]
+    query = query.order_by(column.desc() if order == "desc" else column.asc(), models.Session.id)
+    if offset: query = query.offset(offset)
+    if limit is not None: query = query.limit(limit)
+    return query.all(), total
+
+# Analytics payloads are cached until a commit writes rows for one of their
+# sessions (see cache_utils.mark_written), so quiet-period polls skip the DB.
+_analytics_cache = cache_utils.session_stats_cache
+
+def _page_tags(page) -> list:
+    """A paged listing is stale when the session list or any listed session changes."""
+    items, _ = page
+    return [cache_utils.SESSION_LIST_TAG] + [item.get("id") or item.get("session_id") for item in items]
+
 @app.get("/sessions/history")
-async def get_session_history(db: Session = Depends(database.get_db)):
-    sessions = db.query(models.Session).all()
+async def get_session_history(
+    response: Response,
+    sort: str = "created_at", order: str = "desc",
+    limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0),
+    search: Optional[str] = None,
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    history, total = await cache_utils.cached_async(
+        _analytics_cache, ("history", sort, order, limit, offset, search),
+        lambda: _session_history(db, sort, order, limit, offset, search), _page_tags,
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return history
+
+async def _session_history(db: AsyncSession, sort, order, limit, offset, search):
+    sessions, total = await db.run_sync(_page_sessions, sort, order, limit, offset, search)
+    # Stats for every session on the page come from grouped aggregates, not per-session scans
+    session_aggs = await db.run_sync(aggregates.load_many, [s.id for s in sessions])
     history = []
     for s in sessions:
-        # Get stats for both entry and exit
-        entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == s.id, models.EmotionData.type.in_(['entry', 'video'])).all()
-        exit_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == s.id, models.EmotionData.type == 'exit').all()
-        entry_stats = services.calculate_advanced_stats(entry_data)
-        exit_stats = services.calculate_advanced_stats(exit_data)
-        
-        entry_count = entry_stats["attendance_est"]
-        exit_count = exit_stats["attendance_est"]
-        confirmed = min(entry_count, exit_count) if entry_count > 0 and exit_count > 0 else max(entry_count, exit_count)
+        rows = session_aggs.get(s.id, {})
+        entry_counts, entry_count = aggregates.combine(rows, aggregates.ENTRY_TYPES)
+        _, exit_count = aggregates.combine(rows, aggregates.EXIT_TYPES)
+        entry_stats = services.stats_from_counts(entry_counts, entry_count)
         
         history.append({
             "id": s.id, 
@@ -94,93 +246,104 @@ async def get_session_history(db: Session = Depends(database.get_db)):
             "instructor": s.instructor,
             "created_at": s.created_at, 
             "vibe_score": entry_stats["vibe_score"], 
-            "attendance": confirmed,
+            "attendance": _confirmed_attendance(entry_count, exit_count),
             "entry_count": entry_count,
             "exit_count": exit_count,
         })
-    return sorted(history, key=lambda x: x['created_at'], reverse=True)
+    return history, total
+
+async def _check_emotion_mode(mode: Optional[str]) -> None:
+    """Reject an unknown emotion mode (400) or a fast mode whose model is not installed (503).
+    Loads the mode's model on first use."""
+    try:
+        await run_in_threadpool(services.emotion_scheduler, mode)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(503, str(e))
+
+def _sampling_policy(name: Optional[str], fps: Optional[float], default_fps: float) -> sampling.SamplingPolicy:
+    """The frame sampling policy for a video upload; invalid settings are a 400."""
+    try:
+        return sampling.SamplingPolicy(name, default_fps if fps is None else fps)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
 
 @app.post("/sessions/{session_id}/analyze")
-async def analyze_frame(session_id: str, type: str = Form(...), file: UploadFile = File(...), db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
+async def analyze_frame(session_id: str, type: str = Form(...), file: UploadFile = File(...), mode: Optional[str] = Form(None), db: Session = Depends(database.get_db)):
+    if not await run_in_threadpool(db.get, models.Session, session_id): raise HTTPException(404, "Not Found")
+    if type not in models.CAPTURE_TYPES: raise HTTPException(400, "Invalid capture type")
+    await _check_emotion_mode(mode)
     
-    res = services.detect_emotion_from_frame(await file.read())
+    res = await run_in_threadpool(services.detect_emotion_from_frame, await file.read(), mode)
     timestamp = datetime.now().isoformat()
     
-    for r in res:
-        new_data = models.EmotionData(
-            session_id=session_id,
-            type=type,
-            emotion=r['emotion'],
-            bbox=json.dumps(r['bbox']),
-            timestamp=timestamp
-        )
-        db.add(new_data)
-    
-    db.commit()
+    await run_in_threadpool(_save_and_commit, db, session_id, type, [(timestamp, res)])
     return {"results": res}
 
+# --- VIDEO UPLOADS ---
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+JOB_EVENTS_INTERVAL = float(os.getenv("JOB_EVENTS_INTERVAL", "1"))  # seconds between job progress checks per /events client
+
+async def _spool_upload(file: UploadFile, directory: str = None) -> str:
+    """Stream an upload to a temp file (in `directory`, default the system temp
+    dir) in fixed-size chunks and return its path. Memory use is one chunk
+    regardless of video size; the container suffix OpenCV needs is sniffed
+    from the first chunk. Caller deletes the file.
+    """
+    chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=services.detect_video_suffix(chunk), dir=directory)
+    try:
+        while chunk:
+            await run_in_threadpool(tmp.write, chunk)
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+    except BaseException:
+        tmp.close()
+        os.unlink(tmp.name)
+        raise
+    tmp.close()
+    return tmp.name
+
 @app.post("/sessions/{session_id}/analyze_video")
-async def analyze_video(session_id: str, type: str = Form(...), file: UploadFile = File(...), db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
+async def analyze_video(session_id: str, type: str = Form(...), file: UploadFile = File(...), mode: Optional[str] = Form(None),
+                        sample_policy: Optional[str] = Form(None), sample_fps: Optional[float] = Form(None),
+                        db: Session = Depends(database.get_db)):
+    if not await run_in_threadpool(db.get, models.Session, session_id): raise HTTPException(404, "Not Found")
+    if type not in models.CAPTURE_TYPES: raise HTTPException(400, "Invalid capture type")
+    policy = _sampling_policy(sample_policy, sample_fps, sampling.VIDEO_SAMPLE_FPS)
+    await _check_emotion_mode(mode)
     
-    from fastapi.concurrency import run_in_threadpool
-    results = await run_in_threadpool(services.process_video_file, await file.read())
-    base_time = datetime.now()
-    total_detections = 0
-    for idx, frame_results in enumerate(results):
-        # Assign a slightly different timestamp to each frame so attendance logic works
-        frame_ts = (base_time + timedelta(milliseconds=idx * 100)).isoformat()
-        for r in frame_results:
-            new_data = models.EmotionData(
-                session_id=session_id,
-                type=type,
-                emotion=r['emotion'],
-                bbox=json.dumps(r['bbox']),
-                timestamp=frame_ts
-            )
-            db.add(new_data)
-            total_detections += 1
-        
-    db.commit()
+    video_path = await _spool_upload(file)
+    try:
+        results, total_detections = await run_in_threadpool(_analyse_video, db, session_id, type, services.process_video_file,
+                                                            video_path, mode=mode, policy=policy)
+    finally:
+        os.unlink(video_path)
     return {"status": "success", "frames_processed": len(results), "total_detections": total_detections}
 
 
 @app.post("/sessions/{session_id}/analyze_video_full")
-async def analyze_video_full(session_id: str, type: str = Form(...), file: UploadFile = File(...), db: Session = Depends(database.get_db)):
+async def analyze_video_full(session_id: str, type: str = Form(...), file: UploadFile = File(...), mode: Optional[str] = Form(None),
+                             sample_policy: Optional[str] = Form(None), sample_fps: Optional[float] = Form(None),
+                             db: Session = Depends(database.get_db)):
     """Processes a video fully, annotates it, saves results to DB, and returns the MP4 file."""
-    from fastapi.concurrency import run_in_threadpool
     from starlette.background import BackgroundTask
 
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
+    if not await run_in_threadpool(db.get, models.Session, session_id): raise HTTPException(404, "Not Found")
+    if type not in models.CAPTURE_TYPES: raise HTTPException(400, "Invalid capture type")
+    policy = _sampling_policy(sample_policy, sample_fps, sampling.ANNOTATE_SAMPLE_FPS)
+    await _check_emotion_mode(mode)
     
     # Process video and get file path and results
-    output_path, all_results = await run_in_threadpool(services.process_and_annotate_video, await file.read())
-    
-    if not output_path or not os.path.exists(output_path):
-        raise HTTPException(500, "Video processing failed")
-        
-    # Save the detected results into the DB so the dashboard updates and counts students
-    base_time = datetime.now()
-    for idx, frame_results in enumerate(all_results):
-        # Increment timestamp per frame so Counter(valid_ts) works correctly for attendance
-        frame_ts = (base_time + timedelta(milliseconds=idx * 100)).isoformat()
-        for res in frame_results:
-            new_data = models.EmotionData(
-                session_id=session_id,
-                type=type,
-                emotion=res['emotion'],
-                bbox=json.dumps(res['bbox']),
-                timestamp=frame_ts
-            )
-            db.add(new_data)
-    
-    if all_results:
-        db.commit()
-        
+    video_path = await _spool_upload(file)
+    # The detections are saved as frames are processed, so the dashboard updates and counts
+    # students; they are deleted again if the annotated video cannot be produced
+    try:
+        (output_path, _), _ = await run_in_threadpool(_analyse_video, db, session_id, type, _annotate_video,
+                                                      video_path, mode=mode, policy=policy)
+    finally:
+        os.unlink(video_path)
+
     # Return the file and delete it after sending
     return FileResponse(
         output_path, 
@@ -190,11 +353,268 @@ async def analyze_video_full(session_id: str, type: str = Form(...), file: Uploa
     )
 
 
+# --- BACKGROUND VIDEO JOBS ---
+# The same analysis as the two endpoints above, queued (jobs.py): the upload
+# returns a job id at once and clients follow progress instead of holding the
+# request open for the whole run.
+video_jobs = jobs.JobQueue()
+
+@app.on_event("startup")
+async def _start_video_jobs():
+    video_jobs.start()
+
+@app.on_event("shutdown")
+async def _stop_video_jobs():
+    await run_in_threadpool(video_jobs.stop)
+
+async def _job_or_404(job_id: str) -> dict:
+    state = await run_in_threadpool(video_jobs.state, job_id)
+    if state is None: raise HTTPException(404, "Job not found")
+    return state
+
+@app.post("/sessions/{session_id}/video_jobs", status_code=202)
+async def submit_video_job(session_id: str, type: str = Form(...), file: UploadFile = File(...), kind: str = Form("analyze"),
+                           mode: Optional[str] = Form(None), sample_policy: Optional[str] = Form(None),
+                           sample_fps: Optional[float] = Form(None), priority: int = Form(0),
+                           db: AsyncSession = Depends(database.get_async_db)):
+    """Queue a video for analysis ("analyze") or analysis plus an annotated MP4
+    ("annotate"). Returns the job; follow it with /video_jobs/{id}/events."""
+    await _get_session_or_404(db, session_id)
+    if type not in models.CAPTURE_TYPES: raise HTTPException(400, "Invalid capture type")
+    if kind not in models.JOB_KINDS: raise HTTPException(400, f"Invalid job kind; choose one of: {', '.join(models.JOB_KINDS)}")
+    default_fps = sampling.ANNOTATE_SAMPLE_FPS if kind == "annotate" else sampling.VIDEO_SAMPLE_FPS
+    policy = _sampling_policy(sample_policy, sample_fps, default_fps)
+    await _check_emotion_mode(mode)
+
+    upload_path = await _spool_upload(file, jobs.JOB_DIR)
+    options = {"mode": mode, "sample_policy": policy.name, "sample_fps": policy.fps}
+    try:
+        job_id = await run_in_threadpool(video_jobs.submit, session_id, type, kind, upload_path, options, priority)
+    except BaseException:
+        if os.path.exists(upload_path):
+            os.unlink(upload_path)
+        raise
+    return await _job_or_404(job_id)
+
+@app.get("/sessions/{session_id}/video_jobs")
+async def list_video_jobs(session_id: str):
+    return await run_in_threadpool(video_jobs.session_jobs, session_id)
+
+@app.get("/video_jobs/{job_id}")
+async def get_video_job(job_id: str):
+    """Job status and progress (frames done of the container's estimate, ETA)."""
+    return await _job_or_404(job_id)
+
+@app.get("/video_jobs/{job_id}/events")
+async def video_job_events(job_id: str):
+    """Server-sent events for one job: "progress" when it changes, "detections"
+    with the frames found since the last event (while the job runs in this
+    process; "skipped" counts frames a slow client missed), then one final
+    "done", "failed" or "cancelled" event with the job and the stream ends.
+    """
+    await _job_or_404(job_id)
+
+    async def events():
+        cursor, progress, idle = 0, None, 0.0
+        yield "retry: 3000\n\n"
+        while True:
+            # State before frames: a finished job's last frames are already recorded
+            state = await run_in_threadpool(video_jobs.state, job_id)
+            if state is None:
+                return
+            frames = await run_in_threadpool(video_jobs.frames_since, job_id, cursor)
+            if frames is not None:
+                cursor, new_frames, skipped = frames
+                if new_frames or skipped:
+                    yield f"event: detections\ndata: {json.dumps({'frames': new_frames, 'skipped': skipped})}\n\n"
+            if state["status"] in jobs.FINISHED:
+                yield f"event: {state['status']}\ndata: {json.dumps(state)}\n\n"
+                return
+            if state["progress"] != progress:
+                progress, idle = state["progress"], 0.0
+                yield f"event: progress\ndata: {json.dumps({'status': state['status'], **progress})}\n\n"
+            elif idle >= live.KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield ": keepalive\n\n"
+            await asyncio.sleep(JOB_EVENTS_INTERVAL)
+            idle += JOB_EVENTS_INTERVAL
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/video_jobs/{job_id}/video")
+async def get_video_job_video(job_id: str):
+    """The annotated MP4 of a finished "annotate" job."""
+    state = await _job_or_404(job_id)
+    if not state["has_video"]: raise HTTPException(409, f"No annotated video (job is {state['status']})")
+    path = await run_in_threadpool(video_jobs.output_path, job_id)
+    if not path or not os.path.exists(path): raise HTTPException(410, "Annotated video expired")
+    return FileResponse(path, media_type="video/mp4", filename="analyzed_video.mp4")
+
+@app.delete("/video_jobs/{job_id}")
+async def delete_video_job(job_id: str):
+    """Cancel a queued or running job, or delete a finished one and its files."""
+    state = await _job_or_404(job_id)
+    if state["status"] in jobs.FINISHED:
+        await run_in_threadpool(video_jobs.delete, job_id)
+        return {"status": "deleted"}
+    if not await run_in_threadpool(video_jobs.cancel, job_id):
+        raise HTTPException(409, "Job already finished")
+    return {"status": "cancelling"}
+
+
+# --- RESUMABLE UPLOADS ---
+# Large recordings arrive in checksummed chunks that can be retried and resumed
+# (uploads.py). The upload's video job starts with its first chunk when the
+# container can be decoded as a stream, else when the upload is finalised.
+class UploadStart(BaseModel):
+    type: str
+    filename: str = ""
+    size: int
+    chunk_size: Optional[int] = None
+    kind: str = "analyze"
+    mode: Optional[str] = None
+    sample_policy: Optional[str] = None
+    sample_fps: Optional[float] = None
+    priority: int = 0
+    stream: bool = True  # start analysing before the last chunk arrives, where possible
+
+def _start_upload_job(upload: dict, replace: str = None) -> Optional[str]:
+    """Queue the video job for an upload unless another request already did (or,
+    with `replace`, the upload moved on from that job). Returns the job id."""
+    options = upload["options"]
+    job_options = {"mode": options["mode"], "sample_policy": options["sample_policy"],
+                   "sample_fps": options["sample_fps"], "upload_id": upload["id"]}
+    job_id = video_jobs.submit(upload["session_id"], upload["type"], options["kind"], uploads.video_path(upload["id"]),
+                               job_options, options["priority"], move=False)
+    if uploads.attach_job(upload["id"], job_id, replace):
+        return job_id
+    video_jobs.cancel(job_id)
+    return None
+
+async def _upload_or_404(upload_id: str) -> dict:
+    upload = await run_in_threadpool(uploads.state, upload_id)
+    if upload is None: raise HTTPException(404, "Upload not found")
+    return upload
+
+@app.post("/sessions/{session_id}/uploads", status_code=201)
+async def start_upload(session_id: str, start: UploadStart, db: AsyncSession = Depends(database.get_async_db)):
+    """Start a chunked upload of a video for a background job (see /video_jobs).
+    Returns the upload with its chunk size and chunk count."""
+    await _get_session_or_404(db, session_id)
+    if start.type not in models.CAPTURE_TYPES: raise HTTPException(400, "Invalid capture type")
+    if start.kind not in models.JOB_KINDS: raise HTTPException(400, f"Invalid job kind; choose one of: {', '.join(models.JOB_KINDS)}")
+    default_fps = sampling.ANNOTATE_SAMPLE_FPS if start.kind == "annotate" else sampling.VIDEO_SAMPLE_FPS
+    policy = _sampling_policy(start.sample_policy, start.sample_fps, default_fps)
+    await _check_emotion_mode(start.mode)
+
+    options = {"kind": start.kind, "mode": start.mode, "sample_policy": policy.name, "sample_fps": policy.fps,
+               "priority": start.priority, "stream": start.stream}
+    try:
+        return await run_in_threadpool(uploads.create, session_id, start.type, start.filename, start.size, start.chunk_size, options)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+@app.put("/uploads/{upload_id}/chunks/{number}")
+async def put_upload_chunk(upload_id: str, number: int, request: Request):
+    """Store chunk `number` (0-based); the X-Chunk-SHA256 header carries its hex
+    digest. Sending a chunk again is harmless. Returns the upload's state."""
+    try:
+        length = await run_in_threadpool(uploads.chunk_length, upload_id, number)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if length is None: raise HTTPException(404, "Upload not found")
+
+    body = bytearray()
+    async for part in request.stream():
+        body += part
+        if len(body) > length:
+            raise HTTPException(400, f"Chunk {number} must be {length} bytes")
+    try:
+        upload = await run_in_threadpool(uploads.write_chunk, upload_id, number, bytes(body), request.headers.get("X-Chunk-SHA256"))
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if upload is None: raise HTTPException(404, "Upload not found")
+
+    if upload["job_id"] is None and upload["streamable"] and upload["options"].get("stream") and uploads.STREAMING:
+        await run_in_threadpool(_start_upload_job, upload)
+        upload = await _upload_or_404(upload_id)
+    return upload
+
+@app.get("/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Received byte ranges and missing chunks, to resume an interrupted upload."""
+    return await _upload_or_404(upload_id)
+
+@app.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str):
+    """Finalise an upload once every chunk arrived, and queue its video job if it
+    has not started yet (or failed on the partial file). Returns the upload and its job."""
+    try:
+        upload = await run_in_threadpool(uploads.complete, upload_id)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if upload is None: raise HTTPException(404, "Upload not found")
+
+    job = await run_in_threadpool(video_jobs.state, upload["job_id"]) if upload["job_id"] else None
+    if job is None or job["status"] == jobs.FAILED:
+        await run_in_threadpool(_start_upload_job, upload, upload["job_id"])
+        upload = await _upload_or_404(upload_id)
+        job = await _job_or_404(upload["job_id"])
+    return {**upload, "job": job}
+
+@app.delete("/uploads/{upload_id}")
+async def delete_upload(upload_id: str):
+    """Abandon an upload: its file is removed and its video job cancelled."""
+    job_id = await run_in_threadpool(uploads.remove, upload_id)
+    if job_id is False: raise HTTPException(404, "Upload not found")
+    if job_id:
+        await run_in_threadpool(video_jobs.cancel, job_id)
+    return {"status": "deleted"}
+
+
+
+
+@app.get("/system/inference")
+async def get_inference_stats():
+    """Detector pool and emotion batch scheduler counters."""
+    return services.inference_stats()
+
+@app.get("/system/cache")
+async def get_cache_stats():
+    """Analytics cache size and hit/miss/eviction/invalidation counters."""
+    return {**_analytics_cache.stats(), "live_viewers": live_stats.viewer_count, "live_computations": live_stats.computations,
+            "pdf_reports": cache_utils.report_pdf_cache.stats()}
+
+@app.get("/system/jobs")
+async def get_job_stats():
+    """Background video jobs by status, plus this process's workers."""
+    return await run_in_threadpool(video_jobs.stats)
 
 
 # ─── WebSocket: Real-time Webcam Emotion Streaming ────────────────────────────────
+def _persist_webcam_frames(session_id: str, capture_type: str, frames: list, persons):
+    db = database.SessionLocal()
+    try:
+        _save_detections(db, session_id, capture_type, frames, persons)
+        db.commit()
+    finally:
+        db.close()
+
+# One capture-and-detect producer per camera, shared by every viewer
+_webcam_hubs = {}
+
+def _webcam_hub(camera: int) -> broadcast.WebcamHub:
+    if camera not in _webcam_hubs:
+        manager = services.webcam_manager if camera == 0 else services.WebcamManager(camera)
+        _webcam_hubs[camera] = broadcast.WebcamHub(manager, _persist_webcam_frames)
+    return _webcam_hubs[camera]
+
+# Sec-WebSocket-Protocol name that opts into binary frames (same as ?protocol=binary)
+WS_BINARY_SUBPROTOCOL = "emotion-frames.binary.v1"
+
 @app.websocket("/ws/webcam/{session_id}/{capture_type}")
-async def websocket_webcam(websocket: WebSocket, session_id: str, capture_type: str):
+async def websocket_webcam(websocket: WebSocket, session_id: str, capture_type: str, camera: int = 0, protocol: str = "json"):
     """
     WebSocket endpoint for real-time webcam emotion detection.
     
@@ -202,75 +622,51 @@ async def websocket_webcam(websocket: WebSocket, session_id: str, capture_type:
     
     The backend opens the webcam, runs face detection + emotion recognition on each frame,
     and streams both the JPEG-encoded frame (base64) and detection results to the React client.
-    """
-    await websocket.accept()
-    print(f"[WS] Client connected — session={session_id}, type={capture_type}")
-
-    # Start webcam (async wrapper to avoid blocking)
-    await asyncio.get_event_loop().run_in_executor(None, services.webcam_manager.start)
+    Frames are captured, detected and encoded once per camera by a shared hub and fanned
+    out to every connected viewer, so inference cost does not grow with the audience.
 
-    # Get a DB session for persisting results
-    db = database.SessionLocal()
-    client_active = True
+    Clients that pass ?protocol=binary (or offer the WS_BINARY_SUBPROTOCOL subprotocol)
+    get binary messages carrying the raw JPEG instead of base64 inside JSON; see broadcast.py
+    for the layout. Everyone else keeps the JSON text messages.
+    """
+    if capture_type not in models.CAPTURE_TYPES:
+        await websocket.close(code=1008)
+        return
+    if WS_BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", []):
+        await websocket.accept(subprotocol=WS_BINARY_SUBPROTOCOL)
+        protocol = broadcast.PROTOCOL_BINARY
+    else:
+        await websocket.accept()
+        protocol = broadcast.PROTOCOL_BINARY if protocol == broadcast.PROTOCOL_BINARY else broadcast.PROTOCOL_JSON
+    print(f"[WS] Client connected — session={session_id}, type={capture_type}, camera={camera}, protocol={protocol}")
+
+    hub = _webcam_hub(camera)
+    subscriber = await hub.subscribe(session_id, capture_type, protocol)
 
     async def listen_for_stop():
-        nonlocal client_active
         try:
             while True:
                 msg = await websocket.receive_text()
                 if msg == "stop":
                     print(f"[WS] Client requested stop - {capture_type}")
-                    client_active = False
                     break
         except WebSocketDisconnect:
             print(f"[WS] Client disconnected normally - {capture_type}")
-            client_active = False
         except Exception:
-            client_active = False
+            pass
+
+    async def send_frames():
+        send = websocket.send_bytes if protocol == broadcast.PROTOCOL_BINARY else websocket.send_text
+        while True:
+            await send(await subscriber.queue.get())
 
     listener_task = asyncio.create_task(listen_for_stop())
+    sender_task = asyncio.create_task(send_frames())
 
     try:
-        frame_count = 0
-        db_pending = 0  # track unsaved DB records for batched commits
-        while client_active:
-            # Capture frame and detect emotions (runs in threadpool to not block event loop)
-            frame_b64, results = await asyncio.get_event_loop().run_in_executor(
-                None, services.webcam_manager.capture_and_detect
-            )
-
-            if frame_b64 is None:
-                await asyncio.sleep(0.1)
-                continue
-
-            frame_count += 1
-
-            # Save detections to DB (batched every 10 frames to reduce I/O lag)
-            if results:
-                timestamp = datetime.now().isoformat()
-                for r in results:
-                    db.add(models.EmotionData(
-                        session_id=session_id,
-                        type=capture_type,
-                        emotion=r['emotion'],
-                        bbox=json.dumps(r['bbox']),
-                        timestamp=timestamp
-                    ))
-                db_pending += 1
-                if db_pending >= 10:
-                    await asyncio.get_event_loop().run_in_executor(None, db.commit)
-                    db_pending = 0
-
-            # Send frame + results to React client
-            await websocket.send_json({
-                "frame": frame_b64,
-                "results": results,
-                "face_count": len(results),
-                "timestamp": datetime.now().isoformat()
-            })
-
-            await asyncio.sleep(0.01)
-
+        done, _ = await asyncio.wait({listener_task, sender_task}, return_when=asyncio.FIRST_COMPLETED)
+        if sender_task in done and sender_task.exception():
+            raise sender_task.exception()
     except WebSocketDisconnect:
         print(f"[WS] Client disconnected unexpectedly — session={session_id}, type={capture_type}")
     except asyncio.CancelledError:
@@ -278,34 +674,30 @@ async def websocket_webcam(websocket: WebSocket, session_id: str, capture_type:
     except Exception as e:
         print(f"[WS] Error: {e} - type: {type(e)}")
     finally:
-        client_active = False
         listener_task.cancel()
-        # Flush any remaining batched DB records
-        try:
-            db.commit()
-        except Exception:
-            pass
-        services.webcam_manager.stop()
-        db.close()
+        sender_task.cancel()
+        # Last viewer of a target flushes its batched detections; last viewer overall releases the camera
+        await hub.unsubscribe(subscriber)
         print(f"[WS] Cleanup complete — session={session_id}, type={capture_type}")
 
 
 @app.get("/sessions/{session_id}/report")
-async def get_report(session_id: str, db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
-    
-    entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type.in_(['entry', 'video'])).all()
-    exit_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type == 'exit').all()
+async def get_report(session_id: str, request: Request, response: Response, db: AsyncSession = Depends(database.get_async_db)):
+    return await _conditional(request, response, db, session_id, lambda version: _cached_report(db, session_id, version))
+
+async def _cached_report(db: AsyncSession, session_id: str, version: Optional[int] = None) -> dict:
+    """_report through the analytics cache. Keyed by data_version (read here if not
+    given), so an entry cached before another process's write is never served."""
+    if version is None:
+        version = await _session_version(db, session_id)
+    return await cache_utils.cached_async(
+        _analytics_cache, ("report", session_id, version), lambda: _report(db, session_id), (session_id,))
+
+async def _report(db: AsyncSession, session_id: str) -> dict:
+    await _get_session_or_404(db, session_id)
     
-    entry_stats = services.calculate_advanced_stats(entry_data)
-    exit_stats = services.calculate_advanced_stats(exit_data)
-    
-    # Confirmed attendance = min of entry and exit face counts
-    # This represents students who were detected in BOTH entry and exit
-    entry_count = entry_stats["attendance_est"]
-    exit_count = exit_stats["attendance_est"]
-    confirmed_attendance = min(entry_count, exit_count) if entry_count > 0 and exit_count > 0 else max(entry_count, exit_count)
+    entry_stats, exit_stats = await db.run_sync(_session_stats, session_id)
+    confirmed_attendance = _confirmed_attendance(entry_stats["attendance_est"], exit_stats["attendance_est"])
     
     return {
         "entry_stats": entry_stats,
@@ -313,77 +705,206 @@ async def get_report(session_id: str, db: Session = Depends(database.get_db)):
         "confirmed_attendance": confirmed_attendance
     }
 
+# --- LIVE PUSH ---
+async def _live_report(session_id: str) -> dict:
+    """The /report payload for the live stream, through the same cache as polling."""
+    async with database.AsyncSessionLocal() as db:
+        return await _cached_report(db, session_id)
+
+live_stats = live.LiveStats(_live_report)
+
+@app.get("/sessions/{session_id}/stream")
+async def stream_report(session_id: str):
+    """Server-sent events with the /report payload: one "snapshot" event, then a
+    "delta" event with only the changed fields whenever new detections are
+    committed (at most LIVE_STATS_MAX_HZ per second). Every viewer of a session
+    shares one computation; the dashboard falls back to polling /report.
+    """
+    async with database.AsyncSessionLocal() as db:
+        if await _session_version(db, session_id) is None: raise HTTPException(404, "Not Found")
+
+    async def events():
+        viewer = live_stats.subscribe(session_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await viewer.next(live.KEEPALIVE_SECONDS)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                kind, data = message
+                yield f"event: {kind}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            live_stats.unsubscribe(session_id, viewer)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/sessions/{session_id}/impact")
-async def get_impact_analysis(session_id: str, db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
-    
-    entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type.in_(['entry', 'video'])).all()
-    exit_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type == 'exit').all()
+async def get_impact_analysis(session_id: str, request: Request, response: Response, db: AsyncSession = Depends(database.get_async_db)):
+    return await _conditional(request, response, db, session_id, lambda version: cache_utils.cached_async(
+        _analytics_cache, ("impact", session_id, version), lambda: _impact(db, session_id), (session_id,)))
+
+async def _impact(db: AsyncSession, session_id: str) -> dict:
+    await _get_session_or_404(db, session_id)
     
-    return services.calculate_teaching_impact(entry_data, exit_data)
+    (entry_counts, _), (exit_counts, _) = await db.run_sync(_session_counts, session_id)
+    return services.calculate_teaching_impact_from_counts(entry_counts, exit_counts)
 
 @app.get("/sessions/impact_trends")
-async def get_impact_trends(db: Session = Depends(database.get_db)):
-    sessions = db.query(models.Session).all()
+async def get_impact_trends(
+    response: Response,
+    sort: str = "created_at", order: str = "asc",
+    limit: Optional[int] = Query(None, ge=1, le=1000), offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(database.get_async_db)
+):
+    trends, total = await cache_utils.cached_async(
+        _analytics_cache, ("impact_trends", sort, order, limit, offset),
+        lambda: _impact_trends(db, sort, order, limit, offset), _page_tags,
+    )
+    response.headers["X-Total-Count"] = str(total)
+    return trends
+
+async def _impact_trends(db: AsyncSession, sort, order, limit, offset):
+    sessions, total = await db.run_sync(_page_sessions, sort, order, limit, offset)
+    session_aggs = await db.run_sync(aggregates.load_many, [s.id for s in sessions])
     trends = []
     for s in sessions:
-        entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == s.id, models.EmotionData.type.in_(['entry', 'video'])).all()
-        exit_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == s.id, models.EmotionData.type == 'exit').all()
-        result = services.calculate_teaching_impact(entry_data, exit_data)
+        rows = session_aggs.get(s.id, {})
+        entry_counts, _ = aggregates.combine(rows, aggregates.ENTRY_TYPES)
+        exit_counts, _ = aggregates.combine(rows, aggregates.EXIT_TYPES)
+        result = services.calculate_teaching_impact_from_counts(entry_counts, exit_counts)
         trends.append({
             "session_id": s.id,
             "class_name": s.class_name,
             "created_at": s.created_at,
             "impact_score": result["impact_score"]
         })
-    return sorted(trends, key=lambda x: x['created_at'])
+    return trends, total
+
+# --- PDF EXPORT ---
+# Reports render in reports.py's worker processes and are cached per data_version,
+# so exporting a finished session again is a memory read.
+REPORT_BATCH_MAX = int(os.getenv("REPORT_BATCH_MAX", "100"))
+
+async def _pdf_report(session_id: str, version: int) -> bytes:
+    """The session's PDF as of `version`. Uses its own DB session so a batch can render many at once."""
+    key = (session_id, version)
+    pdf = cache_utils.report_pdf_cache.get(key)
+    if pdf is None:
+        async with database.AsyncSessionLocal() as db:
+            session = await _get_session_or_404(db, session_id)
+            report = await _cached_report(db, session_id, version)
+        session_info = {"class_name": session.class_name, "instructor": session.instructor}
+        pdf = await reports.render_pdf_async(session_info, report["entry_stats"], report["exit_stats"], report["confirmed_attendance"])
+        # No generation guard: the key pins the version, and the stats read after it are never older
+        cache_utils.report_pdf_cache.set(key, pdf, (session_id,))
+    return pdf
 
 @app.get("/sessions/{session_id}/export_pdf")
-async def export_pdf(session_id: str, db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
-    
-    entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type.in_(['entry', 'video'])).all()
-    exit_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type == 'exit').all()
-    
-    entry_stats = services.calculate_advanced_stats(entry_data)
-    exit_stats = services.calculate_advanced_stats(exit_data)
-    
-    # Confirmed attendance = min of entry and exit counts
-    entry_count = entry_stats["attendance_est"]
-    exit_count = exit_stats["attendance_est"]
-    confirmed_attendance = min(entry_count, exit_count) if entry_count > 0 and exit_count > 0 else max(entry_count, exit_count)
-    
-    session_info = {"class_name": session.class_name, "instructor": session.instructor}
-    path = services.generate_pdf(session_info, entry_stats, exit_stats, confirmed_attendance)
-    
-    return FileResponse(path, media_type='application/pdf', filename="report.pdf")
+async def export_pdf(session_id: str, request: Request, db: AsyncSession = Depends(database.get_async_db)):
+    version = await _session_version(db, session_id)
+    if version is None: raise HTTPException(404, "Not Found")
+    etag = f'W/"{session_id}.{version}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Content-Disposition": 'attachment; filename="report.pdf"'}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(await _pdf_report(session_id, version), media_type="application/pdf", headers=headers)
+
+class PdfBatch(BaseModel):
+    session_ids: list[str]
+
+@app.post("/sessions/export_pdf")
+async def export_pdf_batch(batch: PdfBatch, db: AsyncSession = Depends(database.get_async_db)):
+    """Reports for several sessions as one ZIP (<session_id>.pdf each), rendered concurrently."""
+    session_ids = list(dict.fromkeys(batch.session_ids))
+    if not session_ids: raise HTTPException(400, "No sessions given")
+    if len(session_ids) > REPORT_BATCH_MAX: raise HTTPException(400, f"At most {REPORT_BATCH_MAX} sessions per export")
+    versions = [await _session_version(db, sid) for sid in session_ids]
+    missing = [sid for sid, version in zip(session_ids, versions) if version is None]
+    if missing: raise HTTPException(404, f"Sessions not found: {', '.join(missing)}")
+
+    # Bound the DB sessions held at once; rendering is bounded by the pool itself
+    limit = asyncio.Semaphore(max(1, reports.REPORT_WORKERS) * 2)
+    async def render(session_id, version):
+        async with limit:
+            return await _pdf_report(session_id, version)
+
+    pdfs = await asyncio.gather(*(render(sid, version) for sid, version in zip(session_ids, versions)))
+    archive = await run_in_threadpool(reports.zip_reports, [(f"{sid}.pdf", pdf) for sid, pdf in zip(session_ids, pdfs)])
+    return Response(archive, media_type="application/zip", headers={"Content-Disposition": 'attachment; filename="reports.zip"'})
+
+# --- AI COACH ---
+async def _chat_context(db: AsyncSession, session_id: str):
+    """The stats the coach is given for this session; 404 if there is no such session."""
+    session = await _get_session_or_404(db, session_id)
+    report = await _cached_report(db, session_id)
+    return {"entry_stats": report["entry_stats"], "info": {"class_name": session.class_name, "instructor": session.instructor}}
+
+async def _save_chat(db: AsyncSession, session_id: str, role: str, text: str):
+    db.add(models.ChatLog(session_id=session_id, role=role, text=text, timestamp=datetime.now().isoformat()))
+    cache_utils.mark_written(db, session_id)
+    await db.commit()
 
 @app.post("/sessions/{session_id}/chat")
-async def chat_with_assistant(session_id: str, chat: ai_service.ChatRequest, db: Session = Depends(database.get_db)):
-    session = db.query(models.Session).filter(models.Session.id == session_id).first()
-    if not session: raise HTTPException(404, "Not Found")
-    
-    # Save user message
-    db.add(models.ChatLog(session_id=session_id, role="user", text=chat.question, timestamp=datetime.now().isoformat()))
-    db.commit()
-    
-    # Get stats for context
-    entry_data = db.query(models.EmotionData).filter(models.EmotionData.session_id == session_id, models.EmotionData.type.in_(['entry', 'video'])).all()
-    stats = services.calculate_advanced_stats(entry_data)
-    
-    session_info = {"class_name": session.class_name, "instructor": session.instructor}
-    
-    response = ai_service.ask_teaching_assistant(chat.question, {"entry_stats": stats, "info": session_info})
-    
-    # Save bot response
-    db.add(models.ChatLog(session_id=session_id, role="bot", text=response, timestamp=datetime.now().isoformat()))
-    db.commit()
-    
+async def chat_with_assistant(session_id: str, chat: ai_service.ChatRequest, db: AsyncSession = Depends(database.get_async_db)):
+    context = await _chat_context(db, session_id)
+    await _save_chat(db, session_id, "user", chat.question)
+
+    response = await ai_service.ask_teaching_assistant(chat.question, context)
+
+    await _save_chat(db, session_id, "bot", response)
     return {"response": response}
 
+@app.post("/sessions/{session_id}/chat/stream")
+async def chat_with_assistant_stream(session_id: str, chat: ai_service.ChatRequest):
+    """Server-sent events: "token" events with {"text": chunk} as the answer is
+    generated, then one "done" event with {"response": full answer}, or an
+    "error" event with {"error": message, "response": partial answer and message}
+    if the coach times out or fails. The exchange is saved to the chat history
+    like POST /chat, including the part already streamed when the client
+    disconnects.
+    """
+    async with database.AsyncSessionLocal() as db:
+        context = await _chat_context(db, session_id)
+        await _save_chat(db, session_id, "user", chat.question)
+
+    async def save_reply(text):
+        async with database.AsyncSessionLocal() as db:
+            await _save_chat(db, session_id, "bot", text)
+
+    async def events():
+        parts = []
+        saved = False
+        try:
+            try:
+                async for part in ai_service.stream_teaching_assistant(chat.question, context):
+                    parts.append(part)
+                    yield f"event: token\ndata: {json.dumps({'text': part})}\n\n"
+            except ai_service.AssistantError as e:
+                response = ai_service.with_error("".join(parts), e)
+                event = f"event: error\ndata: {json.dumps({'error': str(e), 'response': response})}\n\n"
+            else:
+                response = "".join(parts)
+                event = f"event: done\ndata: {json.dumps({'response': response})}\n\n"
+            saved = True
+            await asyncio.shield(save_reply(response))
+            yield event
+        finally:
+            # The client went away mid-answer: keep what was streamed. Shielded, since the
+            # cancelled response would otherwise cancel the save along with it
+            if not saved and parts:
+                await asyncio.shield(save_reply("".join(parts)))
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.get("/sessions/{session_id}/chat_history")
-async def get_chat_history(session_id: str, db: Session = Depends(database.get_db)):
-    history = db.query(models.ChatLog).filter(models.ChatLog.session_id == session_id).order_by(models.ChatLog.id).all()
+async def get_chat_history(session_id: str, request: Request, response: Response, db: AsyncSession = Depends(database.get_async_db)):
+    return await _conditional(request, response, db, session_id, lambda _: _chat_history(db, session_id), missing_ok=True)
+
+async def _chat_history(db: AsyncSession, session_id: str) -> list:
+    history = (await db.scalars(
+        select(models.ChatLog).filter(models.ChatLog.session_id == session_id).order_by(models.ChatLog.id)
+    )).all()
     return [{"role": h.role, "text": h.text} for h in history]
\ No newline at end of file
@@ -1,10 +1,50 @@
-from database import engine
-from sqlalchemy import text
-print("Connected to DB, running alter...")
-try:
-    with engine.connect() as conn:
-        conn.execute(text("ALTER TABLE emotion_data ADD COLUMN person_id INTEGER DEFAULT -1;"))
-        conn.commit()
-    print("Column person_id added successfully.")
-except Exception as e:
-    print("Error (or already exists):", e)
+"""
+Idempotent schema upgrades for databases created by older versions.
+
+`create_all` only creates missing tables, so columns and indexes added to
+existing tables are applied here. The server runs `upgrade()` at startup, right
+after `create_all`; running this file does the same by hand.
+"""
+from sqlalchemy import inspect, text
+
+# (table, column, DDL) added since the table was first created
+COLUMNS = (
+    ("emotion_data", "person_id", "INTEGER DEFAULT -1"),  # legacy table, read by migrate_emotion_data.py
+    ("emotion_detections", "person_id", "INTEGER DEFAULT -1"),
+    ("emotion_detections", "job_number", "INTEGER"),
+    ("session_aggregates", "persons", "INTEGER DEFAULT 0"),
+    ("sessions", "data_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("video_jobs", "number", "INTEGER"),  # its unique index is created with the other indexes
+)
+
+
+def upgrade(engine, metadata=None, verbose: bool = False) -> list:
+    """Add missing columns and indexes. Returns what was added."""
+    if metadata is None:
+        import models
+        metadata = models.Base.metadata
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    added = []
+    with engine.begin() as conn:
+        for table, column, ddl in COLUMNS:
+            if table in tables and column not in {c["name"] for c in inspector.get_columns(table)}:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                added.append(f"{table}.{column}")
+    for table in metadata.sorted_tables:
+        existing = {i["name"] for i in inspector.get_indexes(table.name)} if table.name in tables else None
+        for index in table.indexes:
+            if existing is not None and index.name not in existing:
+                index.create(bind=engine)
+                added.append(index.name)
+    if verbose:
+        print(f"Schema upgraded: {', '.join(added)}" if added else "Schema is up to date.")
+    return added
+
+
+if __name__ == "__main__":
+    import models
+    from database import engine
+
+    models.Base.metadata.create_all(bind=engine)
+    upgrade(engine, verbose=True)
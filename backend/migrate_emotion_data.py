@@ -0,0 +1,150 @@
+"""
+Convert the legacy string-typed `emotion_data` table into the compact
+`emotion_detections` table (small-int codes, integer bbox, epoch-us timestamp).
+
+Rows are copied in id order, one batch per transaction, keeping their ids
+where the new table has not used them yet. The last legacy id copied is kept in
+its own marker table, committed with each batch, so an interrupted run resumes
+where it stopped even if the server has written to the new table meanwhile.
+The aggregates of every session in a batch are rebuilt in the same transaction,
+which also bumps their data_version so cached reports and ETags go stale.
+The legacy table is left in place unless --drop-legacy is given.
+
+Usage:
+    python migrate_emotion_data.py [--batch-size 5000] [--drop-legacy]
+"""
+import argparse
+import json
+import re
+
+from sqlalchemy import Column, Integer, MetaData, Table, func, inspect, select, text, update
+
+import models, ingest, aggregates
+from database import SessionLocal, engine
+
+LEGACY_TABLE = "emotion_data"
+
+_progress = Table(
+    "emotion_data_migration", MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("last_legacy_id", Integer, nullable=False),
+)
+
+# Some legacy writers stored repr(list of numpy ints): "[np.int64(1330), ...]"
+_NUMPY_INT = re.compile(r"np\.\w+\((-?\d+)\)")
+
+
+def parse_bbox(value) -> tuple:
+    """Legacy bbox string -> (x, y, w, h) ints, or four Nones if unreadable."""
+    if not value:
+        return (None,) * 4
+    try:
+        x, y, w, h = (int(v) for v in json.loads(_NUMPY_INT.sub(r"\1", value)))
+        return x, y, w, h
+    except (TypeError, ValueError):
+        return (None,) * 4
+
+
+def convert_row(row) -> dict:
+    """One legacy row -> compact column values, or None if it cannot be kept.
+    A row whose bbox cannot be read is kept with NULL bbox columns; only the
+    type and timestamp are required.
+    """
+    type_code = models.CAPTURE_TYPE_CODES.get(row["type"])
+    if type_code is None or not row["timestamp"]:
+        return None
+    try:
+        timestamp_us = models.timestamp_to_us(row["timestamp"])
+    except (TypeError, ValueError):
+        return None
+    x, y, w, h = parse_bbox(row["bbox"])
+    person_id = row.get("person_id")
+    return {
+        "id": row["id"],
+        "session_id": row["session_id"],
+        "type": type_code,
+        "emotion": models.EMOTION_CODES.get(row["emotion"]),
+        "bbox_x": x, "bbox_y": y, "bbox_w": w, "bbox_h": h,
+        "timestamp_us": timestamp_us,
+        "person_id": -1 if person_id is None else person_id,
+    }
+
+
+def _load_progress(db) -> int:
+    last_id = db.execute(select(_progress.c.last_legacy_id).where(_progress.c.id == 1)).scalar()
+    if last_id is None:
+        db.execute(_progress.insert().values(id=1, last_legacy_id=0))
+        return 0
+    return last_id
+
+
+def _insert_batch(db, rows: list) -> None:
+    """Insert converted rows, keeping each legacy id unless the new table already has it."""
+    E = models.EmotionData
+    taken = set(db.execute(select(E.id).where(E.id.in_([r["id"] for r in rows]))).scalars())
+    ingest.insert_rows(db, [r for r in rows if r["id"] not in taken], method="executemany")
+    _advance_sequence(db)
+    # Rows whose id the server already used get a new one
+    ingest.insert_rows(db, [{k: v for k, v in r.items() if k != "id"} for r in rows if r["id"] in taken],
+                       method="executemany")
+
+
+def _advance_sequence(db) -> None:
+    if engine.dialect.name == "postgresql":
+        # Ids were copied explicitly, so move the sequence past them
+        E = models.EmotionData
+        db.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('{E.__tablename__}', 'id'), "
+            f"COALESCE((SELECT MAX(id) FROM {E.__tablename__}), 1))"
+        ))
+
+
+def migrate(batch_size: int = 5000, drop_legacy: bool = False) -> tuple:
+    """Copy every legacy row not yet migrated. Returns (copied, skipped)."""
+    models.Base.metadata.create_all(bind=engine)
+    _progress.create(bind=engine, checkfirst=True)
+    if not inspect(engine).has_table(LEGACY_TABLE):
+        print(f"No {LEGACY_TABLE} table, nothing to migrate.")
+        return 0, 0
+
+    legacy = Table(LEGACY_TABLE, MetaData(), autoload_with=engine)
+    E = models.EmotionData
+    copied = skipped = 0
+    db = SessionLocal()
+    try:
+        last_id = _load_progress(db)
+        remaining = db.execute(select(func.count()).select_from(legacy).where(legacy.c.id > last_id)).scalar()
+        print(f"Migrating {remaining} row(s) from {LEGACY_TABLE} to {E.__tablename__}...")
+        while True:
+            batch = db.execute(
+                select(legacy).where(legacy.c.id > last_id).order_by(legacy.c.id).limit(batch_size)
+            ).mappings().all()
+            if not batch:
+                break
+            rows = [r for r in map(convert_row, batch) if r is not None]
+            skipped += len(batch) - len(rows)
+            _insert_batch(db, rows)
+            for session_id in {r["session_id"] for r in rows}:
+                aggregates.rebuild(db, session_id)
+            last_id = batch[-1]["id"]
+            db.execute(update(_progress).where(_progress.c.id == 1).values(last_legacy_id=last_id))
+            db.commit()
+            copied += len(rows)
+            print(f"  {copied + skipped}/{remaining}")
+    finally:
+        db.close()
+
+    if drop_legacy:
+        legacy.drop(bind=engine)
+        _progress.drop(bind=engine)
+        print(f"Dropped {LEGACY_TABLE}.")
+    print(f"Migrated {copied} row(s), skipped {skipped} unreadable row(s).")
+    return copied, skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--drop-legacy", action="store_true", help="drop emotion_data once every row is copied")
+    args = parser.parse_args()
+    migrate(args.batch_size, args.drop_legacy)
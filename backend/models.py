@@ -1,4 +1,6 @@
-from sqlalchemy import Column, Integer, String
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Index, UniqueConstraint
 from database import Base
 
 class User(Base):
@@ -19,17 +21,69 @@ class Session(Base):
     name = Column(String(100))
     class_name = Column(String(100))
     instructor = Column(String(100))
-    created_at = Column(String(30))
+    created_at = Column(String(30), index=True)
+    data_version = Column(Integer, default=0, nullable=False, server_default="0") # bumped on every commit that writes the session's rows (ETags)
+
+EMOTION_LABELS = ('Anger', 'Contempt', 'Disgust', 'Fear', 'Happiness', 'Neutral', 'Sadness', 'Surprise')
+CAPTURE_TYPES = ('entry', 'exit', 'video')
+
+# Small-int codes stored in emotion_detections; append only, never reorder
+EMOTION_CODES = {label: code for code, label in enumerate(EMOTION_LABELS)}
+CAPTURE_TYPE_CODES = {name: code for code, name in enumerate(CAPTURE_TYPES)}
+
+_EPOCH = datetime(1970, 1, 1)
+
+def timestamp_to_us(timestamp: str) -> int:
+    """ISO timestamp -> microseconds since the epoch, read as wall-clock time.
+    Naive timestamps round-trip exactly through us_to_timestamp.
+    """
+    dt = datetime.fromisoformat(timestamp)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone().replace(tzinfo=None)
+    return (dt - _EPOCH) // timedelta(microseconds=1)
+
+def us_to_timestamp(us: int) -> str:
+    return (_EPOCH + timedelta(microseconds=us)).isoformat()
 
 class EmotionData(Base):
-    __tablename__ = "emotion_data"
+    """One detected face. Replaces the legacy string-typed `emotion_data` table
+    (see migrate_emotion_data.py)."""
+    __tablename__ = "emotion_detections"
+    __table_args__ = (Index("ix_emotion_detections_session_type_ts", "session_id", "type", "timestamp_us"),)
+
+    id = Column(Integer, primary_key=True)
+    session_id = Column(String(36), nullable=False)
+    type = Column(SmallInteger, nullable=False) # CAPTURE_TYPE_CODES
+    emotion = Column(SmallInteger) # EMOTION_CODES
+    bbox_x = Column(Integer)
+    bbox_y = Column(Integer)
+    bbox_w = Column(Integer)
+    bbox_h = Column(Integer)
+    timestamp_us = Column(BigInteger, nullable=False) # timestamp_to_us()
+    person_id = Column(Integer, default=-1) # track id, -1 when untracked
+    job_number = Column(Integer) # VideoJob.number of the background job that wrote it, else NULL
+
+class SessionAggregate(Base):
+    __tablename__ = "session_aggregates"
+    __table_args__ = (UniqueConstraint("session_id", "type", name="uq_session_aggregates_session_type"),)
 
     id = Column(Integer, primary_key=True, index=True)
     session_id = Column(String(36), index=True)
     type = Column(String(20)) # entry, exit, video
-    emotion = Column(String(20))
-    bbox = Column(String(100)) # stored as string "[x,y,w,h]"
-    timestamp = Column(String(30))
+    total = Column(Integer, default=0)
+    # One counter per EMOTION_LABELS entry so inserts can increment atomically
+    count_anger = Column(Integer, default=0)
+    count_contempt = Column(Integer, default=0)
+    count_disgust = Column(Integer, default=0)
+    count_fear = Column(Integer, default=0)
+    count_happiness = Column(Integer, default=0)
+    count_neutral = Column(Integer, default=0)
+    count_sadness = Column(Integer, default=0)
+    count_surprise = Column(Integer, default=0)
+    max_faces = Column(Integer, default=0) # faces at the busiest timestamp
+    last_timestamp = Column(String(30))
+    last_timestamp_faces = Column(Integer, default=0)
+    persons = Column(Integer, default=0) # unique tracked people, best stream (attendance.py)
 
 class ChatLog(Base):
     __tablename__ = "chat_logs"
@@ -38,4 +92,59 @@ class ChatLog(Base):
     session_id = Column(String(36), index=True)
     role = Column(String(20)) # user, bot
     text = Column(String(5000)) # Large text
-    timestamp = Column(String(30))
\ No newline at end of file
+    timestamp = Column(String(30))
+
+JOB_KINDS = ('analyze', 'annotate')
+JOB_STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+
+class VideoJob(Base):
+    """A background video analysis (jobs.py). The row is the queue entry and
+    the durable job state; detections land in emotion_detections as usual."""
+    __tablename__ = "video_jobs"
+    __table_args__ = (Index("ix_video_jobs_status_priority", "status", "priority", "created_at"),)
+
+    id = Column(String(36), primary_key=True)
+    number = Column(Integer, unique=True, index=True) # stamped on its detections (emotion_detections.job_number); set when first claimed
+    session_id = Column(String(36), nullable=False, index=True)
+    type = Column(String(20), nullable=False) # CAPTURE_TYPES
+    kind = Column(String(20), nullable=False) # JOB_KINDS: analyze (detections only), annotate (plus MP4)
+    options = Column(String(500)) # JSON: mode, sample_policy, sample_fps
+    priority = Column(Integer, default=0, nullable=False) # higher runs first
+    status = Column(String(20), nullable=False) # JOB_STATUSES
+    owner = Column(String(100)) # host:pid running it
+    attempts = Column(Integer, default=0, nullable=False)
+    input_path = Column(String(500))
+    output_path = Column(String(500)) # annotated MP4, annotate jobs
+    frames_total = Column(Integer, default=0) # container estimate, 0 if unknown
+    frames_done = Column(Integer, default=0)
+    frames_detected = Column(Integer, default=0) # frames with at least one face
+    detections = Column(Integer, default=0)
+    error = Column(String(1000))
+    created_at = Column(String(30))
+    started_at = Column(String(30))
+    finished_at = Column(String(30))
+
+class Upload(Base):
+    """A resumable chunked upload (uploads.py)."""
+    __tablename__ = "uploads"
+
+    id = Column(String(36), primary_key=True)
+    session_id = Column(String(36), nullable=False, index=True)
+    type = Column(String(20), nullable=False) # CAPTURE_TYPES
+    filename = Column(String(255))
+    size = Column(BigInteger, nullable=False) # bytes
+    chunk_size = Column(Integer, nullable=False)
+    suffix = Column(String(10)) # container suffix, sniffed from chunk 0
+    streamable = Column(Integer, default=0) # 1 if the container decodes front to back
+    options = Column(String(500)) # JSON: video job kind, mode, sample_policy, sample_fps, priority, stream
+    status = Column(String(20), nullable=False) # receiving, complete
+    job_id = Column(String(36)) # video_jobs.id analysing it
+    created_at = Column(String(30))
+    updated_at = Column(String(30), index=True)
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+
+    upload_id = Column(String(36), primary_key=True)
+    number = Column(Integer, primary_key=True) # 0-based chunk index
+    sha256 = Column(String(64))
@@ -0,0 +1,103 @@
+"""
+Write the INT8 emotion model used by EMOTION_MODE=fast (see backends.py).
+
+Takes the FP32 HSEmotion ONNX model (EMOTION_ONNX_MODEL, or HSEmotion's
+download of EMOTION_MODEL), frees its input height/width so the fast mode can
+feed smaller crops, and quantizes it with ONNX Runtime:
+
+  static   QDQ INT8 weights and activations, calibrated on face crops from
+           --calibration-dir. Usually the faster of the two for this CNN.
+  dynamic  INT8 weights, activations quantized at run time. Needs no images.
+
+Usage:
+    python quantize_emotion_model.py --calibration-dir faces/ [--size 224] [--output enet_b0_8_best_afew.int8.onnx]
+    python quantize_emotion_model.py --method dynamic
+Then check the trade-off with benchmarks/eval_fast_emotion.py.
+"""
+import argparse
+import os
+import tempfile
+
+import cv2
+import onnx
+
+import backends
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def free_input_size(model_path: str, output_path: str) -> None:
+    """Copy the model with symbolic batch/height/width input dims."""
+    model = onnx.load(model_path)
+    for graph_input in model.graph.input:
+        dims = graph_input.type.tensor_type.shape.dim
+        if len(dims) == 4:
+            for dim, name in zip(dims, ("batch", None, "height", "width")):
+                if name:
+                    dim.dim_param = name
+    for graph_output in model.graph.output:
+        dims = graph_output.type.tensor_type.shape.dim
+        if dims:
+            dims[0].dim_param = "batch"
+    # Recorded intermediate shapes would still pin the old size
+    del model.graph.value_info[:]
+    onnx.save(model, output_path)
+
+
+def face_crops(directory: str, limit: int) -> list:
+    """RGB face crops from an image folder (each image is taken as one face)."""
+    crops = []
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_SUFFIXES):
+                image = cv2.imread(os.path.join(root, name))
+                if image is not None:
+                    crops.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+                if len(crops) >= limit:
+                    return crops
+    return crops
+
+
+def quantize(method: str, output: str, calibration_dir: str = None, calibration_size: int = 200, size: int = 0) -> None:
+    from onnxruntime.quantization import (CalibrationDataReader, QuantFormat, QuantType,
+                                          quantize_dynamic, quantize_static)
+
+    source = backends._emotion_model_path()
+    size = size or (224 if "_b0_" in backends.EMOTION_MODEL else 260)
+    with tempfile.TemporaryDirectory() as tmp:
+        flexible = os.path.join(tmp, "fp32.onnx")
+        free_input_size(source, flexible)
+
+        if method == "dynamic":
+            quantize_dynamic(flexible, output, weight_type=QuantType.QInt8)
+        else:
+            crops = face_crops(calibration_dir, calibration_size) if calibration_dir else []
+            if not crops:
+                raise SystemExit("Static quantization needs face images: pass --calibration-dir (or use --method dynamic)")
+            input_name = onnx.load(flexible).graph.input[0].name
+
+            class Crops(CalibrationDataReader):
+                def __init__(self):
+                    self._batches = iter([crops[i:i + 16] for i in range(0, len(crops), 16)])
+
+                def get_next(self):
+                    batch = next(self._batches, None)
+                    return None if batch is None else {input_name: backends._emotion_blob(batch, size)}
+
+            print(f"Calibrating on {len(crops)} face crop(s) at {size}x{size}...")
+            quantize_static(flexible, output, Crops(), quant_format=QuantFormat.QDQ, per_channel=True,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+    print(f"Wrote {output}: {os.path.getsize(output) / 1e6:.1f} MB (FP32 {os.path.getsize(source) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--method", choices=("static", "dynamic"), default="static")
+    parser.add_argument("--calibration-dir", help="folder of face crops for static calibration")
+    parser.add_argument("--calibration-size", type=int, default=200, help="at most this many calibration images")
+    parser.add_argument("--size", type=int, default=backends.EMOTION_FAST_SIZE,
+                        help="crop side to calibrate at; match EMOTION_FAST_SIZE (default: the model's own)")
+    parser.add_argument("--output", default=backends.EMOTION_FAST_MODEL)
+    args = parser.parse_args()
+    quantize(args.method, args.output, args.calibration_dir, args.calibration_size, args.size)
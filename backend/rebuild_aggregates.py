@@ -0,0 +1,26 @@
+"""
+Backfill the per-session stats aggregates from raw emotion_detections rows.
+
+Usage:
+    python rebuild_aggregates.py                 # every session
+    python rebuild_aggregates.py <session_id>... # only the given sessions
+"""
+import sys
+
+import models, aggregates
+from database import SessionLocal, engine
+
+models.Base.metadata.create_all(bind=engine)
+
+db = SessionLocal()
+try:
+    session_ids = sys.argv[1:] or [sid for (sid,) in db.query(models.Session.id)]
+    print(f"Rebuilding aggregates for {len(session_ids)} session(s)...")
+    for i, sid in enumerate(session_ids, 1):
+        aggregates.rebuild(db, sid)
+        db.commit()
+        if i % 100 == 0:
+            print(f"  {i}/{len(session_ids)}")
+    print("Aggregates rebuilt successfully.")
+finally:
+    db.close()
@@ -0,0 +1,108 @@
+"""
+PDF session reports.
+
+ReportLab is pure Python and holds the GIL for the whole render, so reports are
+drawn in a small pool of worker processes, straight into memory: nothing is
+written to disk and the API's event loop never waits on a render. Callers cache
+the returned bytes per session data_version (cache_utils.report_pdf_cache).
+"""
+import io
+import os
+import asyncio
+import zipfile
+import threading
+import multiprocessing as mp
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0: render in a thread instead
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_pdf(session_info: dict, before_stats: dict, after_stats: dict, confirmed_attendance: int = 0) -> bytes:
+    """Draw the session report and return the PDF document."""
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=letter)
+
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(50, 750, "Student Emotion Analysis Report")
+    c.setFont("Helvetica", 12)
+    c.drawString(50, 725, f"Generated : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    c.drawString(50, 710, f"Class     : {session_info.get('class_name', 'N/A')}")
+    c.drawString(50, 695, f"Instructor: {session_info.get('instructor', 'N/A')}")
+
+    c.setFont("Helvetica-Bold", 13)
+    c.drawString(50, 670, f"Confirmed Attendance (min of entry/exit): {confirmed_attendance} students")
+
+    def draw_stats(title, stats, start_y):
+        y = start_y
+        c.setFont("Helvetica-Bold", 14)
+        c.drawString(50, y, title);                                                    y -= 20
+        c.setFont("Helvetica", 12)
+        c.drawString(50, y, f"Vibe Score      : {stats['vibe_score']} / 10");          y -= 15
+        c.drawString(50, y, f"Attendance Est  : {stats['attendance_est']}");           y -= 15
+        c.drawString(50, y, f"Confusion Index : {stats['confusion_index']}%");         y -= 15
+        c.drawString(50, y, f"Boredom Meter   : {stats['boredom_meter']}%");           y -= 15
+        c.drawString(50, y, f"At-Risk Index   : {stats['at_risk_index']}%");           y -= 15
+        c.drawString(50, y, f"Total Readings  : {stats['total_faces']}");              y -= 20
+        c.setFont("Helvetica-Bold", 11)
+        c.drawString(50, y, "Emotion Breakdown:");                                     y -= 15
+        c.setFont("Helvetica", 11)
+        for emo, cnt in stats['counts'].items():
+            pct = round((cnt / stats['total_faces']) * 100, 1) if stats['total_faces'] else 0
+            c.drawString(60, y, f"{emo:<12}: {cnt:>4}  ({pct}%)")
+            y -= 14
+        return y
+
+    y = draw_stats("── Before Class ──", before_stats, 645)
+    y -= 20
+    draw_stats("── After Class ──", after_stats, y)
+
+    c.save()
+    return buffer.getvalue()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: workers import only this module, not the API's models
+            _pool = ProcessPoolExecutor(max_workers=max(1, REPORT_WORKERS), mp_context=mp.get_context("spawn"))
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def render_pdf_async(session_info: dict, before_stats: dict, after_stats: dict, confirmed_attendance: int = 0) -> bytes:
+    """render_pdf in the worker pool. Concurrent calls render side by side, up to REPORT_WORKERS at once."""
+    loop = asyncio.get_running_loop()
+    args = (session_info, before_stats, after_stats, confirmed_attendance)
+    if REPORT_WORKERS <= 0:
+        return await loop.run_in_executor(None, render_pdf, *args)
+    try:
+        return await loop.run_in_executor(_get_pool(), render_pdf, *args)
+    except BrokenProcessPool:
+        print("[PDF] Worker pool crashed; rendering in a thread")
+        _reset_pool()
+        return await loop.run_in_executor(None, render_pdf, *args)
+
+
+def zip_reports(named_pdfs) -> bytes:
+    """Bundle (filename, pdf bytes) pairs into one ZIP archive."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for filename, pdf in named_pdfs:
+            archive.writestr(filename, pdf)
+    return buffer.getvalue()
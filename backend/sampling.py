@@ -0,0 +1,126 @@
+"""
+Content-adaptive frame sampling for uploaded videos.
+
+Which frames of a recording are analysed is decided by time, not frame count:
+a policy targets `fps` analysed frames per second of video, so a 60 fps
+recording costs the same as a 30 fps one. Frames off that grid are only
+grabbed from the decoder (`cap.grab()`); only the candidates on it are
+retrieved (`cap.retrieve()`), which skips their colour conversion and copy.
+
+  fixed     analyse every candidate frame.
+  adaptive  compare each candidate with the last analysed frame on a small
+            grayscale thumbnail and analyse it only when enough of the picture
+            changed (people moving, a scene cut), or when `min_fps` says one is
+            due anyway. A static lecture drops to `min_fps`; a busy one stays
+            at `fps`.
+
+Usage:
+    sampler = SamplingPolicy("adaptive", fps=3).sampler(cap.get(cv2.CAP_PROP_FPS))
+    while cap.grab():
+        index += 1
+        if sampler.candidate(index):
+            ok, frame = cap.retrieve()
+            if ok and sampler.analyse(index, frame):
+                ...
+"""
+import os
+
+import cv2
+import numpy as np
+
+SAMPLE_POLICIES = ("fixed", "adaptive")
+VIDEO_SAMPLE_POLICY     = os.getenv("VIDEO_SAMPLE_POLICY", "adaptive")
+VIDEO_SAMPLE_FPS        = float(os.getenv("VIDEO_SAMPLE_FPS", "3"))       # analysed frames per second of video
+ANNOTATE_SAMPLE_FPS     = float(os.getenv("ANNOTATE_SAMPLE_FPS", "10"))   # annotated videos; boxes are tracked in between
+VIDEO_SAMPLE_MIN_FPS    = float(os.getenv("VIDEO_SAMPLE_MIN_FPS", "0.5"))  # adaptive floor for static content; 0 = none
+SAMPLE_CHANGE_THRESHOLD = float(os.getenv("SAMPLE_CHANGE_THRESHOLD", "0.02"))  # share of thumbnail pixels that must change
+SAMPLE_PIXEL_DELTA      = int(os.getenv("SAMPLE_PIXEL_DELTA", "20"))  # grey levels a pixel must move; above codec noise
+
+_THUMBNAIL_SIZE = (64, 36)
+_DEFAULT_VIDEO_FPS = 30  # for containers that report no frame rate
+
+
+def _thumbnail(frame) -> np.ndarray:
+    small = cv2.resize(frame, _THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+def change_score(a: np.ndarray, b: np.ndarray) -> float:
+    """Share of thumbnail pixels that moved more than SAMPLE_PIXEL_DELTA grey levels."""
+    return np.count_nonzero(cv2.absdiff(a, b) > SAMPLE_PIXEL_DELTA) / a.size
+
+
+class SamplingPolicy:
+    """How densely to analyse a video. Raises ValueError for invalid settings,
+    so request parameters can be passed straight in."""
+
+    __slots__ = ("name", "fps", "min_fps", "threshold")
+
+    def __init__(self, name: str = None, fps: float = None, min_fps: float = None, threshold: float = None):
+        self.name = name or VIDEO_SAMPLE_POLICY
+        self.fps = VIDEO_SAMPLE_FPS if fps is None else float(fps)
+        self.min_fps = min(VIDEO_SAMPLE_MIN_FPS, self.fps) if min_fps is None else float(min_fps)
+        self.threshold = SAMPLE_CHANGE_THRESHOLD if threshold is None else float(threshold)
+        if self.name not in SAMPLE_POLICIES:
+            raise ValueError(f"Unknown sampling policy {self.name!r}; choose one of: {', '.join(SAMPLE_POLICIES)}")
+        if not self.fps > 0:
+            raise ValueError("Sample rate must be above 0 frames per second")
+        if not 0 <= self.min_fps <= self.fps:
+            raise ValueError("Minimum sample rate must be between 0 and the sample rate")
+
+    def stride(self, video_fps: float) -> int:
+        """Frames between candidates for a video of `video_fps`."""
+        return max(1, round((video_fps if video_fps > 0 else _DEFAULT_VIDEO_FPS) / self.fps))
+
+    def sampler(self, video_fps: float) -> "FrameSampler":
+        return FrameSampler(self, video_fps)
+
+    def __repr__(self):
+        return f"SamplingPolicy({self.name!r}, fps={self.fps}, min_fps={self.min_fps}, threshold={self.threshold})"
+
+
+class FrameSampler:
+    """Per-stream sampling state. Frame indices are 1-based; frame 1 is always analysed.
+    Not thread-safe: each stream (a video or a range of one) owns its sampler."""
+
+    def __init__(self, policy: SamplingPolicy, video_fps: float):
+        video_fps = video_fps if video_fps > 0 else _DEFAULT_VIDEO_FPS
+        self.stride = policy.stride(video_fps)
+        self.adaptive = policy.name == "adaptive"
+        self.threshold = policy.threshold
+        # Longest run of frames an adaptive sampler may leave unanalysed
+        self.max_gap = max(self.stride, round(video_fps / policy.min_fps)) if policy.min_fps > 0 else None
+        self._last_thumbnail = None
+        self._last_index = 0
+        self.candidates = 0
+        self.analysed = 0
+
+    def candidate(self, index: int) -> bool:
+        """Whether frame `index` is on the sampling grid and should be retrieved."""
+        return (index - 1) % self.stride == 0
+
+    def analyse(self, index: int, frame) -> bool:
+        """Whether candidate frame `index` should be analysed."""
+        self.candidates += 1
+        if self.adaptive and not self._due(index, frame):
+            return False
+        self.analysed += 1
+        return True
+
+    def warm_up(self, index: int, frame) -> None:
+        """Feed candidate frame `index` from before this stream's first frame:
+        it updates the adaptive state like `analyse` but is not counted. A
+        sampler for one range of a video replays the frames before its range,
+        so it does not start cold and analyse the range's first candidate."""
+        if self.adaptive:
+            self._due(index, frame)
+
+    def _due(self, index: int, frame) -> bool:
+        thumbnail = _thumbnail(frame)
+        due = (self._last_thumbnail is None
+               or (self.max_gap is not None and index - self._last_index >= self.max_gap)
+               or change_score(thumbnail, self._last_thumbnail) >= self.threshold)
+        if due:
+            self._last_thumbnail = thumbnail
+            self._last_index = index
+        return due
@@ -2,103 +2,201 @@ import cv2
 import numpy as np
 import tempfile
 import os
-import uuid
 import json
 import base64
 import threading
-from datetime import datetime
+import subprocess
 from collections import Counter
 
-from hsemotion_onnx.facial_emotions import HSEmotionRecognizer
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
 import psutil
 
-# ─── Load Models (once at import time) ───────────────────────────────────────────
-face_net = cv2.dnn.readNetFromCaffe("deploy.prototxt", "face.caffemodel")
-fer = HSEmotionRecognizer(model_name='enet_b0_8_best_afew')
+import attendance
+import backends
+import inference
+import sampling
+import tracking
+import video_parallel
+
+# ─── Inference Settings ──────────────────────────────────────────────────────────
+FACE_DETECTOR_REPLICAS = int(os.getenv("FACE_DETECTOR_REPLICAS", str(min(4, os.cpu_count() or 1))))
+INFER_MAX_BATCH        = int(os.getenv("INFER_MAX_BATCH", "32"))     # faces per emotion batch
+INFER_MAX_WAIT_MS      = float(os.getenv("INFER_MAX_WAIT_MS", "5"))  # how long a batch waits for more callers
+FACE_DETECT_BATCH      = int(os.getenv("FACE_DETECT_BATCH", "8"))    # analysed video frames per detector pass
 
+# ─── Load Models (once at import time) ───────────────────────────────────────────
+# Engines are chosen by FACE_BACKEND / EMOTION_BACKEND (see backends.py).
+# Face detection: a small pool of independent replicas, so concurrent frames
+# detect in parallel instead of queueing on one locked net.
+backends.configure_threads()
+face_detectors = inference.ModelPool(
+    lambda: backends.load_face_detector(FACE_DETECTOR_REPLICAS), FACE_DETECTOR_REPLICAS
+)
 EMOTIONS = ['Anger', 'Contempt', 'Disgust', 'Fear', 'Happiness', 'Neutral', 'Sadness', 'Surprise']
 
-# ─── BUG FIX #4: Single lock covering all model inference ─────────────────────────
-# Using one lock for all inference prevents any lock-ordering deadlocks.
-_model_lock = threading.Lock()
+
+def _emotion_predictor(model):
+    def predict(face_crops: list) -> list:
+        """Batched emotion recognition; only ever called from the scheduler thread."""
+        emotions, scores_batch = model.predict(face_crops)
+        return list(zip(emotions, scores_batch))
+    return predict
+
+
+# Emotion recognition: crops from concurrent callers are merged into one
+# batched model call and handed back through futures. One model and scheduler
+# per emotion mode ("accurate" / "fast"); the default mode loads at import,
+# the other on first use.
+_emotion_schedulers = {}  # {mode: (model, BatchScheduler)}
+_emotion_lock = threading.Lock()
+
+
+def emotion_scheduler(mode: str = None) -> inference.BatchScheduler:
+    """The batch scheduler for `mode` (default EMOTION_MODE). Raises ValueError for
+    an unknown mode and FileNotFoundError if the fast model was never generated."""
+    mode = backends.emotion_mode(mode)
+    entry = _emotion_schedulers.get(mode)
+    if entry is None:
+        with _emotion_lock:
+            entry = _emotion_schedulers.get(mode)
+            if entry is None:
+                model = backends.load_emotion_model(mode)
+                scheduler = inference.BatchScheduler(
+                    _emotion_predictor(model), max_batch=INFER_MAX_BATCH, max_wait_ms=INFER_MAX_WAIT_MS, name=f"emotion-{mode}"
+                )
+                entry = _emotion_schedulers[mode] = (model, scheduler)
+    return entry[1]
+
+
+emotion_scheduler()
+
+
+def inference_stats() -> dict:
+    stats = {"face_detection": {**face_detectors.stats(), "backend": backends.FACE_BACKEND}}
+    for mode, (model, scheduler) in list(_emotion_schedulers.items()):
+        key = "emotion_recognition" if mode == backends.EMOTION_MODE else f"emotion_recognition_{mode}"
+        stats[key] = {**scheduler.stats(), "backend": model.name, "mode": mode}
+    return stats
 
 
 # ─── Face Detection Helper ────────────────────────────────────────────────────────
-def _detect_faces(frame, confidence_threshold=0.25):
-    """Detect faces in a BGR frame. Must be called with _model_lock held."""
-    h, w = frame.shape[:2]
-    blob = cv2.dnn.blobFromImage(
-        cv2.resize(frame, (300, 300)), 1.0,
-        (300, 300), (104.0, 177.0, 123.0)
+FACE_INPUT_SIZE = (300, 300)
+FACE_MEAN       = (104.0, 177.0, 123.0)
+FACE_BOX_PAD    = 20
+
+
+def detect_faces_batch(frames: list, confidence_threshold=0.25) -> list:
+    """Detect faces in several BGR frames (any sizes) with one forward pass of a
+    replica from the detector pool. Returns one [(x1, y1, x2, y2), ...] per frame."""
+    if not frames:
+        return []
+    blob = cv2.dnn.blobFromImages(
+        [cv2.resize(frame, FACE_INPUT_SIZE) for frame in frames], 1.0, FACE_INPUT_SIZE, FACE_MEAN
     )
-    face_net.setInput(blob)
-    detections = face_net.forward()
-
-    boxes = []
-    for i in range(detections.shape[2]):
-        confidence = detections[0, 0, i, 2]
-        if confidence < confidence_threshold:
-            continue
-        box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-        x1, y1, x2, y2 = box.astype("int")
-        pad = 20
-        x1 = max(0, x1 - pad)
-        y1 = max(0, y1 - pad)
-        x2 = min(w, x2 + pad)
-        y2 = min(h, y2 + pad)
-        boxes.append((x1, y1, x2, y2))
-    return boxes
+    with face_detectors.acquire() as face_net:
+        detections = face_net.detect(blob)
+
+    # Rows are (frame, class, confidence, x1, y1, x2, y2) with coordinates in 0..1
+    rows = detections.reshape(-1, 7)
+    image = rows[:, 0].astype(np.int64)
+    rows = rows[(rows[:, 2] >= confidence_threshold) & (image >= 0) & (image < len(frames))]
+    image = rows[:, 0].astype(np.int64)
+    sizes = np.array([frame.shape[1::-1] * 2 for frame in frames], np.float64)  # (w, h, w, h)
+    boxes = (rows[:, 3:7] * sizes[image]).astype(np.int64)
+    boxes[:, :2] = np.maximum(boxes[:, :2] - FACE_BOX_PAD, 0)
+    boxes[:, 2:] = np.minimum(boxes[:, 2:] + FACE_BOX_PAD, sizes[image, 2:].astype(np.int64))
+
+    # Group by frame, keeping the detector's order within each
+    order = np.argsort(image, kind="stable")
+    per_frame = np.split(boxes[order], np.cumsum(np.bincount(image, minlength=len(frames)))[:-1])
+    return [list(map(tuple, frame_boxes.tolist())) for frame_boxes in per_frame]
+
+
+def _detect_faces(frame, confidence_threshold=0.25):
+    """Detect faces in a BGR frame using a replica from the detector pool."""
+    return detect_faces_batch([frame], confidence_threshold)[0]
+
+
+def new_face_tracker(detect_every: int = None) -> tracking.FaceTracker:
+    """A tracker for one frame stream, backed by the pooled face detector."""
+    return tracking.FaceTracker(_detect_faces, detect_every)
 
 
 # ─── Process a Single Frame ───────────────────────────────────────────────────────
-def _process_frame(frame):
+def _process_frame(frame, tracker=None, mode: str = None, boxes=None):
     """Detect faces and predict emotions in one BGR frame.
-    Returns list of dicts: [{"emotion", "confidence", "bbox"}, ...]
+    With a `tracker` the boxes come from it (full detection only every N frames)
+    and each result carries the track's "person_id". `mode` picks the emotion
+    model ("accurate" / "fast", default EMOTION_MODE). `boxes` is a detection
+    of this frame already made (by detect_faces_batch), if any.
+    Returns list of dicts: [{"emotion", "confidence", "bbox"[, "person_id"]}, ...]
     """
-    with _model_lock:
-        boxes = _detect_faces(frame)
-        if not boxes:
+    scheduler = emotion_scheduler(mode)
+    with scheduler.caller():
+        if tracker is not None:
+            tracked = tracker.update(frame, boxes)
+        else:
+            tracked = [(None, bbox) for bbox in (_detect_faces(frame) if boxes is None else boxes)]
+        if not tracked:
             return []
 
         # Crop all faces for batch prediction
         face_crops = []
         valid_boxes = []
-        for bbox in boxes:
+        for person_id, bbox in tracked:
             x1, y1, x2, y2 = bbox
             face_crop = frame[y1:y2, x1:x2]
             if face_crop.size == 0:
                 continue
             face_rgb = cv2.cvtColor(face_crop, cv2.COLOR_BGR2RGB)
             face_crops.append(face_rgb)
-            valid_boxes.append(bbox)
+            valid_boxes.append((person_id, bbox))
 
         if not face_crops:
             return []
 
-        # Batch predict all faces at once (much faster)
-        emotions, scores_batch = fer.predict_multi_emotions(face_crops)
-        
-        results = []
-        for i in range(len(valid_boxes)):
-            emotion_label = emotions[i]
-            # scores_batch[i] is an array of probabilities, take max
-            top_idx = np.argmax(scores_batch[i])
-            confidence = round(float(scores_batch[i][top_idx]), 2)
-            
-            x1, y1, x2, y2 = valid_boxes[i]
-            results.append({
-                "emotion":    emotion_label,
-                "confidence": confidence,
-                "bbox":       [int(x1), int(y1), int(x2 - x1), int(y2 - y1)]  # [x, y, w, h]
-            })
-            
+        # Batch predict all faces at once, merged with other callers' faces
+        predictions = scheduler.predict(face_crops)
+
+    results = []
+    for (emotion_label, scores), (person_id, (x1, y1, x2, y2)) in zip(predictions, valid_boxes):
+        # scores is an array of probabilities, take max
+        top_idx = np.argmax(scores)
+        confidence = round(float(scores[top_idx]), 2)
+
+        result = {
+            "emotion":    emotion_label,
+            "confidence": confidence,
+            "bbox":       [int(x1), int(y1), int(x2 - x1), int(y2 - y1)]  # [x, y, w, h]
+        }
+        if person_id is not None:
+            result["person_id"] = person_id
+        results.append(result)
+
     return results
 
 
+def _process_frames(frames: list, tracker=None, mode: str = None) -> list:
+    """_process_frame over consecutive frames of one stream, with the frames
+    that need a full detection (all of them without a tracker) detected in one
+    batch. Returns one result list per frame."""
+    due = tracker.due(len(frames)) if tracker is not None else range(len(frames))
+    detected = dict(zip(due, detect_faces_batch([frames[i] for i in due])))
+    return [_process_frame(frame, tracker, mode, detected.get(i)) for i, frame in enumerate(frames)]
+
+
+def _follow_tracks(tracker, frame, last_results: list) -> list:
+    """Move the last emotion results onto the tracker's current boxes, without
+    running emotion recognition. Faces that left the frame are dropped."""
+    by_person = {r["person_id"]: r for r in last_results if "person_id" in r}
+    return [
+        dict(by_person[person_id], bbox=[int(x1), int(y1), int(x2 - x1), int(y2 - y1)])
+        for person_id, (x1, y1, x2, y2) in tracker.update(frame)
+        if person_id in by_person
+    ]
+
+
 # ─── Detect Emotion from Uploaded Image Bytes ────────────────────────────────────
-def detect_emotion_from_frame(file_bytes: bytes) -> list:
+def detect_emotion_from_frame(file_bytes: bytes, mode: str = None) -> list:
     """Process raw image bytes from an HTTP upload.
     Returns list of dicts: [{"emotion", "confidence", "bbox"}, ...]
     """
@@ -106,24 +204,30 @@ def detect_emotion_from_frame(file_bytes: bytes) -> list:
     frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
     if frame is None:
         return []
-    return _process_frame(frame)
+    return _process_frame(frame, mode=mode)
 
 
 # ─── Webcam Manager ───────────────────────────────────────────────────────────────
 class WebcamManager:
     """Manages a single shared webcam for WebSocket streaming."""
 
-    def __init__(self):
+    def __init__(self, camera_index: int = 0):
+        self._camera_index = camera_index
         self._cap = None
         self._cam_lock = threading.Lock()
         self._active_connections = 0
         self._latest_frame = None
         self._reader_thread = None
         self._stop_event = threading.Event()
-        # ─── Frame-skip optimisation: only run inference every N frames ───
+        # ─── Frame-skip optimisation: only run emotion inference every N frames ───
+        # In between, the tracker keeps the cached results on the moving faces.
         self._frame_counter = 0
-        self._skip_interval = 2  # detect every 2nd frame
+        self._skip_interval = 2  # classify every 2nd frame
         self._cached_results = []
+        self._tracker = new_face_tracker()
+        # Frame counter, cache and tracker are shared state; the broadcast hub is
+        # the only caller in practice, but direct callers must not interleave either.
+        self._detect_lock = threading.Lock()
 
     def _read_loop(self):
         """Continuously drain the camera buffer to prevent lag."""
@@ -141,10 +245,14 @@ class WebcamManager:
         with self._cam_lock:
             self._active_connections += 1
             if self._cap is None or not self._cap.isOpened():
-                self._cap = cv2.VideoCapture(0)
+                self._cap = cv2.VideoCapture(self._camera_index)
                 self._cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
                 self._cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
                 print("[Webcam] Camera opened")
+                with self._detect_lock:
+                    self._tracker = new_face_tracker()
+                    self._frame_counter = 0
+                    self._cached_results = []
                 import time
                 time.sleep(1.0)  # warm-up — crucial on Linux
 
@@ -171,8 +279,17 @@ class WebcamManager:
     def capture_and_detect(self):
         """Get the latest frame and run detection.
         Returns (frame_base64, results).
-        Runs inference only every Nth frame to prevent lag.
+        Runs emotion inference only every Nth frame and full face detection
+        only every TRACK_DETECT_EVERY frames to prevent lag; boxes follow the
+        faces on every frame.
         """
+        jpeg, results = self.capture_and_detect_jpeg()
+        if jpeg is None:
+            return None, []
+        return base64.b64encode(jpeg).decode('utf-8'), results
+
+    def capture_and_detect_jpeg(self):
+        """Like capture_and_detect, but returns raw JPEG bytes instead of base64."""
         # Grab the latest frame (no blocking I/O here!)
         with self._cam_lock:
             if self._latest_frame is None:
@@ -180,16 +297,17 @@ class WebcamManager:
             frame = self._latest_frame.copy()
 
         # ─── Frame-skip: only run expensive inference every N frames ─────
-        self._frame_counter += 1
-        if self._frame_counter % self._skip_interval == 1 or self._frame_counter == 1:
-            self._cached_results = _process_frame(frame)
+        with self._detect_lock:
+            self._frame_counter += 1
+            if self._frame_counter % self._skip_interval == 1 or self._frame_counter == 1:
+                self._cached_results = _process_frame(frame, self._tracker)
+            else:
+                self._cached_results = _follow_tracks(self._tracker, frame, self._cached_results)
 
-        results = self._cached_results
+            results = self._cached_results
 
         _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 50])
-        frame_b64 = base64.b64encode(buffer).decode('utf-8')
-
-        return frame_b64, results
+        return buffer.tobytes(), results
 
 
 # Global singleton
@@ -197,79 +315,188 @@ webcam_manager = WebcamManager()
 
 
 # ─── Process Uploaded Video File ──────────────────────────────────────────────────
-def process_video_file(file_bytes: bytes) -> list:
-    """Sample frames from an uploaded video and run emotion detection.
-    Returns list of dicts: [{"emotion", "confidence", "bbox"}, ...]
+def process_video_file(video_path: str, workers: int = None, on_frame=None, mode: str = None,
+                       policy: sampling.SamplingPolicy = None, on_progress=None) -> list:
+    """Sample frames from an uploaded video file and run emotion detection.
+    With `workers` > 1 (default VIDEO_WORKERS) frame ranges are analysed in
+    parallel worker processes. The caller owns (and deletes) `video_path`.
+    `on_frame(frame_results)` is called for each frame with detections, in order.
+    `on_progress(frames_done, frames_total)` is called as frames are read
+    (frames_total is the container's estimate, 0 if unknown); an exception it
+    raises aborts the analysis.
+    `mode` is the emotion mode, as for _process_frame; `policy` picks the frames
+    to analyse (default: VIDEO_SAMPLE_POLICY at VIDEO_SAMPLE_FPS, see sampling.py).
+    Returns list of per-frame lists: [[{"emotion", "confidence", "bbox"}, ...], ...]
     """
-    # ─── BUG FIX #5: Detect actual file type from magic bytes instead of
-    # always using .mp4 — some browsers send .webm or .mov which OpenCV
-    # fails to open when given the wrong extension.
-    suffix = _detect_video_suffix(file_bytes)
+    policy = policy or sampling.SamplingPolicy()
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp.write(file_bytes)
-    tmp.close()
+    workers = workers or video_parallel.VIDEO_WORKERS
+    # Ranges need a seekable file; a FIFO (an upload still arriving) is read in order
+    if workers > 1 and os.path.isfile(video_path):
+        results = video_parallel.analyze_video_parallel(video_path, policy, workers, mode, on_progress)
+        if results is not None:
+            if on_frame:
+                for frame_results in results:
+                    on_frame(frame_results)
+            return results
 
-    cap = cv2.VideoCapture(tmp.name)
+    cap = cv2.VideoCapture(video_path)
 
     if not cap.isOpened():
-        os.unlink(tmp.name)
-        print(f"[Video] Failed to open video file (detected suffix: {suffix})")
+        print(f"[Video] Failed to open video file: {video_path}")
         return []
 
     results = []
     frame_count = 0
-    sample_interval = 10  # analyze 1 frame every 10
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    tracker = new_face_tracker()
+    sampler = policy.sampler(cap.get(cv2.CAP_PROP_FPS))
+
+    batch = []
+
+    def flush():
+        for frame_results in _process_frames(batch, tracker, mode):
+            if frame_results:
+                results.append(frame_results)
+                if on_frame:
+                    on_frame(frame_results)
+        batch.clear()
 
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        # Frames off the sampling grid are only grabbed, never converted to BGR
+        while cap.grab():
             frame_count += 1
-            if frame_count % sample_interval != 0:
+            if on_progress:
+                on_progress(frame_count, total_frames)
+            if not sampler.candidate(frame_count):
                 continue
-            frame_results = _process_frame(frame)
-            if frame_results:
-                results.append(frame_results)
+            ret, frame = cap.retrieve()
+            if not ret or not sampler.analyse(frame_count, frame):
+                continue
+            # Analysed frames are detected FACE_DETECT_BATCH at a time
+            batch.append(frame)
+            if len(batch) >= FACE_DETECT_BATCH:
+                flush()
+        flush()
     finally:
         cap.release()
-        os.unlink(tmp.name)
 
+    print(f"[Video] Analysed {sampler.analysed} of {frame_count} frames ({policy.name}, {policy.fps:g}/s)")
     return results
 
+# ─── Annotated Video Encoding ────────────────────────────────────────────────────
+VIDEO_ENCODER      = os.getenv("VIDEO_ENCODER", "pipe")  # "pipe" (single pass) or "two_pass"
+FFMPEG_PRESET      = os.getenv("FFMPEG_PRESET", "fast")
+FFMPEG_CRF         = int(os.getenv("FFMPEG_CRF", "23"))
+FFMPEG_THREADS     = int(os.getenv("FFMPEG_THREADS", "0"))  # 0 = let ffmpeg decide
+VIDEO_OUTPUT_SCALE = float(os.getenv("VIDEO_OUTPUT_SCALE", "1.0"))
+
+
+def _h264_output_args(preset=None, crf=None, threads=None, scale=None) -> list:
+    """ffmpeg arguments for the browser-friendly H.264 MP4 output."""
+    scale = VIDEO_OUTPUT_SCALE if scale is None else scale
+    return [
+        # yuv420p needs even dimensions; the same filter applies the output scale
+        "-vf", f"scale=trunc(iw*{scale}/2)*2:trunc(ih*{scale}/2)*2",
+        "-vcodec", "libx264", "-pix_fmt", "yuv420p",
+        "-crf", str(FFMPEG_CRF if crf is None else crf),
+        "-preset", FFMPEG_PRESET if preset is None else preset,
+        "-threads", str(FFMPEG_THREADS if threads is None else threads),
+        "-movflags", "+faststart",
+    ]
+
+
+class _PipeVideoWriter:
+    """Single pass: raw BGR frames go straight into an ffmpeg H.264 encoder over stdin."""
+
+    def __init__(self, output_path, width, height, fps, **encode_options):
+        self.output_path = output_path
+        self._proc = subprocess.Popen(
+            ["ffmpeg", "-y", "-loglevel", "error",
+             "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps), "-i", "pipe:0",
+             *_h264_output_args(**encode_options), output_path],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def write(self, frame):
+        self._proc.stdin.write(memoryview(np.ascontiguousarray(frame)))
+
+    def close(self) -> bool:
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        return self._proc.wait() == 0
+
+
+class _TwoPassVideoWriter:
+    """Two passes: OpenCV writes an intermediate XVID AVI, then ffmpeg transcodes it."""
+
+    def __init__(self, output_path, width, height, fps, **encode_options):
+        self.output_path = output_path
+        self._encode_options = encode_options
+        # ─── BUG FIX: use a dedicated temp path for the intermediate AVI so the
+        # out_tmp name is not reused/deleted prematurely in the finally block.
+        out_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".avi")
+        self._temp_avi = out_tmp.name
+        out_tmp.close()
+        self._out = cv2.VideoWriter(self._temp_avi, cv2.VideoWriter_fourcc(*'XVID'), fps, (width, height))
+
+    def write(self, frame):
+        self._out.write(frame)
+
+    def close(self) -> bool:
+        self._out.release()
+        try:
+            subprocess.run(
+                ["ffmpeg", "-y", "-i", self._temp_avi, *_h264_output_args(**self._encode_options), self.output_path],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            return True
+        except Exception as e:
+            print(f"[Video] FFmpeg encoding failed: {e}")
+            return False
+        finally:
+            if os.path.exists(self._temp_avi):
+                os.unlink(self._temp_avi)
+
+
+_VIDEO_WRITERS = {"pipe": _PipeVideoWriter, "two_pass": _TwoPassVideoWriter}
+
+
 # ─── Process and Annotate Video File ─────────────────────────────────────────────
-def process_and_annotate_video(file_bytes: bytes):
-    """Process a video, draw emotions on frames, and return a tuple of
-    (path_to_annotated_mp4: str, all_results: list).
+def process_and_annotate_video(video_path: str, encoder: str = None, on_frame=None, mode: str = None,
+                               policy: sampling.SamplingPolicy = None, on_progress=None, **encode_options):
+    """Process a video file, draw emotions on frames, and return a tuple of
+    (path_to_annotated_mp4: str, all_results: list). The caller owns `video_path`.
+    `on_frame(frame_results)` is called for each analysed frame with detections,
+    `on_progress` as for process_video_file.
+    `encoder` is "pipe" or "two_pass" (default VIDEO_ENCODER); `encode_options`
+    may override preset, crf, threads and scale. `mode` is the emotion mode.
+    `policy` picks the frames to analyse (default: VIDEO_SAMPLE_POLICY at
+    ANNOTATE_SAMPLE_FPS); boxes on the other frames follow the face tracker.
     Returns ("", []) on any failure so callers always get a 2-tuple.
     """
-    suffix = _detect_video_suffix(file_bytes)
-
-    in_tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    in_tmp.write(file_bytes)
-    in_tmp.close()
-
-    cap = cv2.VideoCapture(in_tmp.name)
+    cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
-        os.unlink(in_tmp.name)
         # ─── BUG FIX: was returning a bare "" string; now always returns a 2-tuple
         return "", []
 
     width  = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
     fps    = cap.get(cv2.CAP_PROP_FPS)
     if fps == 0:
         fps = 30
 
-    # ─── BUG FIX: use a dedicated temp path for the intermediate AVI so the
-    # out_tmp name is not reused/deleted prematurely in the finally block.
-    out_tmp     = tempfile.NamedTemporaryFile(delete=False, suffix=".avi")
-    temp_avi    = out_tmp.name
-    out_tmp.close()
-
-    fourcc = cv2.VideoWriter_fourcc(*'XVID')
-    out    = cv2.VideoWriter(temp_avi, fourcc, fps, (width, height))
+    final_mp4 = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
+    try:
+        out = _VIDEO_WRITERS[encoder or VIDEO_ENCODER](final_mp4, width, height, fps, **encode_options)
+    except (KeyError, OSError) as e:
+        print(f"[Video] Could not start encoder {encoder or VIDEO_ENCODER!r}: {e}")
+        cap.release()
+        os.unlink(final_mp4)
+        return "", []
 
     # Dynamic sizing based on resolution
     base_dim   = max(width, height)
@@ -279,7 +506,11 @@ def process_and_annotate_video(file_bytes: bytes):
     all_results  = []
     last_results = []
     frame_count  = 0
-    sample_interval = 3  # analyze 1 out of every 3 frames
+    policy  = policy or sampling.SamplingPolicy(fps=sampling.ANNOTATE_SAMPLE_FPS)
+    sampler = policy.sampler(fps)
+    # Tracked on every frame so the drawn boxes never lag; detection cadence in frames
+    tracker = new_face_tracker(tracking.TRACK_DETECT_EVERY * sampler.stride)
+    encoded = False
 
     try:
         while True:
@@ -288,10 +519,17 @@ def process_and_annotate_video(file_bytes: bytes):
                 break
 
             frame_count += 1
-            if frame_count % sample_interval == 1 or frame_count == 1:
-                last_results = _process_frame(frame)
+            if on_progress:
+                on_progress(frame_count, total_frames)
+            # Every frame is decoded for drawing; the sampler only decides which get analysed
+            if sampler.candidate(frame_count) and sampler.analyse(frame_count, frame):
+                last_results = _process_frame(frame, tracker, mode)
                 if last_results:
                     all_results.append(last_results)
+                    if on_frame:
+                        on_frame(last_results)
+            else:
+                last_results = _follow_tracks(tracker, frame, last_results)
 
             # Draw on frame
             for res in last_results:
@@ -325,35 +563,27 @@ def process_and_annotate_video(file_bytes: bytes):
                             font_scale, (255, 255, 255), max(1, line_thick - 1))
 
             out.write(frame)
+        encoded = True
+    except BrokenPipeError:
+        print("[Video] FFmpeg encoder exited early")
     finally:
         cap.release()
-        out.release()
-        os.unlink(in_tmp.name)
+        encoded = out.close() and encoded
+        if not encoded and os.path.exists(final_mp4):
+            os.unlink(final_mp4)
 
-    # Convert to browser-friendly h264 mp4
-    import subprocess
-    final_mp4 = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4").name
-    try:
-        subprocess.run([
-            "ffmpeg", "-y", "-i", temp_avi,
-            "-vcodec", "libx264", "-pix_fmt", "yuv420p",
-            "-crf", "23", "-preset", "fast", final_mp4
-        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    except Exception as e:
-        print(f"[Video] FFmpeg encoding failed: {e}")
+    if not encoded:
         return "", []
-    finally:
-        # ─── BUG FIX: only clean up temp_avi (the AVI written by OpenCV).
-        # out_tmp.name == temp_avi so there is no separate stale file to delete.
-        if os.path.exists(temp_avi):
-            os.unlink(temp_avi)
 
     return final_mp4, all_results
 
 
-def _detect_video_suffix(file_bytes: bytes) -> str:
-    """Sniff the first few bytes to determine the video container format."""
-    header = file_bytes[:12]
+def detect_video_suffix(header: bytes) -> str:
+    """Sniff the first few bytes of an upload to determine the video container format."""
+    # ─── BUG FIX #5: Detect actual file type from magic bytes instead of
+    # always using .mp4 — some browsers send .webm or .mov which OpenCV
+    # fails to open when given the wrong extension.
+    header = header[:12]
     if header[:4] == b'\x1aE\xdf\xa3':
         return '.webm'
     if header[4:8] in (b'ftyp', b'moov', b'mdat'):
@@ -372,29 +602,40 @@ def calculate_advanced_stats(data_points) -> dict:
     """Calculate classroom analytics from emotion data points.
     Accepts SQLAlchemy ORM objects or plain dicts.
     """
-    empty = {
-        "total_faces": 0,
-        "counts": {e: 0 for e in EMOTIONS},
-        "confusion_index": 0,
-        "boredom_meter": 0,
-        "vibe_score": 0,
-        "attendance_est": 0,
-        "at_risk_index": 0
-    }
     if not data_points:
-        return empty
+        return stats_from_counts({})
 
     def _get(item, key):
         return getattr(item, key, None) or (item.get(key) if isinstance(item, dict) else None)
 
-    emotions   = [_get(d, 'emotion')   for d in data_points if _get(d, 'emotion')]
-    timestamps = [_get(d, 'timestamp') for d in data_points if _get(d, 'timestamp')]
+    emotions = [_get(d, 'emotion') for d in data_points if _get(d, 'emotion')]
+
+    # Group points into frames by timestamp for the attendance estimate
+    frames = {}
+    for d in data_points:
+        if _get(d, 'timestamp') and _get(d, 'emotion'):
+            frames.setdefault(_get(d, 'timestamp'), []).append(
+                {"emotion": _get(d, 'emotion'), "person_id": _get(d, 'person_id') or -1})
+
+    return stats_from_counts(Counter(emotions), attendance.estimate(frames.items()))
 
-    if not emotions:
-        return empty
 
-    counts      = Counter(emotions)
-    total       = len(emotions)
+def stats_from_counts(counts: dict, attendance: int = 0) -> dict:
+    """Calculate classroom analytics from per-emotion counts.
+    Used with pre-aggregated counts so reports never rescan raw rows.
+    """
+    total = sum(counts.values())
+    if not total:
+        return {
+            "total_faces": 0,
+            "counts": {e: 0 for e in EMOTIONS},
+            "confusion_index": 0,
+            "boredom_meter": 0,
+            "vibe_score": 0,
+            "attendance_est": 0,
+            "at_risk_index": 0
+        }
+
     safe_counts = {e: counts.get(e, 0) for e in EMOTIONS}
 
     confusion = ((safe_counts['Fear'] + safe_counts['Surprise']) / total) * 100
@@ -406,9 +647,6 @@ def calculate_advanced_stats(data_points) -> dict:
 
     risk = ((safe_counts['Sadness'] + safe_counts['Anger'] + safe_counts['Fear']) / total) * 100
 
-    valid_ts   = [t for t in timestamps if t]
-    attendance = max(Counter(valid_ts).values()) if valid_ts else 0
-
     return {
         "total_faces":     total,
         "counts":          safe_counts,
@@ -431,24 +669,34 @@ def get_system_health() -> dict:
 # ─── Teaching Impact Analysis ─────────────────────────────────────────────────────
 def calculate_teaching_impact(entry_data, exit_data) -> dict:
     """Compute emotion shift analysis and a composite Teaching Impact Score."""
-    POSITIVE = ['Happiness', 'Surprise']
-    NEGATIVE = ['Anger', 'Sadness', 'Fear', 'Disgust', 'Contempt']
-
     def _get(item, key):
         return getattr(item, key, None) or (item.get(key) if isinstance(item, dict) else None)
 
-    def get_pct(data_points):
-        if not data_points:
-            return {e: 0.0 for e in EMOTIONS}
-        emos = [_get(d, 'emotion') for d in data_points if _get(d, 'emotion')]
-        if not emos:
+    def get_counts(data_points):
+        return Counter(_get(d, 'emotion') for d in data_points or [] if _get(d, 'emotion'))
+
+    return calculate_teaching_impact_from_counts(
+        get_counts(entry_data), get_counts(exit_data),
+        has_data=bool(entry_data and exit_data)
+    )
+
+
+def calculate_teaching_impact_from_counts(entry_counts: dict, exit_counts: dict, has_data: bool = None) -> dict:
+    """Teaching impact from pre-aggregated per-emotion counts."""
+    POSITIVE = ['Happiness', 'Surprise']
+    NEGATIVE = ['Anger', 'Sadness', 'Fear', 'Disgust', 'Contempt']
+
+    def get_pct(counts):
+        t = sum(counts.values())
+        if not t:
             return {e: 0.0 for e in EMOTIONS}
-        c = Counter(emos)
-        t = len(emos)
-        return {e: round((c.get(e, 0) / t) * 100, 1) for e in EMOTIONS}
+        return {e: round((counts.get(e, 0) / t) * 100, 1) for e in EMOTIONS}
+
+    if has_data is None:
+        has_data = bool(sum(entry_counts.values()) and sum(exit_counts.values()))
 
-    entry_pct = get_pct(entry_data)
-    exit_pct = get_pct(exit_data)
+    entry_pct = get_pct(entry_counts)
+    exit_pct = get_pct(exit_counts)
     deltas = {e: round(exit_pct[e] - entry_pct[e], 1) for e in EMOTIONS}
 
     # Teaching Impact Score (0-100)
@@ -497,49 +745,5 @@ def calculate_teaching_impact(entry_data, exit_data) -> dict:
         "positive_shift": round(pos_shift, 1),
         "negative_shift": round(neg_shift, 1),
         "insights": insights,
-        "has_data": bool(entry_data and exit_data)
+        "has_data": has_data
     }
-
-
-# ─── PDF Report ───────────────────────────────────────────────────────────────────
-def generate_pdf(session_info: dict, before_stats: dict, after_stats: dict, confirmed_attendance: int = 0) -> str:
-    filename = f"report_{uuid.uuid4()}.pdf"
-    c = canvas.Canvas(filename, pagesize=letter)
-
-    c.setFont("Helvetica-Bold", 16)
-    c.drawString(50, 750, "Student Emotion Analysis Report")
-    c.setFont("Helvetica", 12)
-    c.drawString(50, 725, f"Generated : {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-    c.drawString(50, 710, f"Class     : {session_info.get('class_name', 'N/A')}")
-    c.drawString(50, 695, f"Instructor: {session_info.get('instructor', 'N/A')}")
-
-    c.setFont("Helvetica-Bold", 13)
-    c.drawString(50, 670, f"Confirmed Attendance (min of entry/exit): {confirmed_attendance} students")
-
-    def draw_stats(title, stats, start_y):
-        y = start_y
-        c.setFont("Helvetica-Bold", 14)
-        c.drawString(50, y, title);                                                    y -= 20
-        c.setFont("Helvetica", 12)
-        c.drawString(50, y, f"Vibe Score      : {stats['vibe_score']} / 10");          y -= 15
-        c.drawString(50, y, f"Attendance Est  : {stats['attendance_est']}");           y -= 15
-        c.drawString(50, y, f"Confusion Index : {stats['confusion_index']}%");         y -= 15
-        c.drawString(50, y, f"Boredom Meter   : {stats['boredom_meter']}%");           y -= 15
-        c.drawString(50, y, f"At-Risk Index   : {stats['at_risk_index']}%");           y -= 15
-        c.drawString(50, y, f"Total Readings  : {stats['total_faces']}");              y -= 20
-        c.setFont("Helvetica-Bold", 11)
-        c.drawString(50, y, "Emotion Breakdown:");                                     y -= 15
-        c.setFont("Helvetica", 11)
-        for emo, cnt in stats['counts'].items():
-            pct = round((cnt / stats['total_faces']) * 100, 1) if stats['total_faces'] else 0
-            c.drawString(60, y, f"{emo:<12}: {cnt:>4}  ({pct}%)")
-            y -= 14
-        return y
-
-    y = draw_stats("── Before Class ──", before_stats, 645)
-    y -= 20
-    draw_stats("── After Class ──", after_stats, y)
-
-    c.save()
-    print(f"[PDF] Report saved → {filename}")
-    return filename
\ No newline at end of file
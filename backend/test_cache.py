@@ -0,0 +1,118 @@
+"""
+The analytics cache (cache_utils.py): bounded LRU with TTL and tags, and the
+commit hooks that invalidate a session's entries and bump its data_version
+once, and only when, a transaction that wrote its rows commits.
+Run from backend/:
+    python -m pytest test_cache.py
+"""
+import time
+
+import pytest
+
+import cache_utils, database, models
+
+
+def _version(session_id) -> int:
+    db = database.SessionLocal()
+    try:
+        return db.get(models.Session, session_id).data_version
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def cache():
+    return cache_utils.Cache(ttl=60, max_size=3)
+
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for key in "abc":
+        cache.set(key, key.upper())
+    assert cache.get("a") == "A"
+    cache.set("d", "D")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entry_is_a_miss(cache):
+    cache.ttl = 0.01
+    cache.set("a", None)
+    assert cache.get("a", "missing") is None  # a cached None is a hit
+    time.sleep(0.02)
+    assert cache.get("a", "missing") == "missing"
+
+
+def test_invalidate_drops_tagged_entries_only(cache):
+    cache.set("report", 1, tags=["s1"])
+    cache.set("history", 2, tags=["s1", "s2"])
+    cache.set("other", 3, tags=["s2"])
+    assert cache.invalidate("s1") == 2
+    assert cache.get("report") is None and cache.get("history") is None
+    assert cache.get("other") == 3
+
+
+def test_value_computed_across_an_invalidation_is_not_stored(cache):
+    generation = cache.generation
+    cache.invalidate("s1")  # a write commits while the value is being computed
+    assert not cache.set("report", "stale", tags=["s1"], generation=generation)
+    assert cache.get("report") is None
+
+
+def test_commit_invalidates_and_bumps_the_version(session_id):
+    cache = cache_utils.session_stats_cache
+    cache.set(("report", session_id), "cached", tags=[session_id])
+    version = _version(session_id)
+
+    db = database.SessionLocal()
+    try:
+        cache_utils.mark_written(db, session_id)
+        db.flush()
+        assert cache.get(("report", session_id)) == "cached"  # nothing is visible before the commit
+        db.commit()
+    finally:
+        db.close()
+    assert cache.get(("report", session_id)) is None
+    assert _version(session_id) == version + 1
+
+
+def test_rollback_keeps_the_version(session_id):
+    version = _version(session_id)
+    db = database.SessionLocal()
+    try:
+        db.add(models.ChatLog(session_id=session_id, role="user", text="rolled back"))
+        cache_utils.mark_written(db, session_id)
+        db.flush()
+        db.rollback()
+        db.commit()  # a later commit in the same DB session must not count the rolled-back write
+    finally:
+        db.close()
+    assert _version(session_id) == version
+
+
+def test_savepoint_waits_for_the_outer_commit(session_id):
+    cache = cache_utils.session_stats_cache
+    cache.set(("report", session_id), "cached", tags=[session_id])
+    version = _version(session_id)
+    db = database.SessionLocal()
+    try:
+        with db.begin_nested():
+            cache_utils.mark_written(db, session_id)
+        assert cache.get(("report", session_id)) == "cached"
+        db.commit()
+    finally:
+        db.close()
+    assert cache.get(("report", session_id)) is None
+    assert _version(session_id) == version + 1
+
+
+def test_commit_listeners_get_the_written_sessions(session_id, monkeypatch):
+    seen = []
+    monkeypatch.setattr(cache_utils, "_commit_listeners", [seen.append])
+    db = database.SessionLocal()
+    try:
+        cache_utils.mark_written(db, session_id)
+        db.commit()
+    finally:
+        db.close()
+    assert seen == [{session_id}]
@@ -0,0 +1,65 @@
+"""
+Conditional GETs on the polled session endpoints: a client's validator keeps
+answering 304 until a commit writes the session's rows, then it is stale.
+Run from backend/:
+    python -m pytest test_etags.py
+"""
+import cv2
+import pytest
+
+from benchmarks.synthetic import make_frame
+
+
+def _analyze(client, session_id, faces=3):
+    jpeg = cv2.imencode(".jpg", make_frame(faces=faces))[1].tobytes()
+    response = client.post(f"/sessions/{session_id}/analyze", data={"type": "entry"},
+                           files={"file": ("frame.jpg", jpeg, "image/jpeg")})
+    assert response.status_code == 200
+    return response.json()["results"]
+
+
+@pytest.mark.parametrize("path", ["report", "impact", "details", "chat_history"])
+def test_etag_round_trip(client, session_id, path):
+    url = f"/sessions/{session_id}/{path}"
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+
+    not_modified = client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
+    assert not_modified.content == b""
+    assert client.get(url, headers={"If-None-Match": f'W/"other", {etag}'}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": "*"}).status_code == 304
+
+    assert _analyze(client, session_id)
+    stale = client.get(url, headers={"If-None-Match": etag})
+    assert stale.status_code == 200
+    assert stale.headers["ETag"] != etag
+    assert client.get(url, headers={"If-None-Match": stale.headers["ETag"]}).status_code == 304
+
+
+def test_stale_report_carries_the_new_data(client, session_id):
+    url = f"/sessions/{session_id}/report"
+    first = client.get(url)
+    assert first.json()["entry_stats"]["total_faces"] == 0
+
+    faces = len(_analyze(client, session_id))
+    second = client.get(url, headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.json()["entry_stats"]["total_faces"] == faces
+
+
+def test_chat_makes_the_history_stale(client, session_id):
+    url = f"/sessions/{session_id}/chat_history"
+    etag = client.get(url).headers["ETag"]
+    assert client.post(f"/sessions/{session_id}/chat", json={"question": "How is the class doing?"}).status_code == 200
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [message["role"] for message in response.json()] == ["user", "bot"]
+
+
+def test_unknown_session(client):
+    assert client.get("/sessions/no-such-session/report").status_code == 404
+    response = client.get("/sessions/no-such-session/chat_history")
+    assert response.status_code == 200 and response.json() == [] and "ETag" not in response.headers
@@ -0,0 +1,158 @@
+"""
+Background video jobs (jobs.py): claim and run to done, and the paths that must
+leave no detections behind (failure, cancellation, recovery after the owning
+process died). Run from backend/:
+    python -m pytest test_jobs.py
+"""
+import os
+import shutil
+import socket
+import threading
+import time
+from datetime import datetime
+
+import psutil
+import pytest
+from sqlalchemy import update
+
+import aggregates, database, ingest, jobs, models, services
+from benchmarks.synthetic import make_video
+from conftest import detection_count
+
+FACE = {"emotion": "Happiness", "confidence": 0.9, "bbox": [10, 20, 40, 50]}
+
+
+@pytest.fixture(scope="module")
+def clip(tmp_path_factory):
+    return make_video(str(tmp_path_factory.mktemp("clips") / "clip.mp4"), seconds=2, faces=2)
+
+
+@pytest.fixture
+def queue():
+    queue = jobs.JobQueue(workers=1)
+    queue.start()
+    yield queue
+    queue.stop()
+
+
+def _submit(queue, session_id, clip, capture_type="video") -> str:
+    upload = os.path.join(jobs.JOB_DIR, f"upload-{time.monotonic_ns()}.mp4")
+    shutil.copyfile(clip, upload)
+    return queue.submit(session_id, capture_type, "analyze", upload, {"sample_policy": "fixed", "sample_fps": 10})
+
+
+def _wait(queue, job_id, statuses=jobs.FINISHED, timeout=60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        state = queue.state(job_id)
+        if state["status"] in statuses:
+            return state
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {state['status']}")
+
+
+def _totals(session_id) -> dict:
+    db = database.SessionLocal()
+    try:
+        return {capture_type: sum(counts.values()) for capture_type, (counts, _) in aggregates.load(db, session_id).items()}
+    finally:
+        db.close()
+
+
+def _webcam_rows(session_id, frames=3) -> None:
+    """Rows written outside any job, which discarding a job must keep."""
+    db = database.SessionLocal()
+    try:
+        writer = ingest.DetectionWriter(db, session_id, "entry")
+        for i in range(frames):
+            writer.add(datetime.now().isoformat(), [FACE])
+        writer.close()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_job_runs_to_done(queue, session_id, clip):
+    job_id = _submit(queue, session_id, clip)
+    state = _wait(queue, job_id)
+    assert state["status"] == jobs.DONE
+    assert state["attempts"] == 1
+    assert state["detections"] > 0
+    assert state["progress"]["frames_done"] == state["progress"]["frames_total"]
+    assert detection_count(session_id) == state["detections"]
+    assert _totals(session_id) == {"video": state["detections"]}
+    assert not os.path.exists(os.path.join(jobs.JOB_DIR, job_id + ".mp4"))  # the finished job's input is removed
+
+
+def test_failed_job_discards_its_rows(queue, session_id, clip, monkeypatch):
+    _webcam_rows(session_id)
+
+    def fail_midway(path, on_frame=None, **options):
+        for _ in range(20):
+            on_frame([FACE, FACE])
+        raise RuntimeError("decoder crashed")
+
+    monkeypatch.setattr(services, "process_video_file", fail_midway)
+    state = _wait(queue, _submit(queue, session_id, clip))
+    assert state["status"] == jobs.FAILED
+    assert "decoder crashed" in state["error"]
+    assert detection_count(session_id) == 3
+    assert _totals(session_id) == {"entry": 3, "video": 0}
+
+
+def test_cancelled_job_discards_its_rows(queue, session_id, clip, monkeypatch):
+    _webcam_rows(session_id)
+    written = threading.Event()
+
+    def analyse_until_stopped(path, on_frame=None, on_progress=None, **options):
+        for _ in range(20):
+            on_frame([FACE])
+        written.set()
+        while True:
+            on_progress(20, 1000)  # raises once the job is cancelled
+            time.sleep(0.01)
+
+    monkeypatch.setattr(services, "process_video_file", analyse_until_stopped)
+    job_id = _submit(queue, session_id, clip)
+    assert written.wait(30)
+    assert detection_count(session_id, type=models.CAPTURE_TYPE_CODES["video"]) == 20
+    assert queue.cancel(job_id)
+    assert _wait(queue, job_id)["status"] == jobs.CANCELLED
+    assert detection_count(session_id) == 3
+    assert _totals(session_id) == {"entry": 3, "video": 0}
+    assert not queue.cancel(job_id)
+
+
+def _dead_pid() -> int:
+    pid = 4_000_000
+    while psutil.pid_exists(pid):
+        pid += 1
+    return pid
+
+
+@pytest.mark.parametrize("attempts, status", [(1, jobs.QUEUED), (jobs.JOB_MAX_ATTEMPTS, jobs.FAILED)])
+def test_job_of_a_dead_process_is_recovered(session_id, clip, attempts, status):
+    # Not started: nothing claims the job again before the test looks at it
+    queue = jobs.JobQueue(workers=1)
+    queue.owner = f"{socket.gethostname()}:{os.getpid()}"
+    job_id = _submit(queue, session_id, clip)
+    number = 1_000_000 + attempts
+    J = models.VideoJob
+    db = database.SessionLocal()
+    try:
+        db.execute(update(J).where(J.id == job_id).values(
+            status=jobs.RUNNING, owner=f"{socket.gethostname()}:{_dead_pid()}", attempts=attempts, number=number))
+        writer = ingest.DetectionWriter(db, session_id, "video", commit=True, job_number=number)
+        for i in range(10):
+            writer.add(datetime.now().isoformat(), [FACE])
+        writer.close()
+    finally:
+        db.close()
+    _webcam_rows(session_id)
+    assert detection_count(session_id) == 13
+
+    queue._maintain()
+    state = queue.state(job_id)
+    assert state["status"] == status
+    assert detection_count(session_id) == 3
+    assert _totals(session_id) == {"entry": 3, "video": 0}
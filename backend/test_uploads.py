@@ -0,0 +1,87 @@
+"""
+Resumable chunked uploads (uploads.py): an interrupted upload reports its
+missing chunks, a corrupted chunk is refused, and the resumed upload is
+analysed like the original file. Run from backend/:
+    python -m pytest test_uploads.py
+"""
+import hashlib
+import time
+
+import pytest
+
+import jobs, sampling, services, uploads
+from benchmarks.synthetic import make_video
+
+CHUNK = uploads.MIN_CHUNK_BYTES
+OPTIONS = {"sample_policy": "fixed", "sample_fps": 5}
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory) -> tuple:
+    path = make_video(str(tmp_path_factory.mktemp("clips") / "clip.mp4"), seconds=6, faces=2)
+    with open(path, "rb") as f:
+        data = f.read()
+    assert len(data) > 2 * CHUNK
+    return data, path
+
+
+def _put(client, upload_id, number, data, sha256=None):
+    chunk = data[number * CHUNK:(number + 1) * CHUNK]
+    return client.put(f"/uploads/{upload_id}/chunks/{number}", content=chunk,
+                      headers={"X-Chunk-SHA256": sha256 or hashlib.sha256(chunk).hexdigest()})
+
+
+def _wait(client, job_id, timeout=60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/video_jobs/{job_id}").json()
+        if job["status"] in jobs.FINISHED:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {job['status']}")
+
+
+def test_upload_resumes_after_a_missing_and_a_corrupted_chunk(client, session_id, video):
+    data, path = video
+    upload = client.post(f"/sessions/{session_id}/uploads", json={
+        "type": "video", "filename": "clip.mp4", "size": len(data), "chunk_size": CHUNK, **OPTIONS}).json()
+    chunks = upload["chunks"]
+    assert chunks == -(-len(data) // CHUNK)
+
+    # The connection drops before chunk 1 arrives
+    for number in range(chunks):
+        if number != 1:
+            assert _put(client, upload["id"], number, data).status_code == 200
+    response = client.post(f"/uploads/{upload['id']}/complete")
+    assert response.status_code == 400 and "missing" in response.json()["detail"]
+    state = client.get(f"/uploads/{upload['id']}").json()
+    assert state["missing_chunks"] == [1]
+    assert state["contiguous_bytes"] == CHUNK
+    assert state["bytes_received"] == len(data) - CHUNK
+
+    # A chunk damaged in transit is refused and stays missing
+    response = _put(client, upload["id"], 1, data, sha256=hashlib.sha256(b"something else").hexdigest())
+    assert response.status_code == 400 and "Checksum mismatch" in response.json()["detail"]
+    assert client.get(f"/uploads/{upload['id']}").json()["missing_chunks"] == [1]
+
+    assert _put(client, upload["id"], 1, data).status_code == 200
+    assert _put(client, upload["id"], 0, data).status_code == 200  # sending a chunk again is harmless
+    completed = client.post(f"/uploads/{upload['id']}/complete").json()
+    assert completed["status"] == uploads.COMPLETE and completed["missing_count"] == 0
+
+    job = _wait(client, completed["job"]["id"])
+    assert job["status"] == jobs.DONE
+    policy = sampling.SamplingPolicy(OPTIONS["sample_policy"], OPTIONS["sample_fps"])
+    expected = services.process_video_file(path, workers=1, policy=policy)
+    assert job["detections"] == sum(len(frame_results) for frame_results in expected)
+
+
+def test_chunk_of_the_wrong_size_is_refused(client, session_id, video):
+    data, _ = video
+    upload = client.post(f"/sessions/{session_id}/uploads", json={
+        "type": "video", "size": len(data), "chunk_size": CHUNK, **OPTIONS}).json()
+    response = client.put(f"/uploads/{upload['id']}/chunks/0", content=data[:CHUNK - 1])
+    assert response.status_code == 400
+    assert client.put(f"/uploads/{upload['id']}/chunks/{upload['chunks']}", content=b"x").status_code == 400
+    assert client.delete(f"/uploads/{upload['id']}").json() == {"status": "deleted"}
+    assert client.get(f"/uploads/{upload['id']}").status_code == 404
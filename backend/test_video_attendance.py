@@ -0,0 +1,43 @@
+"""
+Attendance from a video must not depend on how many worker processes analyse it.
+Uses the stub backends (no model weights) on synthetic clips; run from backend/:
+    python -m pytest test_video_attendance.py
+"""
+import os
+
+os.environ.setdefault("INFER_BACKEND", "stub")
+
+import cv2
+import pytest
+
+import attendance, sampling, services, video_parallel
+from benchmarks.synthetic import make_frame, make_video
+
+
+@pytest.fixture(scope="module")
+def clips(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("clips")
+    static = str(directory / "static.mp4")
+    writer = cv2.VideoWriter(static, cv2.VideoWriter_fourcc(*"mp4v"), 30, (640, 480))
+    frame = make_frame(faces=3)
+    for _ in range(30 * 30):
+        writer.write(frame)
+    writer.release()
+    yield {"static": static, "moving": make_video(str(directory / "moving.mp4"), seconds=30, faces=1)}
+    video_parallel._reset_pool()
+
+
+def _attendance(path: str, workers: int, policy: str) -> int:
+    results = services.process_video_file(path, workers=workers, policy=sampling.SamplingPolicy(policy, 3))
+    return attendance.estimate((None, frame_results) for frame_results in results)
+
+
+@pytest.mark.parametrize("clip", ["static", "moving"])
+@pytest.mark.parametrize("policy", sampling.SAMPLE_POLICIES)
+def test_parallel_attendance_matches_sequential(clips, clip, policy):
+    sequential = _attendance(clips[clip], 1, policy)
+    assert _attendance(clips[clip], 4, policy) == sequential
+
+
+def test_static_clip_counts_each_face_once(clips):
+    assert _attendance(clips["static"], 4, "fixed") == 3
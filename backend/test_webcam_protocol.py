@@ -0,0 +1,88 @@
+"""
+The webcam WebSocket wire formats (broadcast.py): binary viewers get the raw
+JPEG behind a length-prefixed JSON sidecar, JSON viewers the same frame in
+base64, and one shared producer persists the detections once.
+Uses a fake camera; run from backend/:
+    python -m pytest test_webcam_protocol.py
+"""
+import base64
+import json
+import time
+
+import cv2
+import pytest
+
+import broadcast, main
+from benchmarks.synthetic import make_frame
+from conftest import detection_count
+
+CAMERA = 99  # not a real device: the hub is registered with a fake camera
+JPEG = cv2.imencode(".jpg", make_frame(faces=2))[1].tobytes()
+RESULTS = [{"emotion": "Happiness", "confidence": 0.9, "bbox": [10, 20, 40, 50]},
+           {"emotion": "Neutral", "confidence": 0.8, "bbox": [200, 20, 40, 50]}]
+
+
+class FakeCamera:
+    def __init__(self):
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def capture_and_detect_jpeg(self):
+        time.sleep(0.01)
+        return JPEG, RESULTS
+
+
+@pytest.fixture
+def camera(monkeypatch):
+    camera = FakeCamera()
+    monkeypatch.setitem(main._webcam_hubs, CAMERA, broadcast.WebcamHub(camera, main._persist_webcam_frames))
+    return camera
+
+
+def test_binary_frame_round_trip():
+    sidecar = {"results": RESULTS, "face_count": 2, "timestamp": "2025-01-01T10:00:00"}
+    message = broadcast.encode_binary_frame(JPEG, sidecar)
+    assert message[0] == broadcast.BINARY_VERSION
+    assert int.from_bytes(message[1:5], "big") == len(message) - 5 - len(JPEG)
+    assert broadcast.decode_binary_frame(message) == (JPEG, sidecar)
+    with pytest.raises(ValueError):
+        broadcast.decode_binary_frame(bytes([broadcast.BINARY_VERSION + 1]) + message[1:])
+
+
+def test_viewers_get_their_own_format(client, session_id, camera):
+    url = f"/ws/webcam/{session_id}/entry?camera={CAMERA}"
+    with client.websocket_connect(f"{url}&protocol=binary") as binary, \
+            client.websocket_connect(url, subprotocols=[main.WS_BINARY_SUBPROTOCOL]) as negotiated, \
+            client.websocket_connect(url) as text:
+        assert negotiated.accepted_subprotocol == main.WS_BINARY_SUBPROTOCOL
+        for viewer in (binary, negotiated):
+            jpeg, sidecar = broadcast.decode_binary_frame(viewer.receive_bytes())
+            assert jpeg == JPEG
+            assert sidecar["results"] == RESULTS and sidecar["face_count"] == 2
+        message = json.loads(text.receive_text())
+        assert base64.b64decode(message["frame"]) == JPEG
+        assert message["results"] == RESULTS and message["face_count"] == 2
+        for viewer in (binary, negotiated, text):
+            viewer.send_text("stop")
+        # The last viewer leaving flushes the detections, once for all three, then
+        # releases the camera (waited for here: leaving the block cancels the handlers)
+        deadline = time.monotonic() + 10
+        while camera.running and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert not camera.running
+    rows = detection_count(session_id)
+    assert rows > 0 and rows % len(RESULTS) == 0
+    assert rows // len(RESULTS) <= main._webcam_hubs[CAMERA].frames_produced
+
+
+def test_invalid_capture_type_is_refused(client, session_id, camera):
+    from starlette.websockets import WebSocketDisconnect
+    with pytest.raises(WebSocketDisconnect):
+        with client.websocket_connect(f"/ws/webcam/{session_id}/nowhere?camera={CAMERA}") as ws:
+            ws.receive_bytes()
+    assert not camera.running
@@ -0,0 +1,149 @@
+"""
+Detect-every-N face tracking.
+
+`FaceTracker` runs the full face detector only every `detect_every` frames, or
+as soon as a track is lost. In between it moves each box by the median
+Lucas-Kanade optical flow of a few corner points inside it, which costs a
+fraction of an SSD forward pass. Detections are matched to existing tracks by
+IoU, so a student keeps the same track id (stored as `person_id`) from frame to
+frame.
+"""
+import os
+
+import cv2
+import numpy as np
+
+TRACK_DETECT_EVERY = int(os.getenv("TRACK_DETECT_EVERY", "5"))  # 1 = detect on every frame
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_MAX_MISSED = int(os.getenv("TRACK_MAX_MISSED", "1"))  # detection rounds a track may go unmatched
+
+_FEATURE_PARAMS = dict(maxCorners=20, qualityLevel=0.01, minDistance=3, blockSize=3)
+_FLOW_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                    criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+_MIN_FLOW_POINTS = 3
+
+
+def iou(a, b) -> float:
+    """Intersection over union of two (x1, y1, x2, y2) boxes."""
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class _Track:
+    __slots__ = ("id", "box", "missed")
+
+    def __init__(self, track_id: int, box):
+        self.id = track_id
+        self.box = box
+        self.missed = 0
+
+
+class FaceTracker:
+    """Stable-id face boxes for one frame stream (a camera, a video or a range of one).
+
+    `detect_fn(frame) -> [(x1, y1, x2, y2), ...]` is the full detector.
+    Not thread-safe: each stream owns its tracker.
+    """
+
+    def __init__(self, detect_fn, detect_every: int = None, iou_threshold: float = None, max_missed: int = None):
+        self._detect_fn = detect_fn
+        self.detect_every = max(1, TRACK_DETECT_EVERY if detect_every is None else detect_every)
+        self.iou_threshold = TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_missed = TRACK_MAX_MISSED if max_missed is None else max_missed
+        self._tracks = []
+        self.issued = 0  # track ids handed out so far; ids run 1..issued
+        self._prev_gray = None
+        self._since_detect = 0
+        self.frames = 0
+        self.detections = 0
+
+    def update(self, frame, boxes=None) -> list:
+        """Advance to `frame`. `boxes`, if given, is a detection of this frame made
+        ahead of time (see `due`) and is used instead of calling the detector.
+        Returns [(track_id, (x1, y1, x2, y2)), ...] of visible faces."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.frames += 1
+        first = self._prev_gray is None
+        lost = not first and not self._propagate(self._prev_gray, gray, frame.shape)
+        self._prev_gray = gray
+
+        self._since_detect += 1
+        if boxes is not None or first or lost or self._since_detect >= self.detect_every:
+            self._match(self._detect_fn(frame) if boxes is None else boxes)
+            self.detections += 1
+            self._since_detect = 0
+        return [(t.id, t.box) for t in self._tracks if t.missed == 0]
+
+    def due(self, count: int) -> list:
+        """Which of the next `count` frames (0-based) will need a full detection,
+        assuming no track is lost in between, so they can be detected as a batch."""
+        due, since = [], self._since_detect
+        for i in range(count):
+            since += 1
+            if (i == 0 and self._prev_gray is None) or since >= self.detect_every:
+                due.append(i)
+                since = 0
+        return due
+
+    def stats(self) -> dict:
+        return {"frames": self.frames, "detections": self.detections, "tracks": len(self._tracks), "issued": self.issued}
+
+    def _propagate(self, prev_gray, gray, shape) -> bool:
+        """Shift every box by its median optical flow. False if a visible track lost its points."""
+        h, w = shape[:2]
+        ok = True
+        for track in self._tracks:
+            x1, y1, x2, y2 = track.box
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                ok = ok and track.missed > 0
+                continue
+            points = cv2.goodFeaturesToTrack(prev_gray[y1:y2, x1:x2], **_FEATURE_PARAMS)
+            if points is None or len(points) < _MIN_FLOW_POINTS:
+                ok = ok and track.missed > 0
+                continue
+            points = points + np.array([x1, y1], np.float32)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, points, None, **_FLOW_PARAMS)
+            good = status.reshape(-1) == 1
+            if good.sum() < _MIN_FLOW_POINTS:
+                ok = ok and track.missed > 0
+                continue
+            dx, dy = np.median((moved - points).reshape(-1, 2)[good], axis=0)
+            dx, dy = int(round(dx)), int(round(dy))
+            bw, bh = x2 - x1, y2 - y1
+            nx1 = min(max(0, x1 + dx), w - bw)
+            ny1 = min(max(0, y1 + dy), h - bh)
+            track.box = (nx1, ny1, nx1 + bw, ny1 + bh)
+        return ok
+
+    def _match(self, boxes) -> None:
+        """Greedy IoU assignment of fresh detections to existing tracks."""
+        pairs = sorted(
+            ((iou(t.box, b), ti, bi) for ti, t in enumerate(self._tracks) for bi, b in enumerate(boxes)),
+            reverse=True,
+        )
+        matched_tracks, matched_boxes = set(), set()
+        for score, ti, bi in pairs:
+            if score < self.iou_threshold:
+                break
+            if ti in matched_tracks or bi in matched_boxes:
+                continue
+            track = self._tracks[ti]
+            track.box, track.missed = tuple(int(v) for v in boxes[bi]), 0
+            matched_tracks.add(ti)
+            matched_boxes.add(bi)
+
+        kept = []
+        for ti, track in enumerate(self._tracks):
+            if ti not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            kept.append(track)
+        for bi, box in enumerate(boxes):
+            if bi not in matched_boxes:
+                self.issued += 1
+                kept.append(_Track(self.issued, tuple(int(v) for v in box)))
+        self._tracks = kept
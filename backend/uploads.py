@@ -0,0 +1,430 @@
+"""
+Resumable chunked uploads for large recordings.
+
+A client initiates an upload with the file size and then PUTs fixed-size
+chunks by number, each with its SHA-256 in an X-Chunk-SHA256 header. Chunks may
+arrive in any order, in parallel and more than once. Each is written in place
+into a file preallocated in UPLOAD_DIR, so assembly needs no extra copy. After
+a dropped connection the client asks which byte ranges arrived, sends only the
+missing chunks, and then finalises.
+
+Analysis need not wait for the last byte. Once chunk 0 shows a container that
+decodes front to back (WebM, Ogg, AVI, or an MP4 whose index comes before its
+media data), a video job (jobs.py) can start on the received prefix
+(where the platform has FIFOs; see STREAMING):
+`video_source` feeds the file's contiguous prefix through a FIFO to OpenCV,
+waiting for chunks as they land, so process_video_file and
+process_and_annotate_video read the upload as a stream. Other containers start
+when the upload is finalised; a plain MP4 written with its index at the end
+cannot be decoded until the last chunk arrives.
+
+Usage (client):
+    POST /sessions/{id}/uploads     {"filename", "size", "type", ...} -> {"id", "chunk_size", "chunks"}
+    PUT  /uploads/{id}/chunks/{n}   body: the chunk's bytes; X-Chunk-SHA256: <hex digest>
+    GET  /uploads/{id}              received byte ranges and missing chunks
+    POST /uploads/{id}/complete     -> the upload and its video job
+"""
+import contextlib
+import errno
+import hashlib
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select, update
+
+import database, models, services
+
+UPLOAD_DIR                 = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_BYTES         = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_MAX_BYTES           = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 ** 3)))
+UPLOAD_STREAM_POLL_SECONDS = float(os.getenv("UPLOAD_STREAM_POLL_SECONDS", "0.5"))
+UPLOAD_STALL_SECONDS       = float(os.getenv("UPLOAD_STALL_SECONDS", "600"))  # a streaming job gives up after this long without new bytes
+UPLOAD_RETENTION_HOURS     = float(os.getenv("UPLOAD_RETENTION_HOURS", "24"))  # untouched uploads are removed after this
+
+MIN_CHUNK_BYTES = 256 * 1024
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+MISSING_LIST_MAX = 1000  # chunk numbers listed per status response
+
+RECEIVING, COMPLETE = "receiving", "complete"
+# Analysing a partial upload needs a FIFO. Jobs commit their detections per
+# chunk, so chunk uploads can still commit while one runs, on SQLite too
+STREAMING = hasattr(os, "mkfifo")
+
+_STREAMABLE_SUFFIXES = (".webm", ".ogv", ".avi")
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="microseconds")
+
+
+def streamable(header: bytes, suffix: str) -> bool:
+    """Whether a container with this first chunk can be decoded as it arrives."""
+    if suffix in _STREAMABLE_SUFFIXES:
+        return True
+    # MP4/MOV: the index ("moov") must come before the media data ("mdat"), as
+    # in fast-start or fragmented files
+    offset = 0
+    while offset + 8 <= len(header):
+        size, box = struct.unpack(">I4s", header[offset:offset + 8])
+        if box == b"moov":
+            return True
+        if box == b"mdat":
+            return False
+        if size == 1 and offset + 16 <= len(header):
+            size = struct.unpack(">Q", header[offset + 8:offset + 16])[0]
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def part_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+
+def final_path(upload: models.Upload) -> str:
+    """Where the assembled file lives once complete; video jobs are given this path."""
+    return os.path.join(UPLOAD_DIR, upload.id + (upload.suffix or ".mp4"))
+
+
+def video_path(upload_id: str):
+    """The path video jobs on the upload analyse, or None if there is no such upload."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        return final_path(upload) if upload is not None else None
+    finally:
+        db.close()
+
+
+def _chunk_count(upload: models.Upload) -> int:
+    return -(-upload.size // upload.chunk_size)
+
+
+def _chunk_length(upload: models.Upload, number: int) -> int:
+    return min(upload.chunk_size, upload.size - number * upload.chunk_size)
+
+
+def _received(db, upload_id: str) -> list:
+    C = models.UploadChunk
+    return list(db.scalars(select(C.number).where(C.upload_id == upload_id).order_by(C.number)))
+
+
+def _contiguous_bytes(upload: models.Upload, received: list) -> int:
+    """Bytes from the start of the file with no gap."""
+    count = 0
+    for number in received:
+        if number != count:
+            break
+        count += 1
+    return min(upload.size, count * upload.chunk_size)
+
+
+def describe(upload: models.Upload, received: list) -> dict:
+    ranges = []
+    for number in received:
+        start = number * upload.chunk_size
+        end = start + _chunk_length(upload, number)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1][1] = end
+        else:
+            ranges.append([start, end])
+    present = set(received)
+    missing = [n for n in range(_chunk_count(upload)) if n not in present]
+    return {
+        "id": upload.id, "session_id": upload.session_id, "type": upload.type, "filename": upload.filename,
+        "size": upload.size, "chunk_size": upload.chunk_size, "chunks": _chunk_count(upload),
+        "status": upload.status, "options": json.loads(upload.options or "{}"),
+        "received_ranges": ranges, "bytes_received": sum(end - start for start, end in ranges),
+        "contiguous_bytes": _contiguous_bytes(upload, received),
+        "missing_chunks": missing[:MISSING_LIST_MAX], "missing_count": len(missing),
+        "streamable": bool(upload.streamable), "job_id": upload.job_id,
+        "created_at": upload.created_at, "updated_at": upload.updated_at,
+    }
+
+
+def create(session_id: str, capture_type: str, filename: str, size: int, chunk_size: int = None, options: dict = None) -> dict:
+    """Start an upload and preallocate its file. Raises ValueError for a bad size."""
+    if not 0 < size <= UPLOAD_MAX_BYTES:
+        raise ValueError(f"Upload size must be between 1 byte and {UPLOAD_MAX_BYTES} bytes")
+    chunk_size = chunk_size or UPLOAD_CHUNK_BYTES
+    if not MIN_CHUNK_BYTES <= chunk_size <= MAX_CHUNK_BYTES:
+        raise ValueError(f"Chunk size must be between {MIN_CHUNK_BYTES} and {MAX_CHUNK_BYTES} bytes")
+
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    upload = models.Upload(
+        id=str(uuid.uuid4()), session_id=session_id, type=capture_type, filename=(filename or "")[:255],
+        size=size, chunk_size=chunk_size, options=json.dumps(options or {}), status=RECEIVING,
+        created_at=_now(), updated_at=_now(),
+    )
+    with open(part_path(upload.id), "wb") as f:
+        f.truncate(size)  # sparse where the filesystem allows
+    db = database.SessionLocal()
+    try:
+        db.add(upload)
+        db.commit()
+        return describe(upload, [])
+    except BaseException:
+        os.unlink(part_path(upload.id))
+        raise
+    finally:
+        db.close()
+
+
+def state(upload_id: str):
+    """The upload as a dict for the API, or None if there is no such upload."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        return describe(upload, _received(db, upload_id)) if upload is not None else None
+    finally:
+        db.close()
+
+
+def chunk_length(upload_id: str, number: int):
+    """Expected byte length of chunk `number`, or None if there is no such upload.
+    Raises ValueError for a chunk number out of range or a finalised upload."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        if upload is None:
+            return None
+        if upload.status != RECEIVING:
+            raise ValueError("Upload is already complete")
+        if not 0 <= number < _chunk_count(upload):
+            raise ValueError(f"Chunk number must be between 0 and {_chunk_count(upload) - 1}")
+        return _chunk_length(upload, number)
+    finally:
+        db.close()
+
+
+def write_chunk(upload_id: str, number: int, data: bytes, sha256: str):
+    """Verify and store one chunk (again, if it was sent before). Returns the
+    upload state, or None if there is no such upload. Raises ValueError for a
+    wrong length or checksum, or a finalised upload."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        if upload is None:
+            return None
+        if upload.status != RECEIVING:
+            raise ValueError("Upload is already complete")
+        if not 0 <= number < _chunk_count(upload):
+            raise ValueError(f"Chunk number must be between 0 and {_chunk_count(upload) - 1}")
+        if len(data) != _chunk_length(upload, number):
+            raise ValueError(f"Chunk {number} must be {_chunk_length(upload, number)} bytes, got {len(data)}")
+        digest = hashlib.sha256(data).hexdigest()
+        if digest != (sha256 or "").strip().lower():
+            raise ValueError(f"Checksum mismatch for chunk {number}")
+
+        try:
+            with open(part_path(upload_id), "r+b") as f:
+                f.seek(number * upload.chunk_size)
+                f.write(data)
+        except FileNotFoundError:
+            raise ValueError("Upload data is gone; start a new upload")
+        if number == 0:
+            upload.suffix = services.detect_video_suffix(data)
+            upload.streamable = int(streamable(data, upload.suffix))
+        db.merge(models.UploadChunk(upload_id=upload_id, number=number, sha256=digest))
+        upload.updated_at = _now()
+        db.commit()
+        return describe(upload, _received(db, upload_id))
+    finally:
+        db.close()
+
+
+def attach_job(upload_id: str, job_id: str, replace: str = None) -> bool:
+    """Record the video job analysing the upload, unless another request already
+    did (or, with `replace`, the upload still points at that earlier job)."""
+    U = models.Upload
+    db = database.SessionLocal()
+    try:
+        attached = db.execute(
+            update(U).where(U.id == upload_id, U.job_id == replace if replace else U.job_id.is_(None)).values(job_id=job_id)
+        ).rowcount
+        db.commit()
+        return bool(attached)
+    finally:
+        db.close()
+
+
+def complete(upload_id: str):
+    """Finalise an upload once every chunk arrived. Returns its state, or None if
+    there is no such upload. Raises ValueError while chunks are missing."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        if upload is None:
+            return None
+        received = _received(db, upload_id)
+        if upload.status == RECEIVING:
+            missing = _chunk_count(upload) - len(received)
+            if missing:
+                raise ValueError(f"{missing} chunk(s) still missing")
+            # A streaming job already reading the part file keeps its open handle
+            os.replace(part_path(upload_id), final_path(upload))
+            upload.status = COMPLETE
+            upload.updated_at = _now()
+            db.commit()
+        return describe(upload, received)
+    finally:
+        db.close()
+
+
+def remove(upload_id: str):
+    """Delete an upload and its file. Returns its video job id (None if it had
+    none), or False if there is no such upload."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        if upload is None:
+            return False
+        job_id = upload.job_id
+        _remove_upload(db, upload)
+        db.commit()
+        return job_id
+    finally:
+        db.close()
+
+
+def _remove_upload(db, upload: models.Upload) -> None:
+    for path in (part_path(upload.id), final_path(upload)):
+        if os.path.exists(path):
+            os.unlink(path)
+    db.execute(delete(models.UploadChunk).where(models.UploadChunk.upload_id == upload.id))
+    db.delete(upload)
+
+
+def expire_stale() -> int:
+    """Remove uploads untouched for UPLOAD_RETENTION_HOURS. Returns how many."""
+    U = models.Upload
+    cutoff = (datetime.now() - timedelta(hours=UPLOAD_RETENTION_HOURS)).isoformat(timespec="microseconds")
+    db = database.SessionLocal()
+    try:
+        stale = db.scalars(select(U).where(U.updated_at < cutoff)).all()
+        for upload in stale:
+            _remove_upload(db, upload)
+        db.commit()
+        return len(stale)
+    finally:
+        db.close()
+
+
+# ─── Streaming a partial upload ──────────────────────────────────────────────────
+class _Feeder(threading.Thread):
+    """Copies the upload's contiguous prefix into a FIFO as chunks arrive."""
+
+    def __init__(self, upload_id: str, fifo: str, final: str):
+        super().__init__(name=f"upload-feed-{upload_id[:8]}", daemon=True)
+        self.upload_id = upload_id
+        self.fifo = fifo
+        self.final = final
+        self.stop = threading.Event()
+        self.error = "The video decoder did not read the upload"
+
+    def _progress(self):
+        """(contiguous bytes available, total size), or None once the upload is gone."""
+        db = database.SessionLocal()
+        try:
+            upload = db.get(models.Upload, self.upload_id)
+            return (_contiguous_bytes(upload, _received(db, self.upload_id)), upload.size) if upload else None
+        finally:
+            db.close()
+
+    def _open_fifo(self):
+        # Non-blocking until the decoder opens its end, so a decoder that never does cannot hang us
+        while not self.stop.is_set():
+            try:
+                fd = os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                self.stop.wait(0.05)
+                continue
+            os.set_blocking(fd, True)
+            return fd
+        return None
+
+    def run(self):
+        fd = self._open_fifo()
+        if fd is None:
+            return
+        self.error = None
+        sent, available, size = 0, 0, None
+        deadline = time.monotonic() + UPLOAD_STALL_SECONDS
+        try:
+            try:
+                source = open(part_path(self.upload_id), "rb")
+            except FileNotFoundError:  # finalised in the meantime
+                source = open(self.final, "rb")
+            with source:
+                while not self.stop.is_set():
+                    progress = self._progress()
+                    if progress is None:
+                        self.error = "Upload was removed"
+                        return
+                    available, size = progress
+                    if sent >= size:
+                        return
+                    if available > sent:
+                        source.seek(sent)
+                        while sent < available:
+                            view = memoryview(source.read(min(1024 * 1024, available - sent)))
+                            while view:
+                                written = os.write(fd, view)
+                                view, sent = view[written:], sent + written
+                        deadline = time.monotonic() + UPLOAD_STALL_SECONDS
+                    elif time.monotonic() > deadline:
+                        self.error = f"Upload stalled for {UPLOAD_STALL_SECONDS:g}s"
+                        return
+                    else:
+                        self.stop.wait(UPLOAD_STREAM_POLL_SECONDS)
+        except BrokenPipeError:
+            # The decoder stopped reading: fine if it had the whole file to read
+            if size is None or available < size:
+                self.error = "The video decoder stopped before the upload was complete"
+        except OSError as e:
+            self.error = f"Could not read the upload: {e}"
+        finally:
+            os.close(fd)
+
+
+@contextlib.contextmanager
+def video_source(upload_id: str, path: str):
+    """The file a video job on upload `upload_id` should analyse: `path` itself
+    once the upload is complete, else a FIFO carrying the upload's prefix as it
+    arrives. If the FIFO could not deliver the whole upload (it stalled or was
+    removed) the exit raises RuntimeError, so the job fails instead of saving
+    the analysis of a truncated video."""
+    db = database.SessionLocal()
+    try:
+        upload = db.get(models.Upload, upload_id)
+        suffix = upload.suffix if upload is not None else None
+        partial = upload is not None and upload.status == RECEIVING
+    finally:
+        db.close()
+    if not partial or not STREAMING:
+        yield path
+        return
+
+    directory = tempfile.mkdtemp(prefix="upload-stream-")
+    fifo = os.path.join(directory, "video" + (suffix or ".mp4"))
+    os.mkfifo(fifo)
+    feeder = _Feeder(upload_id, fifo, path)
+    feeder.start()
+    try:
+        yield fifo
+    finally:
+        feeder.stop.set()
+        feeder.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    if feeder.error:
+        raise RuntimeError(feeder.error)
@@ -0,0 +1,212 @@
+"""
+Multi-process video analysis.
+
+Splits a video into frame ranges, decodes and analyses each range in a pool of
+worker processes and merges the detections back in frame order. Every worker
+imports `services` once, so it loads its own face detector and emotion model
+instead of competing for the API process's models.
+"""
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import threading
+
+import cv2
+
+import tracking
+
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "1"))
+CHUNKS_PER_WORKER = 2  # a few ranges per worker evens out uneven decode cost
+
+_pool = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+
+
+def _init_worker():
+    # One inference thread per process; the pool itself provides the parallelism.
+    cv2.setNumThreads(1)
+    os.environ["FACE_DETECTOR_REPLICAS"] = "1"
+    os.environ["OPENCV_THREADS"] = "1"
+    os.environ["ORT_INTRA_OP_THREADS"] = "1"
+    os.environ["ORT_INTER_OP_THREADS"] = "1"
+    import services  # noqa: F401  (loads the configured face detector + emotion model in this worker)
+
+
+def _batch_results(batch: list, indices: list, tracker, mode: str) -> list:
+    """Analyse and empty a batch of frames; [(frame_index, results), ...] for frames with detections."""
+    import services
+
+    results = [(i, r) for i, r in zip(indices, services._process_frames(batch, tracker, mode)) if r]
+    batch.clear()
+    indices.clear()
+    return results
+
+
+def _analyze_range(video_path: str, start: int, end, policy, mode: str = None) -> list:
+    """Analyse frames [start, end) of a video (end=None reads to EOF) as sampled by `policy`.
+    Returns ([(frame_index, results), ...] for frames with detections, track ids issued).
+    """
+    import services
+
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        return [], 0
+    results = []
+    frame_idx = 0
+    tracker = services.new_face_tracker()
+    sampler = policy.sampler(cap.get(cv2.CAP_PROP_FPS))
+    try:
+        if start:
+            # An adaptive sampler's state comes from the frames before the range:
+            # replay its longest gap of them (thumbnails only) so the range's first
+            # candidates are judged as they would be in one sequential pass
+            warm_up = max(0, start - (sampler.max_gap or sampler.stride)) if sampler.adaptive else start
+            cap.set(cv2.CAP_PROP_POS_FRAMES, warm_up)
+            frame_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            # Some containers only seek to the previous keyframe; decode forward
+            while frame_idx < start and cap.grab():
+                frame_idx += 1
+                if frame_idx > warm_up and sampler.candidate(frame_idx):
+                    ret, frame = cap.retrieve()
+                    if ret:
+                        sampler.warm_up(frame_idx, frame)
+
+        # Same 1-based sampling grid as the sequential path
+        batch, indices = [], []
+        while (end is None or frame_idx < end) and cap.grab():
+            frame_idx += 1
+            if not sampler.candidate(frame_idx):
+                continue
+            ret, frame = cap.retrieve()
+            if not ret or not sampler.analyse(frame_idx, frame):
+                continue
+            batch.append(frame)
+            indices.append(frame_idx)
+            if len(batch) >= services.FACE_DETECT_BATCH:
+                results += _batch_results(batch, indices, tracker, mode)
+        results += _batch_results(batch, indices, tracker, mode)
+    finally:
+        cap.release()
+    return results, tracker.issued
+
+
+def _get_pool(workers: int) -> ProcessPoolExecutor:
+    """Persistent pool so models load once per worker, not once per upload."""
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            # spawn: forked copies of a live OpenCV/ONNX runtime are not safe to use
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn"), initializer=_init_worker)
+            _pool_workers = workers
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def frame_ranges(total_frames: int, parts: int, sample_interval: int) -> list:
+    """Split [0, total_frames) into `parts` ranges aligned to the sampling stride.
+    The last range is open-ended because container frame counts are estimates.
+    """
+    step = max(sample_interval, -(-total_frames // parts))
+    step += (-step) % sample_interval
+    ranges = []
+    start = 0
+    while start < total_frames:
+        ranges.append([start, start + step])
+        start += step
+    if ranges:
+        ranges[-1][1] = None
+    return [tuple(r) for r in ranges]
+
+
+def _box(result) -> tuple:
+    x, y, w, h = result["bbox"]
+    return (x, y, x + w, y + h)
+
+
+def _join_tracks(previous: list, first: list) -> dict:
+    """{track id in `first` -> track id in `previous`} for the faces of a range's
+    first frame with detections that overlap a face of the previous range's last
+    one (greedy IoU, as the tracker matches detections), so a person who stays
+    in view keeps one id across the range boundary."""
+    pairs = sorted(
+        ((tracking.iou(_box(a), _box(b)), a["person_id"], b["person_id"])
+         for a in first if "person_id" in a for b in previous if "person_id" in b),
+        reverse=True,
+    )
+    joined, taken = {}, set()
+    for score, new_id, old_id in pairs:
+        if score < tracking.TRACK_IOU_THRESHOLD:
+            break
+        if new_id in joined or old_id in taken:
+            continue
+        joined[new_id] = old_id
+        taken.add(old_id)
+    return joined
+
+
+def analyze_video_parallel(video_path: str, policy, workers: int = None, mode: str = None, on_progress=None):
+    """Analyse a video file across worker processes, sampling frames by `policy`
+    (a sampling.SamplingPolicy). `on_progress(frames_done, frames_total)` is
+    called as ranges finish; an exception it raises cancels the remaining ranges.
+    Returns the per-frame result lists in frame order, or None when the video
+    cannot be split (unknown frame count) and the caller should go sequential.
+    """
+    workers = workers or VIDEO_WORKERS
+    cap = cv2.VideoCapture(video_path)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) if cap.isOpened() else 0
+    stride = policy.stride(cap.get(cv2.CAP_PROP_FPS)) if cap.isOpened() else 1
+    cap.release()
+    if total_frames <= 0:
+        return None
+
+    ranges = frame_ranges(total_frames, workers * CHUNKS_PER_WORKER, stride)
+    pool = _get_pool(workers)
+    try:
+        futures = {pool.submit(_analyze_range, video_path, start, end, policy, mode): (end or total_frames) - start
+                   for start, end in ranges}
+        if on_progress:
+            done = 0
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    done += futures[future]
+                    on_progress(min(done, total_frames), total_frames)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+        chunks = [f.result() for f in futures]
+    except BrokenProcessPool:
+        print("[Video] Worker pool crashed; falling back to sequential analysis")
+        _reset_pool()
+        return None
+
+    # Ranges are disjoint; keying by frame index guards against a seek that
+    # overshot into the next range. Each range numbers its tracks from 1: tracks
+    # that continue the previous range's last faces take over their ids, the
+    # rest are shifted past every id issued so far to keep person_id unique.
+    merged = {}
+    id_offset = 0
+    previous = []  # last frame with detections so far, in merged ids
+    for chunk, issued in chunks:
+        joined = _join_tracks(previous, chunk[0][1]) if chunk else {}
+        for frame_idx, frame_results in chunk:
+            for r in frame_results:
+                if "person_id" in r:
+                    r["person_id"] = joined.get(r["person_id"], r["person_id"] + id_offset)
+            merged.setdefault(frame_idx, frame_results)
+        if chunk:
+            previous = chunk[-1][1]
+        id_offset += issued
+    return [merged[i] for i in sorted(merged)]
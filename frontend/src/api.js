@@ -4,6 +4,33 @@ import axios from 'axios';
 const api = axios.create({
     baseURL: import.meta.env.VITE_API_URL || 'http://localhost:8000',
     // Do not set default Content-Type; axios sets it automatically (json or multipart)
+    // 304 Not Modified is answered from the validator cache below
+    validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+});
+
+// Conditional GETs: remember each response's ETag and body, send the ETag back
+// as If-None-Match, and turn a 304 into the remembered body so callers still
+// just read res.data.
+const validators = new Map(); // full URL -> { etag, data }
+
+api.interceptors.request.use((config) => {
+    if ((config.method || 'get').toLowerCase() === 'get') {
+        const cached = validators.get(api.getUri(config));
+        if (cached) config.headers['If-None-Match'] = cached.etag;
+    }
+    return config;
+});
+
+api.interceptors.response.use((response) => {
+    const key = api.getUri(response.config);
+    if (response.status === 304) {
+        const cached = validators.get(key);
+        if (cached) return { ...response, status: 200, data: cached.data };
+        return response;
+    }
+    const etag = response.headers.etag;
+    if (etag) validators.set(key, { etag, data: response.data });
+    return response;
 });
 
 export default api;
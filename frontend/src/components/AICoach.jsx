@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import api from '../api';
+import { askCoach } from '../utils/chatStream';
 import { Send, Bot, User, Sparkles } from 'lucide-react';
 
 const AICoach = ({ sessionId }) => {
@@ -45,11 +46,19 @@ const AICoach = ({ sessionId }) => {
     setInput('');
     setLoading(true);
 
+    // The answer streams into one bot message, replaced in place as tokens arrive
+    const replyId = Date.now();
+    const showAnswer = (text) => setMessages(prev => {
+      const reply = { role: 'bot', text, replyId };
+      return prev.some(m => m.replyId === replyId)
+        ? prev.map(m => (m.replyId === replyId ? reply : m))
+        : [...prev, reply];
+    });
+
     try {
-      const res = await api.post(`/sessions/${sessionId}/chat`, { question: userText });
-      setMessages(prev => [...prev, { role: 'bot', text: res.data.response }]);
+      showAnswer(await askCoach(sessionId, userText, showAnswer));
     } catch (err) {
-      setMessages(prev => [...prev, { role: 'bot', text: 'Service unavailable. Please try again.' }]);
+      showAnswer('Service unavailable. Please try again.');
     } finally {
       // BUG FIX: setLoading(false) was outside the try/catch so it ran before
       // the catch branch finished in some JS engines. Moved into finally.
@@ -93,7 +102,7 @@ const AICoach = ({ sessionId }) => {
           </div>
         ))}
 
-        {loading && (
+        {loading && messages[messages.length - 1]?.role === 'user' && (
           <div className="flex gap-5 animate-pulse">
             <div className="w-10 h-10 rounded-full bg-gradient-to-br from-indigo-600 to-violet-600 flex items-center justify-center shrink-0">
               <Bot size={18} className="text-white" />
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import api from '../api';
+import { subscribeReport } from '../utils/liveReport';
 import {
   RadarChart, PolarGrid, PolarAngleAxis, PolarRadiusAxis, Radar,
   AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer
@@ -13,29 +13,23 @@ const Analytics = ({ sessionId }) => {
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    let interval;
-    const fetchData = async () => {
-      try {
-        const res = await api.get(`/sessions/${sessionId}/report`);
-        setData(res.data);
+    return subscribeReport(sessionId, {
+      onData: (report) => {
+        setData(report);
         setError(null);
         setLoading(false);
-      } catch (err) {
-        if (err.response && err.response.status === 404) {
-          console.warn("Session not found (404), stopping analytics poll.");
-          setError("Session not found. Please create a new session.");
-          clearInterval(interval);
-        } else {
-          console.error('Analytics fetch error:', err);
-          setError(err.message);
-        }
+      },
+      onNotFound: () => {
+        console.warn("Session not found (404), stopping analytics updates.");
+        setError("Session not found. Please create a new session.");
         setLoading(false);
-      }
-    };
-
-    fetchData();
-    interval = setInterval(fetchData, 5000);
-    return () => clearInterval(interval);
+      },
+      onError: (err) => {
+        console.error('Analytics fetch error:', err);
+        setError(err.message);
+        setLoading(false);
+      },
+    }, 5000);
   }, [sessionId]);
 
   if (loading) {
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import api from '../api';
+import { subscribeReport } from '../utils/liveReport';
 import {
   BarChart, Bar, XAxis, YAxis, Tooltip, Legend, ResponsiveContainer,
   PieChart, Pie, Cell
@@ -12,19 +12,11 @@ const Dashboard = ({ sessionId, onSessionInvalid }) => {
   const [data, setData] = useState(null);
 
   useEffect(() => {
-    const fetchData = async () => {
-      try {
-        const res = await api.get(`/sessions/${sessionId}/report`);
-        setData(res.data);
-      } catch (err) {
-        if (err.response && err.response.status === 404 && onSessionInvalid) {
-          onSessionInvalid();
-        }
-      }
-    };
-    fetchData();
-    const interval = setInterval(fetchData, 2000);
-    return () => clearInterval(interval);
+    // Pushed on every committed detection; polls every 2s only if streaming fails
+    return subscribeReport(sessionId, {
+      onData: setData,
+      onNotFound: () => onSessionInvalid && onSessionInvalid(),
+    }, 2000);
   }, [sessionId]);
 
   const handleExportPDF = () => {
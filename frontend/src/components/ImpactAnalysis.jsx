@@ -58,10 +58,11 @@ const ImpactAnalysis = ({ sessionId }) => {
       try {
         const [a, b] = await Promise.all([
           api.get(`/sessions/${sessionId}/impact`),
-          api.get('/sessions/impact_trends')
+          // Only the most recent sessions are charted; fetched newest-first, shown oldest-first
+          api.get('/sessions/impact_trends', { params: { order: 'desc', limit: 50 } })
         ]);
         setImpact(a.data);
-        setTrends(b.data);
+        setTrends([...b.data].reverse());
       } catch (e) { console.error(e); }
       finally { setLoading(false); }
     };
@@ -1,36 +1,17 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect } from 'react';
 import MediaCapture from './MediaCapture';
-import api from '../api';
+import { subscribeReport } from '../utils/liveReport';
 import { Activity, Users, Zap, AlertTriangle, LogIn, LogOut } from 'lucide-react';
 
 const LiveSession = ({ sessionId }) => {
   const [data, setData] = useState(null);
-  // ─── BUG FIX #6: isFetchingRef prevents overlapping poll requests ─────────────
-  const isFetchingRef = useRef(false);
 
   useEffect(() => {
-    let interval;
-
-    // ─── BUG FIX #6: renamed from `fetch` to avoid shadowing the global fetch API ─
-    const fetchMetrics = async () => {
-      if (isFetchingRef.current) return; // skip if previous request still in-flight
-      isFetchingRef.current = true;
-      try {
-        const res = await api.get(`/sessions/${sessionId}/report`);
-        setData(res.data);
-      } catch (e) {
-        if (e.response?.status === 404) {
-          console.warn('Session not found, stopping poll.');
-          clearInterval(interval);
-        }
-      } finally {
-        isFetchingRef.current = false;
-      }
-    };
-
-    fetchMetrics();
-    interval = setInterval(fetchMetrics, 5000); // poll every 5s (was 2s — too aggressive)
-    return () => clearInterval(interval);
+    // Server-pushed updates; polls every 5s only if the stream cannot be opened
+    return subscribeReport(sessionId, {
+      onData: setData,
+      onNotFound: () => console.warn('Session not found, stopping updates.'),
+    }, 5000);
   }, [sessionId]);
 
   if (!data) return (
@@ -5,6 +5,8 @@ import {
   Wifi, WifiOff, Maximize, Video, StopCircle,
 } from 'lucide-react';
 import VideoAnalyzer from './VideoAnalyzer';
+import { decodeFrameMessage } from '../utils/frameProtocol';
+import { uploadVideo, RESUMABLE_THRESHOLD } from '../utils/resumableUpload';
 
 const WS_BASE = (import.meta.env.VITE_API_URL || 'http://localhost:8000').replace(/^http/, 'ws');
 
@@ -14,6 +16,7 @@ const MediaCapture = ({ sessionId, type }) => {
   const [uploadResults, setUploadResults] = useState([]);
   const [previewUrl, setPreviewUrl] = useState(null);
   const [previewIsVideo, setPreviewIsVideo] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState(null);
   const [wsConnected, setWsConnected] = useState(false);
   const [faceCount, setFaceCount] = useState(0);
   const [isFullscreen, setIsFullscreen] = useState(false);
@@ -89,11 +92,14 @@ const MediaCapture = ({ sessionId, type }) => {
     let cancelled = false;
     let ws = null;
     let reconnectTimer = null;
+    let frameUrl = null; // object URL of the frame on screen, revoked when replaced
 
     const connect = () => {
       if (cancelled) return;
-      const wsUrl = `${WS_BASE}/ws/webcam/${sessionId}/${type}`;
+      // Binary frames skip base64; text messages are still decoded if the server sends JSON
+      const wsUrl = `${WS_BASE}/ws/webcam/${sessionId}/${type}?protocol=binary`;
       ws = new WebSocket(wsUrl);
+      ws.binaryType = 'arraybuffer';
       wsRef.current = ws;
 
       ws.onopen = () => {
@@ -104,8 +110,8 @@ const MediaCapture = ({ sessionId, type }) => {
       ws.onmessage = (event) => {
         if (cancelled) return;
         try {
-          const data = JSON.parse(event.data);
-          if (data.frame && imgRef.current) {
+          const data = decodeFrameMessage(event.data);
+          if (data.src && imgRef.current) {
             const img = imgRef.current;
             
             // Draw boxes after the image has loaded to ensure correct naturalWidth/Height
@@ -123,14 +129,18 @@ const MediaCapture = ({ sessionId, type }) => {
             };
 
             img.onload = onFrameLoad;
-            img.src = `data:image/jpeg;base64,${data.frame}`;
+            img.src = data.src;
+            if (frameUrl) URL.revokeObjectURL(frameUrl);
+            frameUrl = data.objectUrl ? data.src : null;
             
             // Immediate fallback if already loaded or data URI processed synchronously
             if (img.complete && img.naturalWidth > 0) {
               onFrameLoad();
             }
+          } else if (data.objectUrl) {
+            URL.revokeObjectURL(data.src);
           }
-          setFaceCount(data.face_count || 0);
+          setFaceCount(data.face_count);
         } catch (err) {
           console.error('[WS] Parse error:', err);
         }
@@ -154,6 +164,7 @@ const MediaCapture = ({ sessionId, type }) => {
         if (ws.readyState === WebSocket.OPEN) ws.send('stop');
         ws.close();
       }
+      if (frameUrl) URL.revokeObjectURL(frameUrl);
       wsRef.current = null;
       setWsConnected(false);
     };
@@ -205,12 +216,27 @@ const MediaCapture = ({ sessionId, type }) => {
     if (previewUrl) URL.revokeObjectURL(previewUrl);
     setPreviewUrl(null);
     setUploadResults([]);
+    setUploadProgress(null);
     setStatus('uploading');
 
     const isVideo = file.type.startsWith('video/');
     setPreviewUrl(URL.createObjectURL(file));
     setPreviewIsVideo(isVideo);
 
+    // Large recordings go up in resumable chunks and are analysed as a background job
+    if (isVideo && file.size > RESUMABLE_THRESHOLD && window.crypto?.subtle) {
+      try {
+        await uploadVideo(sessionId, file, type, {}, setUploadProgress);
+        setStatus('success');
+        setTimeout(() => setStatus(null), 3000);
+      } catch {
+        setStatus('error');
+      } finally {
+        setUploadProgress(null);
+      }
+      return;
+    }
+
     const formData = new FormData();
     formData.append('file', file);
     formData.append('type', type);
@@ -358,7 +384,10 @@ const MediaCapture = ({ sessionId, type }) => {
               {previewIsVideo || status === 'uploading' ? (
                 <div className="flex flex-col items-center gap-4">
                   <RefreshCw className="animate-spin text-indigo-500" size={40} />
-                  <span className="text-sm font-bold text-white tracking-widest uppercase">Processing Media...</span>
+                  <span className="text-sm font-bold text-white tracking-widest uppercase">
+                    {uploadProgress?.stage === 'upload' ? 'Uploading' : 'Processing Media'}
+                    {uploadProgress?.total ? ` ${Math.round((100 * uploadProgress.loaded) / uploadProgress.total)}%` : '...'}
+                  </span>
                 </div>
               ) : (
                 <>
@@ -2,19 +2,27 @@ import React, { useState, useEffect } from 'react';
 import api from '../api';
 import { Calendar, Users, Zap, Search, FileText, ArrowUpRight, LogIn, LogOut } from 'lucide-react';
 
+const PAGE_SIZE = 50;
+
 const SessionHistory = ({ onRestore }) => {
   const [history, setHistory] = useState([]);
+  const [total, setTotal] = useState(0);
   const [loading, setLoading] = useState(true);
   const [searchTerm, setSearchTerm] = useState('');
 
+  // Sorting, searching and paging happen server-side so large archives stay fast
   useEffect(() => {
-    fetchHistory();
-  }, []);
+    const timer = setTimeout(() => fetchHistory(0), searchTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm]);
 
-  const fetchHistory = async () => {
+  const fetchHistory = async (offset) => {
     try {
-      const res = await api.get('/sessions/history');
-      setHistory(res.data);
+      const res = await api.get('/sessions/history', {
+        params: { limit: PAGE_SIZE, offset, search: searchTerm || undefined }
+      });
+      setHistory(prev => offset === 0 ? res.data : [...prev, ...res.data]);
+      setTotal(Number(res.headers['x-total-count'] ?? res.data.length));
     } catch (err) {
       console.error("Failed to fetch history");
     } finally {
@@ -22,11 +30,6 @@ const SessionHistory = ({ onRestore }) => {
     }
   };
 
-  const filteredHistory = history.filter(session =>
-    session.class_name.toLowerCase().includes(searchTerm.toLowerCase()) ||
-    session.instructor.toLowerCase().includes(searchTerm.toLowerCase())
-  );
-
   const formatDate = (isoString) => {
     return new Date(isoString).toLocaleDateString('en-US', {
       month: 'short', day: 'numeric', hour: '2-digit', minute: '2-digit'
@@ -66,12 +69,12 @@ const SessionHistory = ({ onRestore }) => {
             </tr>
           </thead>
           <tbody className="divide-y divide-slate-100">
-            {filteredHistory.length === 0 ? (
+            {history.length === 0 ? (
               <tr>
                 <td colSpan="7" className="p-10 text-center text-slate-400 text-sm italic">No session records found matching your criteria.</td>
               </tr>
             ) : (
-              filteredHistory.map((session) => (
+              history.map((session) => (
                 <tr key={session.id} className="hover:bg-indigo-50/30 transition-colors group">
                   <td className="p-5">
                     <div className="font-bold text-slate-900 text-base">{session.class_name}</div>
@@ -126,6 +129,14 @@ const SessionHistory = ({ onRestore }) => {
           </tbody>
         </table>
       </div>
+
+      {history.length < total && (
+        <div className="flex justify-center">
+          <button onClick={() => fetchHistory(history.length)} className="btn-ghost text-xs">
+            Load more ({total - history.length} remaining)
+          </button>
+        </div>
+      )}
     </div>
   );
 };
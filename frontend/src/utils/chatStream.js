@@ -0,0 +1,63 @@
+/**
+ * AI coach answers, streamed
+ * POSTs the question to /sessions/{id}/chat/stream and reads the server-sent
+ * "token" events as they arrive (EventSource cannot POST, so this parses the
+ * fetch body) until the final "done" or "error" event. Falls back to the plain
+ * /chat endpoint when the response body cannot be streamed.
+ */
+import api from '../api';
+import { API_URL } from '../config';
+
+function parseEvent(block) {
+  let event = 'message';
+  const data = [];
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+  }
+  return data.length ? { event, data: JSON.parse(data.join('\n')) } : null;
+}
+
+/**
+ * Ask the coach a question
+ * @param {string} sessionId
+ * @param {string} question
+ * @param {(text: string) => void} onToken - called with the answer so far
+ * @returns {Promise<string>} the full answer
+ */
+export async function askCoach(sessionId, question, onToken) {
+  const res = await fetch(`${API_URL}/sessions/${sessionId}/chat/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ question }),
+  });
+  if (!res.ok) throw new Error(`Chat failed with status ${res.status}`);
+  if (!res.body?.getReader) {
+    const fallback = await api.post(`/sessions/${sessionId}/chat`, { question });
+    return fallback.data.response;
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  let answer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let boundary;
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const parsed = parseEvent(buffer.slice(0, boundary));
+      buffer = buffer.slice(boundary + 2);
+      if (!parsed) continue;
+      if (parsed.event === 'token') {
+        answer += parsed.data.text;
+        onToken?.(answer);
+      } else if (parsed.event === 'done' || parsed.event === 'error') {
+        // An error event carries the partial answer followed by the error message
+        return parsed.data.response;
+      }
+    }
+  }
+  return answer;
+}
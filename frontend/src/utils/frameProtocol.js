@@ -0,0 +1,45 @@
+/**
+ * Webcam WebSocket frame decoding
+ * Mirrors backend/broadcast.py: binary messages carry the raw JPEG,
+ * text messages are the JSON fallback with a base64 frame.
+ */
+
+const BINARY_VERSION = 1;
+const HEADER_SIZE = 5; // 1-byte version + 4-byte big-endian sidecar length
+const textDecoder = new TextDecoder();
+
+/**
+ * Decode one WebSocket message into a displayable frame
+ * @param {ArrayBuffer|string} message - event.data (set ws.binaryType = 'arraybuffer')
+ * @returns {{src: string|null, objectUrl: boolean, results: Array, face_count: number, timestamp: string}}
+ */
+export function decodeFrameMessage(message) {
+  if (typeof message === 'string') {
+    const data = JSON.parse(message);
+    return {
+      src: data.frame ? `data:image/jpeg;base64,${data.frame}` : null,
+      objectUrl: false,
+      results: data.results || [],
+      face_count: data.face_count || 0,
+      timestamp: data.timestamp,
+    };
+  }
+
+  const view = new DataView(message);
+  const version = view.getUint8(0);
+  if (version !== BINARY_VERSION) {
+    throw new Error(`Unsupported frame protocol version ${version}`);
+  }
+  const sidecarLength = view.getUint32(1);
+  const sidecar = JSON.parse(
+    textDecoder.decode(new Uint8Array(message, HEADER_SIZE, sidecarLength)),
+  );
+  const jpeg = new Blob([new Uint8Array(message, HEADER_SIZE + sidecarLength)], { type: 'image/jpeg' });
+  return {
+    src: URL.createObjectURL(jpeg),
+    objectUrl: true,
+    results: sidecar.results || [],
+    face_count: sidecar.face_count || 0,
+    timestamp: sidecar.timestamp,
+  };
+}
@@ -0,0 +1,101 @@
+/**
+ * Live session report
+ * Subscribes to the backend's server-sent /sessions/{id}/stream (see backend/live.py):
+ * a "snapshot" event with the full /report payload, then "delta" events with
+ * only the changed fields. Components in one tab share a single stream per
+ * session. If the stream cannot be opened the subscription falls back to
+ * polling /report.
+ */
+import api from '../api';
+import { API_URL } from '../config';
+
+const channels = new Map(); // sessionId -> channel
+
+function merge(base, delta) {
+  const merged = { ...base };
+  for (const [key, value] of Object.entries(delta)) {
+    const current = merged[key];
+    merged[key] = value && typeof value === 'object' && !Array.isArray(value) && current && typeof current === 'object'
+      ? merge(current, value)
+      : value;
+  }
+  return merged;
+}
+
+function openChannel(sessionId, pollMs) {
+  const channel = { listeners: new Set(), data: null, source: null, poll: null, pollMs };
+
+  const publish = (data) => {
+    channel.data = data;
+    channel.listeners.forEach((listener) => listener.onData?.(data));
+  };
+
+  const startPolling = () => {
+    if (channel.poll) return;
+    let inFlight = false;
+    const fetchReport = async () => {
+      if (inFlight) return;
+      inFlight = true;
+      try {
+        const res = await api.get(`/sessions/${sessionId}/report`);
+        publish(res.data);
+      } catch (err) {
+        if (err.response?.status === 404) {
+          clearInterval(channel.poll);
+          channel.listeners.forEach((listener) => listener.onNotFound?.());
+        } else {
+          channel.listeners.forEach((listener) => listener.onError?.(err));
+        }
+      } finally {
+        inFlight = false;
+      }
+    };
+    fetchReport();
+    channel.poll = setInterval(fetchReport, channel.pollMs);
+  };
+
+  if (typeof EventSource === 'undefined') {
+    startPolling();
+  } else {
+    const source = new EventSource(`${API_URL}/sessions/${sessionId}/stream`);
+    channel.source = source;
+    source.addEventListener('snapshot', (event) => publish(JSON.parse(event.data)));
+    source.addEventListener('delta', (event) => {
+      if (channel.data) publish(merge(channel.data, JSON.parse(event.data)));
+    });
+    source.onerror = () => {
+      // CONNECTING means the browser is retrying on its own; CLOSED means give up
+      if (source.readyState === EventSource.CLOSED) {
+        channel.source = null;
+        startPolling();
+      }
+    };
+  }
+  return channel;
+}
+
+/**
+ * Receive live /report data for a session
+ * @param {string} sessionId
+ * @param {{onData?: Function, onNotFound?: Function, onError?: Function}} listener
+ * @param {number} pollMs - polling interval used only when streaming is unavailable
+ * @returns {Function} unsubscribe
+ */
+export function subscribeReport(sessionId, listener, pollMs = 5000) {
+  let channel = channels.get(sessionId);
+  if (!channel) {
+    channel = openChannel(sessionId, pollMs);
+    channels.set(sessionId, channel);
+  }
+  channel.listeners.add(listener);
+  if (channel.data) listener.onData?.(channel.data);
+
+  return () => {
+    channel.listeners.delete(listener);
+    if (channel.listeners.size === 0) {
+      channel.source?.close();
+      clearInterval(channel.poll);
+      channels.delete(sessionId);
+    }
+  };
+}
@@ -0,0 +1,113 @@
+/**
+ * Resumable video uploads
+ * Sends a large recording to the backend's chunked upload API (see
+ * backend/uploads.py): each chunk is PUT with its SHA-256 and retried on
+ * failure, and an upload interrupted by a reload or a dropped connection
+ * resumes with only the chunks the server is missing. The backend starts
+ * analysing as soon as it can (with the first chunk for streamable
+ * containers); the returned promise resolves when the video job finishes.
+ */
+import api from '../api';
+
+export const RESUMABLE_THRESHOLD = 64 * 1024 * 1024; // files above this use chunked uploads
+
+const PARALLEL_CHUNKS = 3;
+const MAX_RETRIES = 5;
+const JOB_POLL_MS = 2000;
+const FINISHED = ['done', 'failed', 'cancelled'];
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+function storageKey(sessionId, file) {
+  return `upload:${sessionId}:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function sha256(blob) {
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function withRetry(request) {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await request();
+    } catch (err) {
+      // 4xx other than a timeout will not get better by retrying
+      const status = err.response?.status;
+      if (attempt >= MAX_RETRIES || (status >= 400 && status < 500 && status !== 408)) throw err;
+      await sleep(Math.min(30000, 500 * 2 ** attempt));
+    }
+  }
+}
+
+// The status lists at most 1000 missing chunks; past that, derive them from the received ranges
+function missingChunks(upload) {
+  if (upload.missing_chunks.length === upload.missing_count) return [...upload.missing_chunks];
+  const received = (n) => upload.received_ranges.some(
+    ([start, end]) => start <= n * upload.chunk_size && Math.min(upload.size, (n + 1) * upload.chunk_size) <= end);
+  return Array.from({ length: upload.chunks }, (_, n) => n).filter((n) => !received(n));
+}
+
+async function resumeOrStart(sessionId, file, type, options, key) {
+  const saved = localStorage.getItem(key);
+  if (saved) {
+    try {
+      const res = await api.get(`/uploads/${saved}`);
+      if (res.data.status === 'receiving') return res.data;
+    } catch {
+      // expired or removed: start over
+    }
+    localStorage.removeItem(key);
+  }
+  const res = await api.post(`/sessions/${sessionId}/uploads`, {
+    type, filename: file.name, size: file.size, ...options,
+  });
+  localStorage.setItem(key, res.data.id);
+  return res.data;
+}
+
+/**
+ * Upload a video and wait for its analysis
+ * @param {string} sessionId
+ * @param {File} file
+ * @param {string} type - capture type ("entry" / "exit")
+ * @param {object} [options] - job options: kind, mode, sample_policy, sample_fps, priority
+ * @param {(progress: {stage: string, loaded: number, total: number}) => void} [onProgress]
+ *   stage "upload" counts bytes sent, stage "analysis" frames analysed
+ * @returns {Promise<object>} the finished video job
+ */
+export async function uploadVideo(sessionId, file, type, options = {}, onProgress) {
+  const key = storageKey(sessionId, file);
+  const upload = await resumeOrStart(sessionId, file, type, options, key);
+  const missing = upload.status === 'receiving' ? missingChunks(upload) : [];
+
+  let loaded = upload.bytes_received;
+  onProgress?.({ stage: 'upload', loaded, total: file.size });
+  const sendChunk = async (number) => {
+    const blob = file.slice(number * upload.chunk_size, (number + 1) * upload.chunk_size);
+    const checksum = await sha256(blob);
+    await withRetry(() => api.put(`/uploads/${upload.id}/chunks/${number}`, blob, {
+      headers: { 'Content-Type': 'application/octet-stream', 'X-Chunk-SHA256': checksum },
+    }));
+    loaded += blob.size;
+    onProgress?.({ stage: 'upload', loaded, total: file.size });
+  };
+  // Chunk 0 first: it lets the server start analysing a streamable video
+  const queue = missing.filter((n) => n !== 0);
+  if (missing.includes(0)) await sendChunk(0);
+  await Promise.all(Array.from({ length: PARALLEL_CHUNKS }, async () => {
+    while (queue.length) await sendChunk(queue.shift());
+  }));
+
+  const completed = await withRetry(() => api.post(`/uploads/${upload.id}/complete`));
+  localStorage.removeItem(key);
+
+  let job = completed.data.job;
+  while (!FINISHED.includes(job.status)) {
+    onProgress?.({ stage: 'analysis', loaded: job.progress.frames_done, total: job.progress.frames_total });
+    await sleep(JOB_POLL_MS);
+    job = (await withRetry(() => api.get(`/video_jobs/${job.id}`))).data;
+  }
+  if (job.status !== 'done') throw new Error(job.error || `Video job ${job.status}`);
+  return job;
+}